@@ -0,0 +1,294 @@
+"""In-process stand-in for the parts of Telegram the bot talks to
+
+``FakeTelegram`` plays the server: it hands out message ids, keeps the
+files users "sent", and simulates every request: a latency before each
+call, a per-connection bandwidth for transfers, and Telegram's per-chat
+edit limit, enforced with FloodWait the way Pyrogram surfaces it (short
+waits slept through, long ones raised). ``FakeClient`` is what the bot's
+``app`` and transfer sessions become, with the calls the bot makes:
+``get_messages``, ``stream_media``, ``resolve_peer``, ``rnd_id``, and
+``invoke`` for file parts and SendMedia. ``FakeMessage`` and
+``FakeCallbackQuery`` carry the attributes and methods the handlers use.
+
+Only the bot's own handler and processing code runs for real, with ffmpeg.
+"""
+import os
+import time
+import random
+import asyncio
+from collections import defaultdict, deque
+from typing import Dict, List, Optional
+from pyrogram.errors import FloodWait, MessageNotModified
+from utils.keyboard import Keyboard
+
+
+class FakeTelegram:
+    """Shared server state and the network model"""
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        jitter: float = 0.02,
+        bandwidth: float = 10 * 1024 * 1024,
+        edits_per_minute: int = 20,
+        flood_probability: float = 0.0,
+        flood_wait: int = 5,
+        seed: Optional[int] = None
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth  # bytes per second per request
+        self.edits_per_minute = edits_per_minute
+        self.flood_probability = flood_probability  # chance a transfer request flood-waits
+        self.flood_wait = flood_wait
+        self.sleep_threshold = 10  # Pyrogram's default for the bot's own client
+        self.random = random.Random(seed)
+        self.files: Dict[str, str] = {}
+        self.messages: Dict[tuple, 'FakeMessage'] = {}
+        self.edits: Dict[int, deque] = defaultdict(deque)
+        self.next_id = 0
+        self.stats = defaultdict(int)
+
+    def message_id(self) -> int:
+        self.next_id += 1
+        return self.next_id
+
+    async def delay(self, size: int = 0):
+        """Round trip of one request, plus the time to move ``size`` bytes"""
+        seconds = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+        if size and self.bandwidth:
+            seconds += size / self.bandwidth
+        await asyncio.sleep(seconds)
+
+    def maybe_flood(self):
+        if self.flood_probability and self.random.random() < self.flood_probability:
+            self.stats['transfer_flood_waits'] += 1
+            raise FloodWait(value=self.flood_wait)
+
+    def edit_wait(self, chat_id: int) -> float:
+        """Seconds until the chat may be edited again, recording the edit if now"""
+        window = self.edits[chat_id]
+        now = time.monotonic()
+        while window and now - window[0] >= 60:
+            window.popleft()
+        if len(window) >= self.edits_per_minute:
+            return 60 - (now - window[0])
+        window.append(now)
+        return 0.0
+
+    def client(self, sleep_threshold: Optional[int] = None) -> 'FakeClient':
+        if sleep_threshold is None:
+            sleep_threshold = self.sleep_threshold
+        return FakeClient(self, sleep_threshold)
+
+    def attach(self, bot, sessions: int = 1):
+        """Point a VideoBot at this server instead of Telegram"""
+        control = self.client()
+        clients = [control] + [self.client(sleep_threshold=0) for _ in range(sessions - 1)]
+        bot.app = control
+        pool = bot.transfer_pool
+        pool.control = control
+        pool.clients = clients
+        pool.load = [0] * len(clients)
+        pool.throttled_until = [0.0] * len(clients)
+
+        # SendMedia answers with the fake message, not raw updates
+        async def parse_sent(result):
+            return result
+        bot.uploader.parse_sent = parse_sent
+        return control
+
+    def user_message(
+        self,
+        user_id: int,
+        path: str,
+        file_name: Optional[str] = None,
+        media_group_id: Optional[str] = None,
+        as_document: bool = False
+    ) -> 'FakeMessage':
+        """A message a user sent with a video (or a video file as a document)"""
+        file_id = f"file_{len(self.files)}"
+        self.files[file_id] = path
+        media = FakeMedia(file_id, file_name or os.path.basename(path), os.path.getsize(path))
+        message = FakeMessage(
+            self,
+            chat_id=user_id,
+            user_id=user_id,
+            video=None if as_document else media,
+            document=media if as_document else None,
+            media_group_id=media_group_id
+        )
+        return message
+
+
+class FakeClient:
+    """The Pyrogram Client calls the bot makes"""
+
+    def __init__(self, server: FakeTelegram, sleep_threshold: int = 10):
+        self.server = server
+        self.sleep_threshold = sleep_threshold
+        self.is_connected = True
+
+    async def start(self):
+        return self
+
+    async def stop(self):
+        self.is_connected = False
+
+    def rnd_id(self) -> int:
+        return self.server.random.getrandbits(63)
+
+    async def resolve_peer(self, chat_id: int):
+        await self.server.delay()
+        return chat_id
+
+    async def get_messages(self, chat_id: int, message_id: int) -> 'FakeMessage':
+        await self.server.delay()
+        self.server.stats['requests'] += 1
+        return self.server.messages[(chat_id, message_id)]
+
+    async def stream_media(self, message: 'FakeMessage', limit: int = 0, offset: int = 0):
+        """Yield the file in 1 MiB chunks, one request per chunk like GetFile"""
+        media = message.video or message.document
+        chunk_size = 1024 * 1024
+        with open(self.server.files[media.file_id], 'rb') as f:
+            f.seek(offset * chunk_size)
+            sent = 0
+            while not limit or sent < limit:
+                self.server.maybe_flood()
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                await self.server.delay(len(chunk))
+                self.server.stats['requests'] += 1
+                self.server.stats['bytes_down'] += len(chunk)
+                sent += 1
+                yield chunk
+
+    async def invoke(self, request):
+        kind = type(request).__name__
+        self.server.stats['requests'] += 1
+        if kind in ('SaveFilePart', 'SaveBigFilePart'):
+            self.server.maybe_flood()
+            await self.server.delay(len(request.bytes))
+            self.server.stats['bytes_up'] += len(request.bytes)
+            self.server.stats['parts_up'] += 1
+            return True
+        if kind == 'SendMedia':
+            await self.server.delay()
+            self.server.stats['media_sent'] += 1
+            return FakeMessage(
+                self.server, chat_id=request.peer, text=request.message, reply_to=request.reply_to_msg_id
+            )
+        raise NotImplementedError(f"{kind} is not emulated")
+
+
+class FakeUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.first_name = f"user{user_id}"
+
+
+class FakeChat:
+    def __init__(self, chat_id: int):
+        self.id = chat_id
+
+
+class FakeMedia:
+    def __init__(self, file_id: str, file_name: str, file_size: int):
+        self.file_id = file_id
+        self.file_name = file_name
+        self.file_size = file_size
+
+
+class FakeMessage:
+    """A message in a private chat, from a user or from the bot"""
+
+    def __init__(
+        self,
+        server: FakeTelegram,
+        chat_id: int,
+        user_id: Optional[int] = None,
+        text: str = "",
+        reply_markup=None,
+        video: Optional[FakeMedia] = None,
+        document: Optional[FakeMedia] = None,
+        media_group_id: Optional[str] = None,
+        reply_to: Optional[int] = None
+    ):
+        self.server = server
+        self.id = server.message_id()
+        self.chat = FakeChat(chat_id)
+        self.from_user = FakeUser(user_id) if user_id else None
+        self.text = text
+        self.reply_markup = reply_markup
+        self.video = video
+        self.document = document
+        self.media_group_id = media_group_id
+        self.reply_to_message_id = reply_to
+        self.replies: List['FakeMessage'] = []
+        self.deleted = False
+        server.messages[(chat_id, self.id)] = self
+
+    async def reply_text(self, text: str, reply_markup=None, **kwargs) -> 'FakeMessage':
+        await self.server.delay()
+        self.server.stats['requests'] += 1
+        self.server.stats['messages_sent'] += 1
+        reply = FakeMessage(self.server, self.chat.id, text=text, reply_markup=reply_markup, reply_to=self.id)
+        self.replies.append(reply)
+        return reply
+
+    async def edit_text(self, text: str, reply_markup=None, **kwargs) -> 'FakeMessage':
+        if text == self.text and reply_markup is self.reply_markup:
+            raise MessageNotModified()
+
+        # Like Pyrogram: short FloodWaits are slept through, long ones raised
+        while True:
+            wait = self.server.edit_wait(self.chat.id)
+            if not wait:
+                break
+            self.server.stats['edit_flood_waits'] += 1
+            if wait > self.server.sleep_threshold:
+                raise FloodWait(value=int(wait) + 1)
+            await asyncio.sleep(wait)
+
+        await self.server.delay()
+        self.server.stats['requests'] += 1
+        self.server.stats['edits'] += 1
+        self.text = text
+        self.reply_markup = reply_markup
+        return self
+
+    async def delete(self):
+        await self.server.delay()
+        self.server.stats['requests'] += 1
+        self.deleted = True
+
+    def button(self, action: str) -> Optional[str]:
+        """Callback data of the button for an action, if it is on the keyboard"""
+        if self.reply_markup is None:
+            return None
+        for row in self.reply_markup.inline_keyboard:
+            for button in row:
+                data = getattr(button, 'callback_data', None)
+                if data and Keyboard.unpack(data)[0] == action:
+                    return data
+        return None
+
+
+class FakeCallbackQuery:
+    """A button press on one of the bot's messages"""
+
+    def __init__(self, server: FakeTelegram, user_id: int, message: FakeMessage, data: str):
+        self.server = server
+        self.id = str(server.message_id())
+        self.from_user = FakeUser(user_id)
+        self.message = message
+        self.data = data
+        self.answers: List[str] = []
+
+    async def answer(self, text: str = "", show_alert: bool = False, **kwargs):
+        await self.server.delay()
+        self.server.stats['requests'] += 1
+        self.answers.append(text)
+        return True
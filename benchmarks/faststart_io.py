@@ -0,0 +1,114 @@
+"""Measure the disk writes each output finalization mode costs per job
+
+A synthetic clip is encoded once, then remuxed into MP4 with every
+OUTPUT_FINALIZATION mode. The bytes ffmpeg wrote come from this process's
+/proc/self/io, which includes the I/O of reaped children, so the rewrite
+``+faststart`` does after the encode shows up as extra writes.
+
+Usage: python -m benchmarks.faststart_io [--duration 600] [--resolution 720p]
+"""
+import os
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+from typing import Dict
+from config import Config
+from processors.operation_graph import GraphCompiler
+
+MODES = ['faststart', 'moov_reserve', 'fragmented', None]
+
+
+def read_io() -> Dict[str, int]:
+    """Write counters of this process and its reaped children"""
+    counters = {}
+    with open("/proc/self/io") as f:
+        for line in f:
+            key, value = line.split(":")
+            counters[key] = int(value)
+    return counters
+
+
+def make_source(path: str, duration: int, resolution: str):
+    """Encode a test pattern with audio, fast enough to not dominate the run"""
+    size = Config.RESOLUTION_PRESETS[resolution]
+    subprocess.run([
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size={size['width']}x{size['height']}:rate=30",
+        "-f", "lavfi", "-i", "sine=frequency=440:sample_rate=48000",
+        "-t", str(duration),
+        "-c:v", "libx264", "-preset", "ultrafast", "-g", "60",
+        "-c:a", "aac",
+        "-y", path
+    ], check=True)
+
+
+def probe(path: str) -> Dict:
+    result = subprocess.run(
+        ["ffprobe", "-v", "quiet", "-print_format", "json", "-show_format", "-show_streams", path],
+        check=True,
+        capture_output=True
+    )
+    return json.loads(result.stdout)
+
+
+def remux(compiler: GraphCompiler, source: str, output: str, probe_data: Dict) -> Dict:
+    """Copy the streams into MP4 with the configured finalization"""
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-i", source, "-map", "0", "-c", "copy",
+        *compiler.finalize_args(output, probe_data),
+        "-y", output
+    ]
+    before = read_io()
+    started = time.monotonic()
+    subprocess.run(cmd, check=True)
+    elapsed = time.monotonic() - started
+    after = read_io()
+    return {
+        'args': " ".join(compiler.finalize_args(output, probe_data)) or "-",
+        'seconds': elapsed,
+        'written': after['wchar'] - before['wchar'],
+        'disk': after['write_bytes'] - before['write_bytes'],
+        'size': os.path.getsize(output)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=int, default=600, help="clip length in seconds")
+    parser.add_argument("--resolution", default="720p", choices=Config.RESOLUTION_PRESETS)
+    args = parser.parse_args()
+
+    compiler = GraphCompiler()
+    with tempfile.TemporaryDirectory(dir=Config.TEMP_DIR if Config.TEMP_DIR.exists() else None) as tmp:
+        source = os.path.join(tmp, "source.mkv")
+        make_source(source, args.duration, args.resolution)
+        probe_data = probe(source)
+
+        results = {}
+        for mode in MODES:
+            compiler.config.OUTPUT_FINALIZATION = mode
+            output = os.path.join(tmp, f"{mode}.mp4")
+            results[mode] = remux(compiler, source, output, probe_data)
+            os.remove(output)
+
+    baseline = results['faststart']['written']
+    mb = 1024 * 1024
+    print(f"{args.duration}s {args.resolution} clip\n")
+    print(f"{'mode':<14}{'written MB':>12}{'disk MB':>10}{'output MB':>11}{'time s':>8}{'saved MB':>10}  args")
+    for mode, result in results.items():
+        print(
+            f"{str(mode):<14}"
+            f"{result['written'] / mb:>12.1f}"
+            f"{result['disk'] / mb:>10.1f}"
+            f"{result['size'] / mb:>11.1f}"
+            f"{result['seconds']:>8.2f}"
+            f"{(baseline - result['written']) / mb:>10.1f}"
+            f"  {result['args']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""Drive the whole bot with simulated users against a fake Telegram
+
+Thousands of users arrive over a ramp-up period. Each sends a synthetic
+video (or an album) and presses buttons with some think time in between,
+following one of these scenarios:
+
+- browse: mediainfo and the menus, then cancel
+- compress: a full 480p compression with download, encode and upload
+- album: a three-file media group run as a batch
+
+Handlers are called exactly as Pyrogram's dispatcher would call them. Only
+the network is fake (see ``benchmarks.fake_telegram``): ffmpeg, the
+scheduler, sessions, downloads and uploads all run for real.
+
+The report has handler latency percentiles per action, throughput, and
+Telegram request counts (edits, FloodWaits, bytes). It also shows resource
+use: CPU of the bot and its ffmpeg children, peak RSS, event loop lag and
+peak temp-dir usage.
+
+Usage: python -m benchmarks.load_driver [--users 1000] [--ramp 60]
+       [--mix browse=0.8,compress=0.15,album=0.05] [--json report.json]
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import logging
+import resource
+import statistics
+import tempfile
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+# Config reads these at import; the fake server never checks them
+os.environ.setdefault('API_ID', '1')
+os.environ.setdefault('API_HASH', 'load-test')
+os.environ.setdefault('BOT_TOKEN', '1:load-test')
+
+from config import Config
+from benchmarks.fake_telegram import FakeTelegram, FakeCallbackQuery, FakeMessage
+from benchmarks.suite import make_source
+
+SCENARIOS = ['browse', 'compress', 'album']
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class LoadDriver:
+    def __init__(self, bot, server: FakeTelegram, source: str, args):
+        self.bot = bot
+        self.server = server
+        self.source = source
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.completed: Dict[str, int] = defaultdict(int)
+        self.loop_lag: List[float] = []
+        self.peak_temp = 0
+        self.peak_rss = 0
+
+    async def timed(self, action: str, coro):
+        started = time.perf_counter()
+        try:
+            return await coro
+        except Exception as e:
+            self.errors[f"{action}: {type(e).__name__}"] += 1
+        finally:
+            self.latencies[action].append(time.perf_counter() - started)
+
+    async def think(self):
+        await asyncio.sleep(self.random.expovariate(1 / self.args.think) if self.args.think else 0)
+
+    async def send(self, user_id: int) -> Optional[FakeMessage]:
+        """Send the video and return the bot's menu message"""
+        message = self.server.user_message(user_id, self.source, f"clip_{user_id}.mp4")
+        await self.timed("send_video", self.bot.handle_video_message(message))
+        return message.replies[-1] if message.replies else None
+
+    async def press(self, user_id: int, menu: FakeMessage, action: str, handler=None) -> bool:
+        """Press the button for an action on the bot's message"""
+        data = menu.button(action)
+        if data is None:
+            self.errors[f"{action}: button missing"] += 1
+            return False
+        await self.think()
+        callback = FakeCallbackQuery(self.server, user_id, menu, data)
+        handler = handler or self.bot.handle_callback_query
+        await self.timed(action, handler(callback))
+        return True
+
+    async def browse(self, user_id: int):
+        menu = await self.send(user_id)
+        if menu is None:
+            return
+        for action in ["mediainfo", "main_menu", "compress_menu", "compress_res_480p", "main_menu"]:
+            if not await self.press(user_id, menu, action):
+                return
+        await self.press(user_id, menu, "cancel")
+        self.completed['browse'] += 1
+
+    async def compress(self, user_id: int):
+        menu = await self.send(user_id)
+        if menu is None:
+            return
+        for action in ["compress_menu", "compress_res_480p", "compress_quality_low", "compress_start"]:
+            if not await self.press(user_id, menu, action):
+                return
+        if menu.text.startswith("✅"):
+            self.completed['compress'] += 1
+
+    async def album(self, user_id: int):
+        group_id = f"album_{user_id}"
+        messages = [
+            self.server.user_message(user_id, self.source, f"clip_{user_id}_{i}.mp4", media_group_id=group_id)
+            for i in range(3)
+        ]
+        # Album parts arrive as separate updates at nearly the same time
+        await asyncio.gather(*(
+            self.timed("send_album_part", self.bot.handle_video_message(message))
+            for message in messages
+        ))
+        first = min(messages, key=lambda m: m.id)
+        if not first.replies:
+            self.errors["album: no batch menu"] += 1
+            return
+        menu = first.replies[-1]
+        for action in ["batch_res_480p", "batch_quality_low", "batch_start"]:
+            if not await self.press(user_id, menu, action):
+                return
+        self.completed['album'] += 1
+
+    async def user(self, user_id: int, scenario: str, delay: float):
+        await asyncio.sleep(delay)
+        await self.timed(f"scenario/{scenario}", getattr(self, scenario)(user_id))
+
+    async def sample(self, interval: float = 0.5):
+        """Event loop lag, temp dir usage and RSS while the load runs"""
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.loop_lag.append(time.perf_counter() - started - interval)
+            used = sum(
+                entry.stat().st_size for entry in os.scandir(Config.TEMP_DIR)
+                if entry.is_file()
+            )
+            self.peak_temp = max(self.peak_temp, used)
+            with open("/proc/self/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        self.peak_rss = max(self.peak_rss, int(line.split()[1]) * 1024)
+
+    async def run(self) -> Dict:
+        mix = dict(
+            (name, float(weight))
+            for name, weight in (part.split("=") for part in self.args.mix.split(","))
+        )
+        scenarios = self.random.choices(list(mix), weights=list(mix.values()), k=self.args.users)
+        sampler = asyncio.create_task(self.sample())
+        usage_before = (resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            self.user(
+                self.args.first_user_id + index,
+                scenario,
+                self.random.uniform(0, self.args.ramp)
+            )
+            for index, scenario in enumerate(scenarios)
+        ))
+        elapsed = time.perf_counter() - started
+        sampler.cancel()
+
+        usage_after = (resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN))
+        cpu = {
+            name: {
+                'user': after.ru_utime - before.ru_utime,
+                'system': after.ru_stime - before.ru_stime
+            }
+            for name, before, after in zip(['bot', 'ffmpeg'], usage_before, usage_after)
+        }
+        actions = sum(len(values) for name, values in self.latencies.items() if not name.startswith("scenario/"))
+
+        return {
+            'users': self.args.users,
+            'scenarios': {name: scenarios.count(name) for name in mix},
+            'seconds': elapsed,
+            'throughput': {
+                'actions_per_second': actions / elapsed,
+                'completed': dict(self.completed),
+                'completed_per_minute': sum(self.completed.values()) * 60 / elapsed
+            },
+            'latency': {
+                name: {
+                    'count': len(values),
+                    'mean': statistics.mean(values),
+                    'p50': percentile(values, 0.5),
+                    'p90': percentile(values, 0.9),
+                    'p99': percentile(values, 0.99),
+                    'max': max(values)
+                }
+                for name, values in sorted(self.latencies.items())
+            },
+            'errors': dict(self.errors),
+            'telegram': dict(self.server.stats),
+            'resources': {
+                'cpu_seconds': cpu,
+                'peak_rss': self.peak_rss,
+                'child_peak_rss': usage_after[1].ru_maxrss * 1024,
+                'peak_temp_bytes': self.peak_temp,
+                'loop_lag_p99': percentile(self.loop_lag, 0.99) if self.loop_lag else 0.0,
+                'loop_lag_max': max(self.loop_lag, default=0.0)
+            }
+        }
+
+
+def print_report(report: Dict):
+    mb = 1024 * 1024
+    print(f"\n{report['users']} users in {report['seconds']:.1f}s  {report['scenarios']}")
+    throughput = report['throughput']
+    print(
+        f"{throughput['actions_per_second']:.1f} handler calls/s, "
+        f"{throughput['completed_per_minute']:.1f} scenarios completed/min {throughput['completed']}\n"
+    )
+    print(f"{'action':<28}{'count':>7}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, stats in report['latency'].items():
+        print(
+            f"{name:<28}{stats['count']:>7}"
+            f"{stats['p50'] * 1000:>10.0f}{stats['p90'] * 1000:>10.0f}"
+            f"{stats['p99'] * 1000:>10.0f}{stats['max'] * 1000:>10.0f}"
+        )
+    if report['errors']:
+        print("\nErrors:")
+        for name, count in sorted(report['errors'].items()):
+            print(f"  {name}: {count}")
+    print("\nTelegram: " + ", ".join(f"{k}={v}" for k, v in sorted(report['telegram'].items())))
+    resources = report['resources']
+    cpu = resources['cpu_seconds']
+    print(
+        f"CPU: bot {cpu['bot']['user'] + cpu['bot']['system']:.1f}s, "
+        f"ffmpeg {cpu['ffmpeg']['user'] + cpu['ffmpeg']['system']:.1f}s; "
+        f"peak RSS {resources['peak_rss'] / mb:.0f} MB (largest child {resources['child_peak_rss'] / mb:.0f} MB); "
+        f"peak temp {resources['peak_temp_bytes'] / mb:.0f} MB; "
+        f"loop lag p99 {resources['loop_lag_p99'] * 1000:.0f} ms, max {resources['loop_lag_max'] * 1000:.0f} ms"
+    )
+
+
+async def main_async(args) -> Dict:
+    from bot import VideoBot
+
+    server = FakeTelegram(
+        latency=args.latency,
+        jitter=args.latency / 2,
+        bandwidth=args.bandwidth * 1024 * 1024,
+        edits_per_minute=args.edits_per_minute,
+        flood_probability=args.flood_probability,
+        seed=args.seed
+    )
+    bot = VideoBot()
+    server.attach(bot, sessions=args.sessions)
+
+    with tempfile.TemporaryDirectory(dir=Config.TEMP_DIR) as workdir:
+        source = os.path.join(workdir, "source.mp4")
+        make_source(source, args.resolution, args.duration, 1)
+        driver = LoadDriver(bot, server, source, args)
+        try:
+            return await driver.run()
+        finally:
+            await bot.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--ramp", type=float, default=60, help="seconds over which users arrive")
+    parser.add_argument("--mix", default="browse=0.8,compress=0.15,album=0.05",
+                        help=f"scenario weights, from {', '.join(SCENARIOS)}")
+    parser.add_argument("--think", type=float, default=1.0, help="mean seconds between button presses")
+    parser.add_argument("--resolution", default="480p", choices=Config.RESOLUTION_PRESETS)
+    parser.add_argument("--duration", type=int, default=10, help="seconds of the synthetic video")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per API request")
+    parser.add_argument("--bandwidth", type=float, default=10, help="MB/s per transfer request")
+    parser.add_argument("--sessions", type=int, default=1, help="transfer sessions in the pool")
+    parser.add_argument("--edits-per-minute", type=int, default=20, help="per chat before FloodWait")
+    parser.add_argument("--flood-probability", type=float, default=0.0,
+                        help="chance that a transfer request flood-waits")
+    parser.add_argument("--first-user-id", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="also write the report here")
+    args = parser.parse_args()
+
+    unknown = set(part.split("=")[0] for part in args.mix.split(",")) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    # Keep the run self-contained: no broker, nothing persisted between runs
+    Config.BROKER_BACKEND = None
+    Config.PERSIST_SESSIONS = False
+    Config.TEMP_DIR.mkdir(parents=True, exist_ok=True)
+    logging.basicConfig(level=logging.ERROR, stream=sys.stderr)
+
+    report = asyncio.run(main_async(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""Time the processing pipeline on synthetic media, offline
+
+Inputs are generated with lavfi ``testsrc2``/``sine`` sources (fixed
+patterns, so every run encodes the same frames) at several resolutions,
+durations, audio track counts and containers. The suite then times probing,
+an encode per compression preset, audio extraction, merging, thumbnailing,
+progress parsing, and encode throughput at 1..N concurrent jobs. Nothing
+talks to Telegram.
+
+Results are written as JSON. With a baseline (``--save-baseline`` writes
+one) every case is compared against it and slowdowns beyond the tolerance
+are reported; ``--fail-on-regression`` turns them into a non-zero exit.
+
+Usage: python -m benchmarks.suite [--quick] [--concurrency 4] [--output results.json]
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from typing import Awaitable, Callable, Dict, List, Optional
+from config import Config
+from processors.ffmpeg_processor import FFmpegProcessor
+from processors.file_manager import FileManager
+from handlers.progress_handler import ProgressHandler
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# name, resolution, seconds, audio tracks, container
+MEDIA = [
+    ("360p_10s_1a_mp4", "360p", 10, 1, "mp4"),
+    ("480p_30s_2a_mkv", "480p", 30, 2, "mkv"),
+    ("720p_20s_1a_mov", "720p", 20, 1, "mov"),
+    ("1080p_10s_3a_mkv", "1080p", 10, 3, "mkv"),
+]
+QUICK_MEDIA = ["360p_10s_1a_mp4", "480p_30s_2a_mkv"]
+
+# The input the encode, merge and scaling cases run on
+ENCODE_SOURCE = "360p_10s_1a_mp4"
+ENCODE_RESOLUTION = "360p"
+
+
+class _NullMessage:
+    """Stands in for the Telegram message progress is reported to"""
+
+    async def edit_text(self, *args, **kwargs):
+        return self
+
+
+def make_source(path: str, resolution: str, duration: int, audio_tracks: int):
+    """Encode a test pattern with one sine tone per audio track"""
+    size = Config.RESOLUTION_PRESETS[resolution]
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size={size['width']}x{size['height']}:rate=30",
+    ]
+    for track in range(audio_tracks):
+        cmd.extend(["-f", "lavfi", "-i", f"sine=frequency={440 * (track + 1)}:sample_rate=48000"])
+    cmd.extend(["-map", "0:v"])
+    for track in range(audio_tracks):
+        cmd.extend(["-map", f"{track + 1}:a"])
+    cmd.extend([
+        "-t", str(duration),
+        "-c:v", "libx264", "-preset", "ultrafast", "-g", "60",
+        "-c:a", "aac", "-b:a", "128k",
+        "-bitexact",
+        "-y", path
+    ])
+    subprocess.run(cmd, check=True)
+
+
+def ffmpeg_version() -> str:
+    result = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True)
+    return result.stdout.splitlines()[0] if result.returncode == 0 else "unknown"
+
+
+async def measure(func: Callable[[], Awaitable], repeat: int) -> Dict:
+    """Run a case ``repeat`` times, the median is what gets compared"""
+    runs = []
+    extra = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        extra = await func()
+        runs.append(time.perf_counter() - started)
+    result = {
+        'seconds': statistics.median(runs),
+        'min': min(runs),
+        'runs': runs
+    }
+    if isinstance(extra, dict):
+        result.update(extra)
+    return result
+
+
+class Suite:
+    def __init__(self, workdir: str, repeat: int, concurrency: int, quick: bool):
+        self.config = Config()
+        self.ffmpeg = FFmpegProcessor()
+        self.file_manager = FileManager()
+        self.workdir = workdir
+        self.repeat = repeat
+        self.concurrency = concurrency
+        self.media = {
+            name: {'resolution': resolution, 'duration': duration, 'audio': audio, 'container': container}
+            for name, resolution, duration, audio, container in MEDIA
+            if not quick or name in QUICK_MEDIA
+        }
+        self.results: Dict[str, Dict] = {}
+        self.progress_lines: List[str] = []
+
+    def generate(self):
+        for name, spec in self.media.items():
+            spec['path'] = os.path.join(self.workdir, f"{name}.{spec['container']}")
+            make_source(spec['path'], spec['resolution'], spec['duration'], spec['audio'])
+            spec['size'] = os.path.getsize(spec['path'])
+
+    def output(self, name: str) -> str:
+        return os.path.join(self.workdir, name)
+
+    async def case(self, name: str, func: Callable[[], Awaitable], repeat: Optional[int] = None):
+        print(f"  {name}...", end="", flush=True)
+        result = await measure(func, repeat or self.repeat)
+        self.results[name] = result
+        print(f" {result['seconds']:.3f}s")
+
+    async def run(self):
+        for name, spec in self.media.items():
+            async def probe(path=spec['path']):
+                self.ffmpeg.probe_cache.clear()
+                await self.ffmpeg.probe_video(path)
+            await self.case(f"probe/{name}", probe)
+
+            async def probe_cached(path=spec['path']):
+                await self.ffmpeg.probe_video(path)
+            await self.case(f"probe_cached/{name}", probe_cached)
+
+            async def thumbnail(path=spec['path']):
+                thumb = await self.file_manager.generate_thumbnail(path)
+                if thumb:
+                    os.remove(thumb)
+            await self.case(f"thumbnail/{name}", thumbnail)
+
+            for track in range(spec['audio']):
+                async def extract(path=spec['path'], track=track):
+                    output = self.output("audio.m4a")
+                    if not await self.ffmpeg.extract_audio(path, output, track_index=track):
+                        raise RuntimeError("extract_audio failed")
+                    os.remove(output)
+                await self.case(f"extract_audio/{name}/a{track}", extract)
+
+        source = self.media[ENCODE_SOURCE]
+        for quality in self.config.COMPRESSION_PRESETS:
+            await self.case(
+                f"encode/{ENCODE_SOURCE}/{quality}",
+                lambda quality=quality: self.encode(source, quality, capture=True)
+            )
+
+        async def merge():
+            output = self.output("merged.mp4")
+            if not await self.ffmpeg.merge_videos([source['path']] * 2, output):
+                raise RuntimeError("merge_videos failed")
+            os.remove(output)
+        await self.case(f"merge/{ENCODE_SOURCE}x2", merge)
+
+        await self.case("progress_parse", self.parse_progress)
+        await self.scaling(source)
+
+    async def encode(self, source: Dict, quality: str, index: int = 0, capture: bool = False) -> Dict:
+        """Encode with the command the bot builds for a compression preset"""
+        output = self.output(f"encode_{index}.mp4")
+        cmd = await self.ffmpeg.build_ffmpeg_command(source['path'], output, {
+            'resolution': ENCODE_RESOLUTION,
+            'codec': 'libx265',
+            'quality': quality,
+            'audio_codec': 'aac',
+            'audio_bitrate': '128k'
+        })
+
+        lines = []
+
+        async def on_line(line: str):
+            if "time=" in line:
+                lines.append(line)
+
+        started = time.perf_counter()
+        result = await self.ffmpeg.supervisor.run(
+            cmd,
+            on_line=on_line,
+            budget=self.ffmpeg.supervisor.budget(source['duration']),
+            stall_timeout=self.config.FFMPEG_STALL_TIMEOUT
+        )
+        elapsed = time.perf_counter() - started
+        if not result.ok:
+            raise RuntimeError(f"encode failed: {result.killed or result.stderr}")
+        if capture:
+            self.progress_lines = lines
+
+        size = os.path.getsize(output)
+        os.remove(output)
+        return {'output_size': size, 'realtime': source['duration'] / elapsed}
+
+    async def parse_progress(self) -> Dict:
+        """Replay real ffmpeg stats lines through the progress handler
+
+        The update interval is never reached, so only the parsing is timed.
+        """
+        handler = ProgressHandler()
+        handler.update_interval = float('inf')
+        message = _NullMessage()
+        lines = (self.progress_lines or [
+            "frame=  300 fps= 90 q=28.0 size=    1024kB time=00:00:10.00 bitrate= 838.9kbits/s speed=3.00x"
+        ]) * 1000
+        duration = self.media[ENCODE_SOURCE]['duration']
+        for line in lines:
+            await handler.handle_ffmpeg_progress(line, duration, message, "Processing")
+        return {'lines': len(lines)}
+
+    async def scaling(self, source: Dict):
+        """Throughput of 1..N simultaneous encodes of the same input"""
+        single = None
+        for jobs in range(1, self.concurrency + 1):
+            async def batch(jobs=jobs):
+                await asyncio.gather(*(
+                    self.encode(source, 'low', index) for index in range(jobs)
+                ))
+
+            name = f"scaling/{jobs}"
+            await self.case(name, batch, repeat=1)
+            result = self.results[name]
+            # Media seconds encoded per wall-clock second
+            result['throughput'] = jobs * source['duration'] / result['seconds']
+            single = single or result['throughput']
+            result['efficiency'] = result['throughput'] / (jobs * single)
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Print each case against the baseline, returns the regressed ones"""
+    regressions = []
+    print(f"\n{'case':<40}{'baseline s':>12}{'current s':>12}{'change':>9}")
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            print(f"{name:<40}{'-':>12}{result['seconds']:>12.3f}{'new':>9}")
+            continue
+        change = result['seconds'] / previous['seconds'] - 1 if previous['seconds'] else 0
+        flag = ""
+        if change > tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(
+            f"{name:<40}{previous['seconds']:>12.3f}{result['seconds']:>12.3f}"
+            f"{change:>+9.1%}{flag}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="only the small inputs")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case, the median is kept")
+    parser.add_argument("--concurrency", type=int, default=min(4, os.cpu_count() or 1),
+                        help="largest number of simultaneous encodes")
+    parser.add_argument("--output", default="benchmark_results.json", help="where to write results")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed slowdown, 0.15 = 15%%")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    Config.TEMP_DIR.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=Config.TEMP_DIR) as workdir:
+        suite = Suite(workdir, args.repeat, args.concurrency, args.quick)
+        print("Generating inputs...")
+        suite.generate()
+        print("Running cases...")
+        asyncio.run(suite.run())
+        media = {
+            name: {key: value for key, value in spec.items() if key != 'path'}
+            for name, spec in suite.media.items()
+        }
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'ffmpeg': ffmpeg_version(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'repeat': args.repeat,
+            'media': media
+        },
+        'results': suite.results
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    regressions = []
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['meta'].get('ffmpeg') != report['meta']['ffmpeg']:
+            print(f"Note: baseline was taken with {baseline['meta'].get('ffmpeg')}")
+        regressions = compare(suite.results, baseline['results'], args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} case(s) slower than the baseline by more than {args.tolerance:.0%}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,27 @@
 import os
-import time
+import secrets
 import asyncio
 import logging
-from pyrogram import Client, filters, idle
+from typing import Optional
+from pyrogram import filters, idle
 from pyrogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from processors.video_processor import VideoProcessor
 from processors.file_manager import FileManager
+from processors.media_inspector import MediaInspector
+from processors.downloader import ChunkedDownloader
+from processors.uploader import Uploader
+from processors.transfer_pool import TransferPool
+from processors.job_scheduler import JobScheduler
+from processors.job_broker import SQLiteBroker, BrokerServer
+from processors.operation_graph import OperationGraph
+from processors.remote_processor import RemoteProcessor
+from handlers.callback_handler import CallbackHandler
+from handlers.batch_handler import BatchHandler
+from handlers.progress_handler import ProgressHandler
 from utils.keyboard import Keyboard
 from utils.helpers import TimeFormatter, SizeFormatter, MediaInfo
+from utils.session_store import Session, SessionStore
+from utils.metrics import MeteredClient, MetricsServer
 from config import Config
 
 logger = logging.getLogger(__name__)
@@ -15,7 +29,7 @@ logger = logging.getLogger(__name__)
 class VideoBot:
     def __init__(self):
         self.config = Config()
-        self.app = Client(
+        self.app = MeteredClient(
             name="video_processor_bot",
             api_id=self.config.API_ID,
             api_hash=self.config.API_HASH,
@@ -24,11 +38,43 @@ class VideoBot:
         )
         self.video_processor = VideoProcessor()
         self.file_manager = FileManager()
+        # self.app stays the control client; file transfers go through the pool
+        self.transfer_pool = TransferPool(self.app)
+        self.downloader = ChunkedDownloader(self.transfer_pool)
+        self.inspector = MediaInspector(self.video_processor.ffmpeg, self.downloader)
+        self.uploader = Uploader(self.transfer_pool, self.file_manager)
         self.keyboard = Keyboard()
-        self.user_data = {}
+        self.downloads = {}
+        self.user_data = SessionStore(
+            ttl=self.config.SESSION_TTL,
+            max_entries=self.config.SESSION_MAX_ENTRIES,
+            on_evict=self.release_session,
+            db_path=self.config.SESSION_DB_PATH if self.config.PERSIST_SESSIONS else None,
+            max_disk_entries=self.config.SESSION_MAX_DISK_ENTRIES
+        )
+        self.batch_data = SessionStore(
+            ttl=self.config.SESSION_TTL,
+            max_entries=self.config.SESSION_MAX_ENTRIES
+        )
+        self.active_jobs = {}
+        self.scheduler = JobScheduler()
+
+        # With a broker configured, encodes run on separate worker processes
+        self.broker = None
+        self.broker_server = None
+        self.remote_processor = None
+        if self.config.BROKER_BACKEND:
+            self.broker = SQLiteBroker()
+            self.remote_processor = RemoteProcessor(self.broker)
+            if self.config.BROKER_BACKEND == 'socket':
+                self.broker_server = BrokerServer(self.broker)
+        self.callback_handler = CallbackHandler(self)
+        self.batch_handler = BatchHandler(self)
+        self.metrics_server = MetricsServer() if self.config.METRICS_PORT else None
 
     async def start(self):
         """Start the bot and register handlers"""
+        sweepers = []
         try:
             # Register handlers
             self.register_handlers()
@@ -36,7 +82,26 @@ class VideoBot:
             # Start the bot
             logger.info("Starting bot...")
             await self.app.start()
+            await self.transfer_pool.start()
             logger.info("Bot started successfully!")
+
+            if self.broker_server:
+                await self.broker_server.start()
+            if self.metrics_server:
+                await self.metrics_server.start()
+
+            # Pick up encodes interrupted by the last shutdown
+            await self.resume_interrupted_jobs()
+
+            # Expire idle sessions and release their files
+            sweepers.extend([
+                asyncio.create_task(
+                    self.user_data.run_sweeper(self.config.SESSION_SWEEP_INTERVAL)
+                ),
+                asyncio.create_task(
+                    self.batch_data.run_sweeper(self.config.SESSION_SWEEP_INTERVAL)
+                )
+            ])
             
             # Keep the bot running
             await idle()
@@ -46,6 +111,12 @@ class VideoBot:
             raise
 
         finally:
+            for task in sweepers:
+                task.cancel()
+            if self.metrics_server:
+                await self.metrics_server.stop()
+            await self.cleanup()
+            await self.transfer_pool.stop()
             if self.app.is_connected:
                 await self.app.stop()
 
@@ -76,20 +147,21 @@ class VideoBot:
     async def handle_video_message(self, message: Message):
         """Handle incoming video messages"""
         try:
+            # Albums are collected into a single batch job
+            if message.media_group_id:
+                await self.batch_handler.collect(message)
+                return
+
             # Show processing message
             progress_msg = await message.reply_text(
                 "**⏳ Processing Video**\n\n"
                 "Please wait while I analyze your file..."
             )
 
-            # Validate file
             file_name = message.video.file_name if message.video else message.document.file_name
-            if not any(file_name.lower().endswith(ext) for ext in self.config.SUPPORTED_FORMATS['video']):
-                await progress_msg.edit_text(
-                    "❌ Invalid file format!\n"
-                    "Please send a valid video file."
-                )
-                return
+            file_name = file_name or f"video_{message.id}.mp4"
+            extension = os.path.splitext(file_name)[1].lower()
+            supported = extension in self.config.SUPPORTED_FORMATS['video']
 
             # Check file size
             file_size = message.video.file_size if message.video else message.document.file_size
@@ -100,41 +172,64 @@ class VideoBot:
                 )
                 return
 
-            # Download the file
-            file_id = message.video.file_id if message.video else message.document.file_id
-            file_path = os.path.join(
-                self.config.TEMP_DIR,
-                f"video_{message.from_user.id}_{int(time.time())}{os.path.splitext(file_name)[1]}"
-            )
-
-            try:
-                await message.download(file_path)
-            except Exception as e:
-                logger.error(f"Error downloading file: {e}")
+            # Validate file: by its header when inspecting, by extension otherwise
+            probe_data = None
+            if self.config.INSPECT_BEFORE_DOWNLOAD:
+                inspection = await self.inspector.inspect(
+                    message,
+                    file_size,
+                    os.path.join(
+                        self.config.TEMP_DIR,
+                        f"inspect_{message.from_user.id}_{message.id}{extension}"
+                    )
+                )
+                if not inspection['is_video']:
+                    await progress_msg.edit_text(
+                        "❌ Invalid file format!\n"
+                        f"Detected: {inspection['format'] or 'unknown'}\n"
+                        "Please send a valid video file."
+                    )
+                    return
+                probe_data = inspection['probe_data']
+                if not supported:
+                    extension = inspection['extension']
+            elif not supported:
                 await progress_msg.edit_text(
-                    "❌ Error downloading file!\n"
-                    "Please try again."
+                    "❌ Invalid file format!\n"
+                    "Please send a valid video file."
                 )
                 return
 
-            # Store file info
-            user_id = message.from_user.id
-            self.user_data[user_id] = {
+            file_id = message.video.file_id if message.video else message.document.file_id
+
+            # Store file info, one session per source message so several
+            # videos of the same user can be processed side by side
+            token = self.new_session_token()
+            self.user_data[token] = {
+                'user_id': message.from_user.id,
+                'chat_id': message.chat.id,
                 'file_id': file_id,
                 'file_name': file_name,
                 'file_size': file_size,
-                'file_path': file_path,
+                'file_path': None,
                 'message_id': message.id,
-                'progress_msg_id': progress_msg.id
+                'progress_msg_id': progress_msg.id,
+                'probe_data': probe_data,
+                'extension': extension
             }
 
+            # Without header inspection the file is needed right away
+            if not self.config.INSPECT_BEFORE_DOWNLOAD:
+                if not await self.download_session_file(token, progress_msg):
+                    return
+
             # Show main menu
             await progress_msg.edit_text(
                 "**🎥 Video Processor**\n\n"
                 f"File: `{file_name}`\n"
                 f"Size: {SizeFormatter.format_size(file_size)}\n\n"
                 "Select an operation:",
-                reply_markup=self.keyboard.get_main_keyboard()
+                reply_markup=self.keyboard.get_main_keyboard(token)
             )
 
         except Exception as e:
@@ -147,11 +242,15 @@ class VideoBot:
     async def handle_callback_query(self, callback: CallbackQuery):
         """Handle callback queries"""
         try:
-            data = callback.data
-            user_id = callback.from_user.id
+            data, token = self.keyboard.unpack(callback.data)
+
+            # Batch jobs keep their own session
+            if data.startswith("batch_"):
+                await self.batch_handler.handle_callback(callback, data, token)
+                return
 
             # Check session validity
-            if user_id not in self.user_data and data != "cancel":
+            if not self.get_session(token, callback.from_user.id) and data != "cancel":
                 await callback.answer(
                     "⚠️ Session expired. Please send the video again.",
                     show_alert=True
@@ -160,23 +259,27 @@ class VideoBot:
 
             # Handle different callbacks
             if data == "cancel":
-                await self.handle_cancel(callback, user_id)
+                await self.handle_cancel(callback, token)
             elif data == "compress_menu":
-                await self.show_compression_menu(callback)
+                await self.callback_handler.handle_compress_menu(callback, token)
             elif data.startswith("compress_"):
-                await self.handle_compression_callback(callback)
+                await self.callback_handler.handle_compression_callback(callback, data, token)
             elif data == "audio_menu":
-                await self.show_audio_menu(callback)
+                await self.callback_handler.handle_audio_menu(callback, token)
             elif data.startswith("audio_"):
-                await self.handle_audio_callback(callback)
+                await self.callback_handler.handle_audio_callback(callback, data, token)
+            elif data == "cut_menu":
+                await self.callback_handler.handle_cut_menu(callback, token)
+            elif data.startswith("cut_"):
+                await self.callback_handler.handle_cut_callback(callback, data, token)
             elif data == "merge_menu":
                 await self.show_merge_menu(callback)
             elif data.startswith("merge_"):
                 await self.handle_merge_callback(callback)
             elif data == "mediainfo":
-                await self.show_mediainfo(callback)
+                await self.show_mediainfo(callback, token)
             elif data == "main_menu":
-                await self.show_main_menu(callback)
+                await self.show_main_menu(callback, token)
             else:
                 await callback.answer("🚧 Feature under development")
 
@@ -187,18 +290,17 @@ class VideoBot:
                 show_alert=True
             )
 
-    async def show_main_menu(self, callback: CallbackQuery):
+    async def show_main_menu(self, callback: CallbackQuery, token: str):
         """Show main menu"""
         try:
-            user_id = callback.from_user.id
-            file_info = self.user_data[user_id]
+            file_info = self.user_data[token]
             
             await callback.message.edit_text(
                 "**🎥 Video Processor**\n\n"
                 f"File: `{file_info['file_name']}`\n"
                 f"Size: {SizeFormatter.format_size(file_info['file_size'])}\n\n"
                 "Select an operation:",
-                reply_markup=self.keyboard.get_main_keyboard()
+                reply_markup=self.keyboard.get_main_keyboard(token)
             )
         except Exception as e:
             logger.error(f"Error showing main menu: {e}")
@@ -207,15 +309,22 @@ class VideoBot:
                 show_alert=True
             )
 
-    async def handle_cancel(self, callback: CallbackQuery, user_id: int):
+    async def handle_cancel(self, callback: CallbackQuery, token: Optional[str]):
         """Handle cancel button"""
         try:
-            # Cleanup user data and files
-            if user_id in self.user_data:
-                file_path = self.user_data[user_id].get('file_path')
-                if file_path and os.path.exists(file_path):
-                    os.remove(file_path)
-                del self.user_data[user_id]
+            # Cleanup this session's data and files
+            session = self.get_session(token, callback.from_user.id)
+            if session and self.user_data.is_pinned(token):
+                # Its job still reads the input, deleting it would break the encode
+                await callback.answer(
+                    "⏳ A job is still running on this video. "
+                    "Cancel once it has finished.",
+                    show_alert=True
+                )
+                return
+            if session:
+                self.release_session(token, session)
+                del self.user_data[token]
             
             # Delete message
             await callback.message.delete()
@@ -223,26 +332,33 @@ class VideoBot:
         except Exception as e:
             logger.error(f"Error handling cancel: {e}")
 
-    async def show_mediainfo(self, callback: CallbackQuery):
+    async def show_mediainfo(self, callback: CallbackQuery, token: str):
         """Show media information"""
         try:
-            user_id = callback.from_user.id
-            file_path = self.user_data[user_id].get('file_path')
-            
-            if not file_path or not os.path.exists(file_path):
-                await callback.answer(
-                    "⚠️ File not found. Please send the video again.",
-                    show_alert=True
-                )
-                return
+            # Header inspection already probed the file
+            info = self.user_data[token].get('probe_data')
 
-            # Get media info
-            info = await self.video_processor.ffmpeg.probe_video(file_path)
+            if info is None:
+                file_path = await self.download_session_file(token, callback.message)
+                if not file_path:
+                    await callback.answer(
+                        "⚠️ File not found. Please send the video again.",
+                        show_alert=True
+                    )
+                    return
+
+                # Short interactive work borrows a slot from running encodes
+                info = await self.scheduler.submit(
+                    lambda: self.video_processor.ffmpeg.probe_video(file_path),
+                    user_id=callback.from_user.id,
+                    chat_id=callback.message.chat.id,
+                    interactive=True
+                )
             media_info = MediaInfo(info)
             
             # Show info with back button
             keyboard = InlineKeyboardMarkup([[
-                InlineKeyboardButton("⬅️ Back", callback_data="main_menu")
+                InlineKeyboardButton("⬅️ Back", callback_data=self.keyboard.pack("main_menu", token))
             ]])
             
             await callback.message.edit_text(
@@ -257,14 +373,215 @@ class VideoBot:
                 show_alert=True
             )
 
+    async def resume_interrupted_jobs(self):
+        """Resume journaled encodes and reclaim files left by a crash"""
+        try:
+            # Workers resume their own journals (see EncodeWorker.recover)
+            if self.broker:
+                await asyncio.to_thread(self.broker.prune)
+                return
+
+            journal = self.video_processor.journal
+            jobs = journal.get_interrupted_jobs()
+
+            # Anything in TEMP_DIR not owned by a resumable job or a live
+            # session is an orphan
+            await self.file_manager.reclaim_orphans(
+                journal.get_active_paths() + self.user_data.active_paths()
+            )
+            journal.prune()
+
+            for job in jobs:
+                asyncio.create_task(self.resume_job(job))
+
+            if jobs:
+                logger.info(f"Resuming {len(jobs)} interrupted job(s)")
+
+        except Exception as e:
+            logger.error(f"Error resuming interrupted jobs: {e}")
+
+    async def resume_job(self, job: dict):
+        """Resume one interrupted job and send the result to its chat"""
+        message = None
+        try:
+            if job['chat_id'] and job['message_id']:
+                message = await self.app.get_messages(job['chat_id'], job['message_id'])
+                await message.edit_text(
+                    "**🔄 Resuming Compression**\n\n"
+                    "⏳ The bot restarted, continuing from the last checkpoint..."
+                )
+        except Exception as e:
+            logger.error(f"Error fetching message of job {job['id']}: {e}")
+            message = None
+
+        output_path = await self.scheduler.submit(
+            lambda: self.video_processor.resume_job(job, message),
+            user_id=job['user_id'] or job['chat_id'],
+            chat_id=job['chat_id']
+        )
+
+        try:
+            if not output_path:
+                if message:
+                    await message.edit_text("❌ Compression failed. Please try again.")
+                return
+            if not job['chat_id']:
+                logger.warning(f"Job {job['id']} has no chat to send its output to")
+                return
+
+            # Attributes of the journaled plan, the input is still there
+            probe_data = await self.video_processor.ffmpeg.probe_video(job['input_path'])
+            metadata = self.video_processor.ffmpeg.compiler.output_metadata(
+                OperationGraph.from_list(job['graph']),
+                probe_data
+            )
+            if message:
+                await message.edit_text(
+                    "**📤 Uploading**\n\n"
+                    "⏳ Please wait..."
+                )
+            progress = ProgressHandler()
+            sent = await self.uploader.send_video(
+                job['chat_id'],
+                output_path,
+                metadata,
+                file_name=f"compressed_{os.path.basename(output_path)}",
+                reply_to=getattr(message, 'reply_to_message_id', None),
+                progress=progress.update_progress if message else None,
+                progress_args=(message, "📤 Uploading")
+            )
+            if not sent:
+                if message:
+                    await message.edit_text("❌ Upload failed. Please try again.")
+                return
+            if message:
+                await message.edit_text("✅ Video compressed successfully!")
+
+        except Exception as e:
+            logger.error(f"Error sending resumed job {job['id']}: {e}")
+
+        finally:
+            if output_path:
+                self.callback_handler.remove_output(output_path)
+
     # ... [Previous compression, audio, and merge methods remain the same]
 
+    async def download_session_file(self, token: str, status_msg: Message) -> Optional[str]:
+        """Download a session's file on first use, returns its local path"""
+        session = self.user_data.get(token)
+        if session is None:
+            return None
+        file_path = session.get('file_path')
+        if ChunkedDownloader.is_complete(file_path):
+            return file_path
+
+        # Operations started at the same time share one download
+        task = self.downloads.get(token)
+        if task is None:
+            task = asyncio.create_task(self._download(token, session, status_msg))
+            self.downloads[token] = task
+            task.add_done_callback(lambda _: self.downloads.pop(token, None))
+
+        return await asyncio.shield(task)
+
+    async def _download(self, token: str, session: Session, status_msg: Message) -> Optional[str]:
+        """Fetch the source message and download its media"""
+        try:
+            await status_msg.edit_text(
+                "**📥 Downloading**\n\n"
+                f"File: `{session['file_name']}`\n"
+                "⏳ Please wait..."
+            )
+            message = await self.app.get_messages(session['chat_id'], session['message_id'])
+            # A stable path lets an interrupted download resume where it stopped
+            file_path = session.get('file_path') or os.path.join(
+                self.config.TEMP_DIR,
+                f"video_{session['user_id']}_{session['message_id']}"
+                f"{session.get('extension') or os.path.splitext(session['file_name'])[1]}"
+            )
+            # Owned by the session from the start, so a partial file is cleaned up with it
+            session['file_path'] = file_path
+            self.user_data[token] = session
+
+            progress = ProgressHandler()
+            return await self.downloader.download(
+                message,
+                file_path,
+                session['file_size'],
+                progress=progress.update_progress,
+                progress_args=(status_msg, "📥 Downloading")
+            )
+
+        except Exception as e:
+            logger.error(f"Error downloading file: {e}")
+            await status_msg.edit_text(
+                "❌ Error downloading file!\n"
+                "Please try again."
+            )
+            return None
+
+    @staticmethod
+    def new_session_token() -> str:
+        """Create a compact token identifying a session in callback data"""
+        return secrets.token_urlsafe(6)
+
+    def get_session(self, token: Optional[str], user_id: int) -> Optional[Session]:
+        """Get a session, only if it belongs to the given user"""
+        if not token:
+            return None
+        session = self.user_data.get(token)
+        if session is None or session.get('user_id') != user_id:
+            return None
+        return session
+
+    def try_acquire_job_slot(self, user_id: int, token: Optional[str] = None) -> bool:
+        """Reserve a slot for one more running job of the user
+
+        The job's session is pinned until the slot is released, so it isn't
+        expired (and its input deleted) while the job is queued or running.
+        """
+        running = self.active_jobs.get(user_id, 0)
+        if running >= self.config.MAX_JOBS_PER_USER:
+            return False
+        self.active_jobs[user_id] = running + 1
+        if token:
+            self.user_data.pin(token)
+        return True
+
+    def release_job_slot(self, user_id: int, token: Optional[str] = None):
+        """Free a job slot taken with try_acquire_job_slot"""
+        if token:
+            self.user_data.unpin(token)
+        running = self.active_jobs.get(user_id, 0) - 1
+        if running > 0:
+            self.active_jobs[user_id] = running
+        else:
+            self.active_jobs.pop(user_id, None)
+
+    def release_session(self, key: str, session: Session):
+        """Release the files of an expired or evicted session"""
+        file_path = session.get('file_path')
+        if file_path:
+            ChunkedDownloader.discard(file_path)
+
     async def cleanup(self):
         """Cleanup resources"""
         try:
-            # Cleanup all user files
-            for user_id in self.user_data:
-                file_path = self.user_data[user_id].get('file_path')
+            if self.broker_server:
+                await self.broker_server.stop()
+            if self.broker:
+                self.broker.close()
+
+            # Persisted sessions keep their files for the next start
+            if self.config.PERSIST_SESSIONS:
+                self.user_data.close()
+                return
+
+            # Cleanup all session files (a session expiring on access is
+            # released by the store itself and returns None)
+            for token in self.user_data:
+                session = self.user_data.get(token)
+                file_path = session.get('file_path') if session else None
                 if file_path and os.path.exists(file_path):
                     os.remove(file_path)
             
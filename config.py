@@ -17,6 +17,7 @@ class Config:
     BASE_DIR = Path(__file__).parent
     TEMP_DIR = BASE_DIR / "temp_downloads"
     THUMB_DIR = BASE_DIR / "thumbnails"
+    DATA_DIR = BASE_DIR / "data"
     
     # File Settings
     MAX_FILE_SIZE = 2 * 1024 * 1024 * 1024  # 2GB
@@ -59,5 +60,135 @@ class Config:
         "360p": {"width": 640, "height": 360}
     }
     
+    # Renditions produced by ladder mode (single decode, one encode per size)
+    LADDER_RESOLUTIONS = ["1080p", "720p", "480p"]
+    LADDER_PACKAGING = None  # None, "hls" or "dash"
+    LADDER_SEGMENT_TIME = 6  # seconds per HLS/DASH segment
+    
+    # Frame Analysis Settings (duplicate/black detection before encoding)
+    FRAME_ANALYSIS = True
+    FRAME_ANALYSIS_BATCH = 512  # frames compared per NumPy batch
+    DUPLICATE_FRAME_THRESHOLD = 1.0  # mean abs luma difference (0-255) of a repeated frame
+    DECIMATE_MIN_RATIO = 0.3  # share of duplicate frames that enables mpdecimate
+    BLACK_FRAME_LUMA = 24  # mean luma below which a frame is black
+    BLACK_TRIM_MIN_DURATION = 1.0  # seconds of leading/trailing black worth cutting
+    SILENCE_NOISE_LEVEL = -50  # dB below which audio over black counts as silent
+    FRAME_ANALYSIS_SPEED = 20  # times real time, for scheduling a preview that analyzes first
+    
+    # Auto-crop Settings (black bar detection before encoding)
+    AUTOCROP_DEFAULT = True
+    CROP_SAMPLES = 12  # windows sampled across the file
+    CROP_SAMPLE_FRAMES = 24  # frames run through cropdetect per window
+    CROP_PARALLEL = 4  # windows sampled at once
+    CROP_LIMIT = 24  # cropdetect black threshold (0-255)
+    CROP_MIN_SAVING = 0.05  # smallest share of pixels worth cropping
+    
+    # Loudness Normalization Settings (EBU R128)
+    LOUDNESS_TARGET = -16.0  # integrated loudness, LUFS
+    LOUDNESS_TRUE_PEAK = -1.5  # dBTP
+    LOUDNESS_RANGE = 11.0  # LU
+    LOUDNESS_TOLERANCE = 1.0  # LU off target before a track is adjusted
+    LOUDNESS_AUDIO_BITRATE = "192k"
+    LOUDNESS_SPEED = 50  # times real time, for scheduling the audio-only passes
+    
+    # Preview Settings (sample encode before a full compression)
+    PREVIEW_WINDOWS = 3  # sample windows spread over the video
+    PREVIEW_WINDOW_SECONDS = 4  # length of each window
+    
+    # Output Finalization Settings (how MP4 outputs get their index up front)
+    OUTPUT_FINALIZATION = "moov_reserve"  # "moov_reserve", "fragmented", "faststart" or None
+    MOOV_RESERVE_FACTOR = 1.5  # headroom over the estimated moov size
+    
+    # Batch (media group) Settings
+    BATCH_COLLECT_DELAY = 2  # seconds to wait for the rest of an album
+    MAX_BATCH_SIZE = 10
+    BATCH_PREFETCH = 1  # files downloaded ahead of the one being encoded
+    
+    # Checkpointed Encodes
+    CHECKPOINT_ENCODES = True
+    SEGMENT_DURATION = 60  # seconds of output per checkpoint
+    JOURNAL_PATH = DATA_DIR / "jobs.db"
+    
+    # Session Settings
+    SESSION_TTL = 3600  # idle seconds before a session and its files are released
+    SESSION_MAX_ENTRIES = 10000  # sessions kept in memory
+    SESSION_MAX_DISK_ENTRIES = 500000  # sessions kept on disk
+    SESSION_SWEEP_INTERVAL = 60  # seconds
+    MAX_JOBS_PER_USER = 3  # jobs a single user may have running at once
+    PERSIST_SESSIONS = True
+    SESSION_DB_PATH = DATA_DIR / "sessions.db"
+    
+    # Scheduler Settings
+    MAX_CONCURRENT_JOBS = 2  # processing slots shared by all users (with workers: their total capacity)
+    SCHEDULER_QUANTUM = 60  # cost credited per round (seconds of predicted encode time)
+    PRIORITY_WEIGHTS = {"high": 4, "normal": 2, "low": 1}
+    USER_PRIORITY: Dict[int, str] = {}  # user_id -> priority tier
+    PRESET_COST = {"slow": 2.5, "medium": 1.0, "fast": 0.6}  # relative x265 preset speed
+    PREEMPTION_MODE = "stop"  # stop (SIGSTOP/SIGCONT), nice (lowest CPU/IO priority) or off
+    MAX_INTERACTIVE_JOBS = 2  # short jobs allowed to borrow slots at once
+    SCHEDULER_ORDER = "fifo"  # per-user order: fifo, sjf (shortest first) or deadline
+    DEADLINE_SLACK = 4  # deadline = submit time + slack × predicted run time
+    COPY_SPEED = 50  # times real time, for scheduling edits applied with stream copy
+    
+    # Cost Model Settings
+    COST_MODEL_PATH = DATA_DIR / "cost_model.db"
+    COST_MODEL_PRIOR_SPEED = 1.0  # encode seconds per media second at 1080p/medium before any history
+    COST_MODEL_MIN_SAMPLES = 3  # samples needed before a match level is trusted
+    COST_MODEL_MAX_SAMPLES = 50  # most recent samples used per prediction
+    COST_MODEL_KEEP_SAMPLES = 10000  # samples kept in the database, oldest pruned first
+    COST_MODEL_DECODE_SHARE = 0.25  # cost of decoding a source pixel relative to encoding an output pixel
+    
+    # Process Supervision Settings
+    FFMPEG_STALL_TIMEOUT = 120  # seconds without progress before ffmpeg is killed
+    FFMPEG_BUDGET_FACTOR = 10  # wall-clock budget = factor × media duration
+    FFMPEG_MIN_BUDGET = 300  # seconds, budget floor for short inputs
+    FFMPEG_MAX_RUNTIME = 6 * 3600  # seconds, hard cap (also used when the duration is unknown)
+    FFMPEG_PREDICTION_MARGIN = 3  # the cap is at least this many times the job's predicted run time
+    FFMPEG_MEMORY_LIMIT = 4 * 1024 ** 3  # RLIMIT_DATA per child in bytes, None disables
+    FFPROBE_TIMEOUT = 60  # seconds
+    KILL_GRACE_PERIOD = 5  # seconds between SIGTERM and SIGKILL
+    
+    # Download Settings
+    DOWNLOAD_PART_CHUNKS = 16  # CHUNK_SIZE multiples per range (resume granularity)
+    DOWNLOAD_CONNECTIONS = 4  # ranges fetched concurrently per transfer session
+    DOWNLOAD_RETRIES = 3  # attempts per range
+    
+    # Transfer Pool Settings (extra sessions of the bot for downloads/uploads)
+    TRANSFER_SESSIONS = int(os.getenv('TRANSFER_SESSIONS', '0'))  # 0 = the bot's own client
+    TRANSFER_MAX_FLOOD_WAIT = 300  # seconds; longer FloodWaits fail the transfer
+    TRANSFER_INTERRUPT_BACKOFF = 60  # seconds a session rests after a stream ended short
+    TRANSFER_REROUTES = 3  # interrupted streams moved to another session before failing
+    
+    # Upload Settings
+    UPLOAD_CONNECTIONS = 4  # 512 KiB parts sent concurrently
+    UPLOAD_RETRIES = 3  # attempts per part
+    
+    # Bundle Settings (multi-output jobs streamed into one MKA/ZIP upload)
+    BUNDLE_BUFFER_CHUNKS = 32  # ffmpeg stdout chunks queued ahead of the upload
+    BUNDLE_UPLOAD_ATTEMPTS = 2  # times a ZIP of files on disk is streamed before giving up
+    
+    # Inspection Settings (probe from the file header before downloading)
+    INSPECT_BEFORE_DOWNLOAD = True
+    INSPECT_HEAD_CHUNKS = 4  # 1 MiB chunks fetched from the start of the file
+    INSPECT_MAX_TAIL_CHUNKS = 64  # largest trailing moov box fetched, in 1 MiB chunks
+    
+    # Preflight Settings
+    PREFLIGHT_DRY_RUN = True  # encode 1s into the real container before the full job
+    PREFLIGHT_TIMEOUT = 120  # seconds allowed for the trial encode
+    PROBE_CACHE_SIZE = 256  # ffprobe results kept per processor
+    
+    # Worker Settings (encodes run in worker.py processes when a broker is set;
+    # TEMP_DIR must then be shared storage mounted at the same path everywhere)
+    BROKER_BACKEND = os.getenv('BROKER_BACKEND') or None  # None (in-process), "sqlite" or "socket"
+    BROKER_PATH = DATA_DIR / "broker.db"
+    BROKER_SOCKET = os.getenv('BROKER_SOCKET', str(DATA_DIR / "broker.sock"))
+    WORKER_CONCURRENCY = int(os.getenv('WORKER_CONCURRENCY', '1'))  # encodes per worker process
+    WORKER_POLL_INTERVAL = 1  # seconds between broker polls
+    WORKER_HEARTBEAT_TIMEOUT = 60  # seconds before a silent worker's job is requeued
+    
+    # Metrics Settings (Prometheus text format at http://METRICS_HOST:METRICS_PORT/metrics)
+    METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))  # 0 disables; each process needs its own
+    METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+    
     # Progress Update Settings
     PROGRESS_UPDATE_DELAY = 1  # seconds
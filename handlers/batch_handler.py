@@ -0,0 +1,269 @@
+import asyncio
+import os
+import time
+import logging
+from typing import Dict, List
+from pyrogram.types import CallbackQuery, Message
+from utils.keyboard import Keyboard
+from utils.helpers import SizeFormatter
+from processors.batch_pipeline import BatchPipeline
+from processors.video_processor import VideoProcessor
+from processors.file_manager import FileManager
+
+logger = logging.getLogger(__name__)
+
+class FileProgress:
+    """Stands in for the progress message of one file of a batch
+
+    The batch status message shows the pipeline's counts, per-file encode
+    progress would overwrite them and is dropped. ``chat`` and ``id`` are
+    the file's own message, which journaled and remote jobs are keyed by.
+    """
+
+    def __init__(self, message: Message):
+        self.chat = message.chat
+        self.id = message.id
+
+    async def edit_text(self, text: str, *args, **kwargs):
+        pass
+
+
+class BatchHandler:
+    def __init__(self, bot):
+        self.bot = bot
+        self.video_processor = VideoProcessor()
+        self.file_manager = FileManager()
+        self.keyboard = Keyboard()
+        self.pending: Dict[str, List[Message]] = {}
+
+    @property
+    def processor(self):
+        """Where encodes run: remote workers when a broker is configured"""
+        return self.bot.remote_processor or self.video_processor
+
+    async def collect(self, message: Message):
+        """Buffer media group messages until the whole album has arrived"""
+        try:
+            group_id = message.media_group_id
+            if group_id in self.pending:
+                self.pending[group_id].append(message)
+                return
+
+            self.pending[group_id] = [message]
+
+            # Album parts arrive as separate updates within a short window
+            await asyncio.sleep(self.bot.config.BATCH_COLLECT_DELAY)
+            messages = self.pending.pop(group_id, [])
+            await self.create_batch(messages)
+
+        except Exception as e:
+            logger.error(f"Error collecting media group: {e}")
+
+    async def create_batch(self, messages: List[Message]):
+        """Validate collected files and store them as one batch job"""
+        try:
+            messages.sort(key=lambda m: m.id)
+            first = messages[0]
+            user_id = first.from_user.id
+
+            items = []
+            for message in messages:
+                media = message.video or message.document
+                if not media or not media.file_name:
+                    continue
+                if not any(
+                    media.file_name.lower().endswith(ext)
+                    for ext in self.bot.config.SUPPORTED_FORMATS['video']
+                ):
+                    continue
+                if media.file_size > self.bot.config.MAX_FILE_SIZE:
+                    continue
+                items.append({
+                    'message': message,
+                    'file_name': media.file_name,
+                    'file_size': media.file_size
+                })
+
+            if not items:
+                await first.reply_text(
+                    "❌ Invalid file format!\n"
+                    "Please send valid video files."
+                )
+                return
+
+            items = items[:self.bot.config.MAX_BATCH_SIZE]
+            progress_msg = await first.reply_text("**⏳ Preparing Batch**")
+
+            token = self.bot.new_session_token()
+            self.bot.batch_data[token] = {
+                'user_id': user_id,
+                'chat_id': first.chat.id,
+                'items': items,
+                'progress_msg_id': progress_msg.id,
+                'compress_settings': {
+                    'resolution': None,
+                    'quality': None
+                }
+            }
+
+            await progress_msg.edit_text(
+                self.format_batch_text(items),
+                reply_markup=self.keyboard.get_batch_keyboard(
+                    self.bot.batch_data[token]['compress_settings'],
+                    token
+                )
+            )
+
+        except Exception as e:
+            logger.error(f"Error creating batch: {e}")
+
+    async def handle_callback(self, callback: CallbackQuery, data: str, token: str):
+        """Handle batch menu callbacks"""
+        try:
+            user_id = callback.from_user.id
+            batch = self.bot.batch_data.get(token) if token else None
+
+            if batch is None or batch.get('user_id') != user_id:
+                await callback.answer(
+                    "⚠️ Session expired. Please send the videos again.",
+                    show_alert=True
+                )
+                return
+
+            settings = batch['compress_settings']
+
+            if data == "batch_cancel":
+                del self.bot.batch_data[token]
+                await callback.message.delete()
+                return
+            elif data.startswith("batch_res_"):
+                settings['resolution'] = data.split("_")[2]
+            elif data.startswith("batch_quality_"):
+                settings['quality'] = data.split("_")[2]
+            elif data == "batch_start":
+                if not settings.get('resolution') or not settings.get('quality'):
+                    await callback.answer(
+                        "⚠️ Please select both resolution and quality!",
+                        show_alert=True
+                    )
+                    return
+                if not self.bot.try_acquire_job_slot(user_id):
+                    await callback.answer(
+                        "⚠️ You already have "
+                        f"{self.bot.config.MAX_JOBS_PER_USER} jobs running. "
+                        "Please wait for one to finish.",
+                        show_alert=True
+                    )
+                    return
+                try:
+                    await self.start_batch(callback, token)
+                finally:
+                    self.bot.release_job_slot(user_id)
+                return
+
+            await callback.message.edit_text(
+                self.format_batch_text(batch['items']),
+                reply_markup=self.keyboard.get_batch_keyboard(settings, token)
+            )
+
+        except Exception as e:
+            logger.error(f"Error handling batch callback: {e}")
+            await callback.answer(
+                "❌ An error occurred. Please try again.",
+                show_alert=True
+            )
+
+    async def start_batch(self, callback: CallbackQuery, token: str):
+        """Compress every file of the batch through the pipelined stages"""
+        batch = self.bot.batch_data.pop(token)
+        user_id = batch['user_id']
+        items = batch['items']
+        settings = batch['compress_settings']
+        status_msg = callback.message
+        total = len(items)
+
+        async def download(item: Dict) -> str:
+            file_path = os.path.join(
+                self.bot.config.TEMP_DIR,
+                f"batch_{user_id}_{item['message'].id}_{int(time.time())}"
+                f"{os.path.splitext(item['file_name'])[1]}"
+            )
+            return await self.bot.downloader.download(
+                item['message'], file_path, item['file_size']
+            )
+
+        async def process(item: Dict, path: str) -> str:
+            probe_data = await self.video_processor.ffmpeg.probe_video(path)
+            result = await self.bot.scheduler.submit(
+                lambda: self.processor.compress_video(
+                    path, settings, FileProgress(item['message'])
+                ),
+                user_id=user_id,
+                chat_id=batch.get('chat_id'),
+                cost=self.bot.scheduler.estimate_cost(
+                    probe_data,
+                    settings.get('resolution'),
+                    settings.get('quality')
+                )
+            )
+            if not result:
+                return None
+            # Kept for the upload stage, the input is deleted before it
+            item['metadata'] = result['metadata']
+            return result['path']
+
+        async def upload(item: Dict, path: str):
+            name = os.path.splitext(item['file_name'])[0]
+            return await self.bot.uploader.send_video(
+                item['message'].chat.id,
+                path,
+                item['metadata'],
+                file_name=f"compressed_{name}{os.path.splitext(path)[1]}",
+                reply_to=item['message'].id
+            )
+
+        async def on_update(status: Dict):
+            await status_msg.edit_text(
+                "**📦 Batch Processing**\n\n"
+                f"📥 Downloaded: {status['downloaded']}/{total}\n"
+                f"⚙️ Processed: {status['processed']}/{total}\n"
+                f"📤 Uploaded: {status['uploaded']}/{total}\n"
+                f"❌ Failed: {status['failed']}"
+            )
+
+        try:
+            await status_msg.edit_text(
+                "**📦 Batch Processing**\n\n"
+                f"⏳ Starting {total} file(s)..."
+            )
+
+            pipeline = BatchPipeline(
+                download,
+                process,
+                upload,
+                prefetch=self.bot.config.BATCH_PREFETCH,
+                on_update=on_update
+            )
+            results = await pipeline.run(items)
+
+            done = sum(1 for result in results if result)
+            await status_msg.edit_text(
+                f"✅ Batch finished: {done}/{total} file(s) processed."
+            )
+
+        except Exception as e:
+            logger.error(f"Error running batch: {e}")
+            await status_msg.edit_text("❌ Batch processing failed. Please try again.")
+
+    @staticmethod
+    def format_batch_text(items: List[Dict]) -> str:
+        """Format the batch summary"""
+        total_size = sum(item['file_size'] for item in items)
+        lines = [f"• `{item['file_name']}`" for item in items]
+        return (
+            "**📦 Batch Processor**\n\n"
+            + "\n".join(lines)
+            + f"\n\nFiles: {len(items)}\n"
+            f"Total Size: {SizeFormatter.format_size(total_size)}\n\n"
+            "Select settings to apply to all files:"
+        )
@@ -2,7 +2,13 @@ from pyrogram.types import CallbackQuery, Message, InlineKeyboardMarkup
 from utils.keyboard import Keyboard
 from processors.video_processor import VideoProcessor
 from processors.file_manager import FileManager
+from processors.operation_graph import OperationGraph
+from handlers.progress_handler import ProgressHandler
+from utils.helpers import SizeFormatter, TimeFormatter, MediaInfo
+import os
+import shutil
 import logging
+from typing import Dict, List, Optional
 
 logger = logging.getLogger(__name__)
 
@@ -13,14 +19,22 @@ class CallbackHandler:
         self.file_manager = FileManager()
         self.keyboard = Keyboard()
 
+    @property
+    def compiler(self):
+        return self.video_processor.ffmpeg.compiler
+
+    @property
+    def processor(self):
+        """Where encodes run: remote workers when a broker is configured"""
+        return self.bot.remote_processor or self.video_processor
+
     async def handle_callback(self, callback: CallbackQuery):
         """Main callback handler"""
         try:
-            data = callback.data
-            user_id = callback.from_user.id
+            data, token = self.keyboard.unpack(callback.data)
 
             # Check session validity
-            if user_id not in self.bot.user_data and data != "cancel":
+            if not self.bot.get_session(token, callback.from_user.id) and data != "cancel":
                 await callback.answer(
                     "⚠️ Session expired. Please send the video again.",
                     show_alert=True
@@ -29,19 +43,19 @@ class CallbackHandler:
 
             # Handle different callbacks
             if data == "cancel":
-                await self.handle_cancel(callback, user_id)
+                await self.handle_cancel(callback, token)
             elif data == "compress":
-                await self.handle_compress_menu(callback)
+                await self.handle_compress_menu(callback, token)
             elif data.startswith("compress_"):
-                await self.handle_compression_callback(callback)
+                await self.handle_compression_callback(callback, data, token)
             elif data == "merge":
                 await self.handle_merge_menu(callback)
             elif data.startswith("merge_"):
                 await self.handle_merge_callback(callback)
             elif data == "audio":
-                await self.handle_audio_menu(callback)
+                await self.handle_audio_menu(callback, token)
             elif data.startswith("audio_"):
-                await self.handle_audio_callback(callback)
+                await self.handle_audio_callback(callback, data, token)
             elif data == "mediainfo":
                 await self.handle_mediainfo(callback)
             else:
@@ -51,20 +65,22 @@ class CallbackHandler:
             logger.error(f"Error handling callback: {e}")
             await self.handle_error(callback)
 
-    async def handle_compress_menu(self, callback: CallbackQuery):
+    async def handle_compress_menu(self, callback: CallbackQuery, token: str):
         """Show compression options menu"""
         try:
-            user_id = callback.from_user.id
-            if 'compress_settings' not in self.bot.user_data[user_id]:
-                self.bot.user_data[user_id]['compress_settings'] = {
+            session = self.bot.user_data[token]
+            if 'compress_settings' not in session:
+                session['compress_settings'] = {
                     'resolution': None,
                     'quality': None,
                     'crf': None,
-                    'preset': None
+                    'preset': None,
+                    'autocrop': self.bot.config.AUTOCROP_DEFAULT
                 }
 
             keyboard = self.keyboard.get_compression_keyboard(
-                self.bot.user_data[user_id]['compress_settings']
+                session['compress_settings'],
+                token
             )
 
             await callback.message.edit_text(
@@ -77,23 +93,32 @@ class CallbackHandler:
             logger.error(f"Error showing compression menu: {e}")
             await self.handle_error(callback)
 
-    async def handle_compression_callback(self, callback: CallbackQuery):
+    async def handle_compression_callback(self, callback: CallbackQuery, data: str, token: str):
         """Handle compression-related callbacks"""
         try:
-            data = callback.data
-            user_id = callback.from_user.id
-            settings = self.bot.user_data[user_id]['compress_settings']
+            settings = self.bot.user_data[token]['compress_settings']
 
-            if data.startswith("res_"):
-                resolution = data.split("_")[1]
+            if data.startswith("compress_res_"):
+                resolution = data.split("_")[2]
                 settings['resolution'] = resolution
-            elif data.startswith("quality_"):
-                quality = data.split("_")[1]
+            elif data.startswith("compress_quality_"):
+                quality = data.split("_")[2]
                 settings['quality'] = quality
                 # Set corresponding CRF and preset
                 preset = self.bot.config.COMPRESSION_PRESETS[quality]
                 settings['crf'] = preset['crf']
                 settings['preset'] = preset['preset']
+            elif data == "compress_autocrop":
+                settings['autocrop'] = not settings.get('autocrop')
+            elif data == "compress_preview":
+                if not settings.get('resolution') or not settings.get('quality'):
+                    await callback.answer(
+                        "⚠️ Please select both resolution and quality!",
+                        show_alert=True
+                    )
+                    return
+                await self.start_preview(callback, token)
+                return
             elif data == "compress_start":
                 if not settings.get('resolution') or not settings.get('quality'):
                     await callback.answer(
@@ -101,17 +126,27 @@ class CallbackHandler:
                         show_alert=True
                     )
                     return
-                await self.start_compression(callback)
+                await self.start_compression(callback, token)
+                return
+            elif data == "compress_ladder":
+                if not settings.get('quality'):
+                    await callback.answer(
+                        "⚠️ Please select a quality first!",
+                        show_alert=True
+                    )
+                    return
+                await self.start_ladder(callback, token)
                 return
 
             # Update menu
-            keyboard = self.keyboard.get_compression_keyboard(settings)
+            keyboard = self.keyboard.get_compression_keyboard(settings, token)
             await callback.message.edit_text(
                 "**🎯 Compression Settings**\n\n"
                 f"Resolution: {settings.get('resolution', 'Not Set')}\n"
                 f"Quality: {settings.get('quality', 'Not Set')}\n"
                 f"CRF: {settings.get('crf', 'Auto')}\n"
-                f"Preset: {settings.get('preset', 'Auto')}\n\n"
+                f"Preset: {settings.get('preset', 'Auto')}\n"
+                f"Auto-crop: {'On' if settings.get('autocrop') else 'Off'}\n\n"
                 "Select your settings:",
                 reply_markup=keyboard
             )
@@ -120,37 +155,683 @@ class CallbackHandler:
             logger.error(f"Error handling compression callback: {e}")
             await self.handle_error(callback)
 
-    async def start_compression(self, callback: CallbackQuery):
+    async def start_compression(self, callback: CallbackQuery, token: str):
         """Start video compression process"""
+        user_id = callback.from_user.id
+        if not await self.acquire_job_slot(callback, user_id, token):
+            return
+
         try:
-            user_id = callback.from_user.id
-            settings = self.bot.user_data[user_id]['compress_settings']
+            session = self.bot.user_data[token]
+            settings = session['compress_settings']
+
+            # Only now is the whole file needed
+            if not await self.bot.download_session_file(token, callback.message):
+                return
             
             await callback.message.edit_text(
                 "**🔄 Starting Compression**\n\n"
                 "⏳ Please wait while I process your video..."
             )
 
-            # Process video
-            success = await self.video_processor.compress_video(
-                self.bot.user_data[user_id]['file_path'],
-                settings,
-                callback.message
+            # Operations queued earlier in the session are fused with the encode
+            queued = session.get('graph')
+            graph = OperationGraph.from_list(queued) if queued else None
+
+            # Process video once the scheduler grants a slot
+            result = await self.run_scheduled(
+                callback,
+                session,
+                lambda: self.processor.compress_video(
+                    session['file_path'],
+                    settings,
+                    callback.message,
+                    graph=graph
+                ),
+                [settings.get('resolution')],
+                settings.get('quality')
             )
 
-            if success:
+            if result:
+                # Attributes come from the plan that was encoded, not a probe of the output
+                if await self.send_output(
+                    callback, session, result['path'], result['metadata'], "compressed"
+                ):
+                    await callback.message.edit_text("✅ Video compressed successfully!")
+            else:
                 await callback.message.edit_text(
-                    "✅ Video compressed successfully!"
+                    "❌ Compression failed. Please try again."
                 )
+
+        except Exception as e:
+            logger.error(f"Error starting compression: {e}")
+            await self.handle_error(callback)
+
+        finally:
+            self.bot.release_job_slot(user_id, token)
+
+    async def send_output(
+        self,
+        callback: CallbackQuery,
+        session,
+        output_path: str,
+        metadata: Dict,
+        prefix: str
+    ) -> bool:
+        """Upload a processed file back to the chat it came from"""
+        try:
+            await callback.message.edit_text(
+                "**📤 Uploading**\n\n"
+                "⏳ Please wait..."
+            )
+            name = os.path.splitext(session['file_name'])[0]
+            progress = ProgressHandler()
+            sent = await self.bot.uploader.send_video(
+                callback.message.chat.id,
+                output_path,
+                metadata,
+                file_name=f"{prefix}_{name}{os.path.splitext(output_path)[1]}",
+                reply_to=session['message_id'],
+                progress=progress.update_progress,
+                progress_args=(callback.message, "📤 Uploading")
+            )
+        finally:
+            # Outputs run to gigabytes, a failed upload must not leave one behind
+            self.remove_output(output_path)
+
+        if not sent:
+            await callback.message.edit_text(
+                "❌ Upload failed. Please try again."
+            )
+            return False
+        return True
+
+    @staticmethod
+    def remove_output(path: str):
+        """Delete a processed file once its upload is over"""
+        try:
+            if os.path.isfile(path):
+                os.remove(path)
+        except Exception as e:
+            logger.error(f"Error removing {path}: {e}")
+
+    async def send_bundle(
+        self,
+        callback: CallbackQuery,
+        session,
+        directory: str,
+        prefix: str
+    ) -> bool:
+        """Upload every output in a directory as a single streamed ZIP"""
+        await callback.message.edit_text(
+            "**📤 Uploading**\n\n"
+            "⏳ Please wait..."
+        )
+        bundler = self.video_processor.bundler
+        name = f"{prefix}_{os.path.splitext(session['file_name'])[0]}"
+        progress = ProgressHandler()
+        sent = None
+        try:
+            # Sources stay on disk until the upload went through, so a
+            # failed attempt can be streamed again
+            for _ in range(self.bot.config.BUNDLE_UPLOAD_ATTEMPTS):
+                sent = await self.bot.uploader.send_stream(
+                    callback.message.chat.id,
+                    bundler.zip_stream(bundler.directory_files(directory, prefix=name), remove=False),
+                    f"{name}.zip",
+                    reply_to=session['message_id'],
+                    size_hint=bundler.directory_size(directory),
+                    progress=progress.update_progress,
+                    progress_args=(callback.message, "📤 Uploading")
+                )
+                if sent:
+                    break
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        if not sent:
+            await callback.message.edit_text(
+                "❌ Upload failed. Please try again."
+            )
+            return False
+        return True
+
+    async def start_preview(self, callback: CallbackQuery, token: str):
+        """Encode short samples and show the projected size and time"""
+        user_id = callback.from_user.id
+        if not await self.acquire_job_slot(callback, user_id, token):
+            return
+
+        try:
+            session = self.bot.user_data[token]
+            settings = session['compress_settings']
+            if not await self.bot.download_session_file(token, callback.message):
+                return
+
+            queued = session.get('graph')
+            graph = OperationGraph.from_list(queued) if queued else None
+            # With the analyses cached it's a few seconds of work, worth pausing
+            # a long encode for; otherwise the analysis pass queues like an encode
+            interactive = self.video_processor.analyses_cached(session['file_path'], settings)
+            cost = 1.0
+            if not interactive:
+                probe_data = await self.video_processor.ffmpeg.probe_video(session['file_path'])
+                duration = float(probe_data['format'].get('duration') or 0)
+                cost = duration / self.bot.config.FRAME_ANALYSIS_SPEED
+            preview = await self.bot.scheduler.submit(
+                lambda: self.video_processor.preview(
+                    session['file_path'],
+                    settings,
+                    callback.message,
+                    graph=graph
+                ),
+                user_id=session['user_id'],
+                chat_id=session.get('chat_id'),
+                cost=cost,
+                interactive=interactive
+            )
+            # preview already explained a None result
+            if not preview:
+                return
+
+            projection = (
+                f"💾 Projected Size: {SizeFormatter.format_size(preview['size'])}\n"
+                f"⏱ Projected Time: {TimeFormatter.format_duration(preview['seconds'])}"
+            )
+            name = os.path.splitext(session['file_name'])[0]
+            try:
+                sent = await self.bot.uploader.send_video(
+                    callback.message.chat.id,
+                    preview['path'],
+                    preview['metadata'],
+                    file_name=f"preview_{name}{os.path.splitext(preview['path'])[1]}",
+                    caption="**👁 Preview**\n\n" + projection,
+                    reply_to=session['message_id']
+                )
+            finally:
+                self.remove_output(preview['path'])
+
+            await callback.message.edit_text(
+                "**🎯 Compression Settings**\n\n"
+                + ("" if sent else "⚠️ Couldn't send the preview clip.\n")
+                + projection
+                + "\n\nStart the compression or change the settings:",
+                reply_markup=self.keyboard.get_compression_keyboard(settings, token)
+            )
+
+        except Exception as e:
+            logger.error(f"Error starting preview: {e}")
+            await self.handle_error(callback)
+
+        finally:
+            self.bot.release_job_slot(user_id, token)
+
+    async def start_ladder(self, callback: CallbackQuery, token: str):
+        """Start multi-resolution compression from a single decode"""
+        user_id = callback.from_user.id
+        if not await self.acquire_job_slot(callback, user_id, token):
+            return
+
+        try:
+            session = self.bot.user_data[token]
+            settings = session['compress_settings']
+            resolutions = self.bot.config.LADDER_RESOLUTIONS
+
+            if not await self.bot.download_session_file(token, callback.message):
+                return
+
+            # The ladder is built from the source, not the session graph;
+            # queued edits stay queued for a single compression or ✅ Process
+            skipped = (
+                "📝 Queued edits are not applied to the renditions\n"
+                if session.get('graph') else ""
+            )
+
+            await callback.message.edit_text(
+                "**🔄 Starting Compression**\n\n"
+                f"Renditions: {', '.join(resolutions)}\n"
+                + skipped +
+                "⏳ Please wait while I process your video..."
+            )
+
+            outputs = await self.run_scheduled(
+                callback,
+                session,
+                lambda: self.processor.compress_ladder(
+                    session['file_path'],
+                    settings,
+                    callback.message,
+                    resolutions=resolutions
+                ),
+                resolutions,
+                settings.get('quality')
+            )
+
+            if outputs:
+                # Every rendition (or the packaged HLS/DASH tree) goes up as one ZIP
+                if await self.send_bundle(
+                    callback, session, os.path.dirname(outputs[0]), "renditions"
+                ):
+                    await callback.message.edit_text(
+                        f"✅ Video compressed into {len(outputs)} output(s)!"
+                    )
             else:
                 await callback.message.edit_text(
                     "❌ Compression failed. Please try again."
                 )
 
         except Exception as e:
-            logger.error(f"Error starting compression: {e}")
+            logger.error(f"Error starting ladder compression: {e}")
+            await self.handle_error(callback)
+
+        finally:
+            self.bot.release_job_slot(user_id, token)
+
+    async def handle_audio_menu(self, callback: CallbackQuery, token: str):
+        """Show the audio tracks menu"""
+        try:
+            probe_data = await self.session_probe(callback, token)
+            if probe_data is None:
+                return
+
+            session = self.bot.user_data[token]
+            tracks = self.remaining_audio_tracks(session, probe_data)
+            if not tracks:
+                await callback.answer("⚠️ This video has no audio tracks.", show_alert=True)
+                return
+
+            await callback.message.edit_text(
+                "**🔊 Audio Tracks**\n\n"
+                f"Tracks: {len(tracks)}\n"
+                + self.queued_text(session)
+                + "\nSelect tracks or an operation:",
+                reply_markup=self.keyboard.get_audio_keyboard(
+                    tracks,
+                    session.get('audio_selected', []),
+                    token
+                )
+            )
+
+        except Exception as e:
+            logger.error(f"Error showing audio menu: {e}")
             await self.handle_error(callback)
 
+    async def handle_audio_callback(self, callback: CallbackQuery, data: str, token: str):
+        """Handle audio-related callbacks"""
+        if data.startswith("audio_select_"):
+            session = self.bot.user_data[token]
+            selected = list(session.get('audio_selected') or [])
+            index = int(data.split("_")[2])
+            if index in selected:
+                selected.remove(index)
+            else:
+                selected.append(index)
+            session['audio_selected'] = selected
+            self.bot.user_data[token] = session
+            await self.handle_audio_menu(callback, token)
+        elif data == "audio_extract":
+            await self.start_audio_extraction(callback, token)
+        elif data == "audio_normalize":
+            await self.start_normalization(callback, token)
+        elif data == "audio_remove":
+            await self.queue_audio_removal(callback, token)
+        elif data == "audio_process":
+            await self.start_edits(callback, token)
+        else:
+            await callback.answer("🚧 Feature under development")
+
+    def remaining_audio_tracks(self, session, probe_data: Dict) -> List[Dict]:
+        """Audio tracks of the source that the queued edits still keep"""
+        tracks = MediaInfo(probe_data).get_audio_tracks()
+        state = self.compiler.reduce(self.session_graph(session), probe_data)
+        if state['audio'] is None:
+            return tracks
+        return [tracks[position] for position in state['audio']]
+
+    async def queue_audio_removal(self, callback: CallbackQuery, token: str):
+        """Queue the removal of the selected tracks in the session graph"""
+        try:
+            session = self.bot.user_data[token]
+            selected = session.get('audio_selected') or []
+            if not selected:
+                await callback.answer("⚠️ Please select at least one track!", show_alert=True)
+                return
+
+            probe_data = await self.session_probe(callback, token)
+            if probe_data is None:
+                return
+
+            session = self.bot.user_data[token]
+            # Positions count only the tracks earlier removals left
+            remaining = self.remaining_audio_tracks(session, probe_data)
+            positions = [
+                position for position, track in enumerate(remaining)
+                if track['index'] in selected
+            ]
+            if not positions:
+                await callback.answer("⚠️ Please select at least one track!", show_alert=True)
+                return
+            graph = self.session_graph(session)
+            graph.select_streams(drop_audio=positions)
+            session['audio_selected'] = []
+            self.store_graph(token, session, graph)
+
+            await callback.answer(f"🗑 {len(positions)} track(s) will be removed")
+            await self.handle_audio_menu(callback, token)
+
+        except Exception as e:
+            logger.error(f"Error queuing audio removal: {e}")
+            await self.handle_error(callback)
+
+    async def start_audio_extraction(self, callback: CallbackQuery, token: str):
+        """Send the selected audio tracks together as one Matroska file"""
+        session = self.bot.user_data[token]
+        selected = sorted(session.get('audio_selected') or [])
+        if not selected:
+            await callback.answer("⚠️ Please select at least one track!", show_alert=True)
+            return
+
+        user_id = callback.from_user.id
+        if not await self.acquire_job_slot(callback, user_id, token):
+            return
+
+        try:
+            if not await self.bot.download_session_file(token, callback.message):
+                return
+
+            await callback.message.edit_text(
+                "**📤 Extracting Audio**\n\n"
+                f"Tracks: {len(selected)}\n"
+                "⏳ Please wait..."
+            )
+            name = os.path.splitext(session['file_name'])[0]
+            output_path = await self.file_manager.create_temp_file(prefix="audio_", suffix=".mka")
+            # Stream copy takes seconds, it borrows a slot instead of queuing
+            # behind encodes; the upload runs after the slot is given back
+            muxed = await self.bot.scheduler.submit(
+                lambda: self.video_processor.bundler.mux_audio(
+                    session['file_path'],
+                    selected,
+                    output_path
+                ),
+                user_id=session['user_id'],
+                chat_id=session.get('chat_id'),
+                interactive=True
+            )
+            sent = None
+            try:
+                if muxed:
+                    progress = ProgressHandler()
+                    sent = await self.bot.uploader.send_video(
+                        callback.message.chat.id,
+                        output_path,
+                        file_name=f"audio_{name}.mka",
+                        reply_to=session['message_id'],
+                        progress=progress.update_progress,
+                        progress_args=(callback.message, "📤 Uploading")
+                    )
+            finally:
+                self.remove_output(output_path)
+
+            if sent:
+                await callback.message.edit_text(
+                    f"✅ Extracted {len(selected)} audio track(s)!"
+                )
+            else:
+                await callback.message.edit_text(
+                    "❌ Extraction failed. Please try again."
+                )
+
+        except Exception as e:
+            logger.error(f"Error extracting audio: {e}")
+            await self.handle_error(callback)
+
+        finally:
+            self.bot.release_job_slot(user_id, token)
+
+    async def start_normalization(self, callback: CallbackQuery, token: str):
+        """Normalize the loudness of every audio track and send the result"""
+        user_id = callback.from_user.id
+        if not await self.acquire_job_slot(callback, user_id, token):
+            return
+
+        try:
+            session = self.bot.user_data[token]
+            if not await self.bot.download_session_file(token, callback.message):
+                return
+
+            probe_data = await self.video_processor.ffmpeg.probe_video(session['file_path'])
+            duration = float(probe_data['format'].get('duration') or 0)
+            output_path = await self.bot.scheduler.submit(
+                lambda: self.video_processor.normalize_audio(
+                    session['file_path'],
+                    callback.message
+                ),
+                user_id=session['user_id'],
+                chat_id=session.get('chat_id'),
+                cost=duration / self.bot.config.LOUDNESS_SPEED
+            )
+
+            # normalize_audio already explained a None result
+            if output_path:
+                metadata = self.video_processor.ffmpeg.compiler.output_metadata(
+                    OperationGraph(),
+                    probe_data
+                )
+                if await self.send_output(callback, session, output_path, metadata, "normalized"):
+                    await callback.message.edit_text("✅ Audio normalized successfully!")
+
+        except Exception as e:
+            logger.error(f"Error starting normalization: {e}")
+            await self.handle_error(callback)
+
+        finally:
+            self.bot.release_job_slot(user_id, token)
+
+    async def handle_cut_menu(self, callback: CallbackQuery, token: str):
+        """Show the cut menu, the window starts as the whole (already cut) video"""
+        try:
+            probe_data = await self.session_probe(callback, token)
+            if probe_data is None:
+                return
+
+            session = self.bot.user_data[token]
+            duration = self.compiler.output_metadata(self.session_graph(session), probe_data)['duration']
+            cut = session.get('cut') or {'start': 0.0, 'end': duration}
+            session['cut'] = cut
+            self.bot.user_data[token] = session
+
+            await callback.message.edit_text(
+                "**✂️ Cut**\n\n"
+                f"Length: {TimeFormatter.format_duration(duration)}\n"
+                f"Keep: {TimeFormatter.format_duration(cut['start'])} → "
+                f"{TimeFormatter.format_duration(cut['end'])}\n"
+                + self.queued_text(session)
+                + "\nMove the start (⏮) and end (⏭), then apply the cut:",
+                reply_markup=self.keyboard.get_cut_keyboard(token)
+            )
+
+        except Exception as e:
+            logger.error(f"Error showing cut menu: {e}")
+            await self.handle_error(callback)
+
+    async def handle_cut_callback(self, callback: CallbackQuery, data: str, token: str):
+        """Handle cut-related callbacks"""
+        try:
+            if data == "cut_process":
+                await self.start_edits(callback, token)
+                return
+
+            probe_data = await self.session_probe(callback, token)
+            if probe_data is None:
+                return
+            session = self.bot.user_data[token]
+            graph = self.session_graph(session)
+            duration = self.compiler.output_metadata(graph, probe_data)['duration']
+            cut = session.get('cut') or {'start': 0.0, 'end': duration}
+
+            if data == "cut_apply":
+                if cut['start'] <= 0 and cut['end'] >= duration:
+                    await callback.answer("⚠️ Move the start or end first!", show_alert=True)
+                    return
+                # Relative to earlier cuts, so cuts chain
+                graph.trim(start=cut['start'], end=cut['end'])
+                session['cut'] = None
+                self.store_graph(token, session, graph)
+                await callback.answer("✂️ Cut queued")
+            else:
+                _, edge, delta = data.split("_")
+                # Keep at least a second between start and end
+                if edge == "start":
+                    cut['start'] = max(0.0, min(cut['start'] + int(delta), cut['end'] - 1))
+                else:
+                    cut['end'] = min(duration, max(cut['end'] + int(delta), cut['start'] + 1))
+                session['cut'] = cut
+                self.bot.user_data[token] = session
+
+            await self.handle_cut_menu(callback, token)
+
+        except Exception as e:
+            logger.error(f"Error handling cut callback: {e}")
+            await self.handle_error(callback)
+
+    async def start_edits(self, callback: CallbackQuery, token: str):
+        """Apply the queued edits with stream copy and send the result"""
+        session = self.bot.user_data[token]
+        if not session.get('graph'):
+            await callback.answer("⚠️ No edits queued yet!", show_alert=True)
+            return
+
+        user_id = callback.from_user.id
+        if not await self.acquire_job_slot(callback, user_id, token):
+            return
+
+        try:
+            if not await self.bot.download_session_file(token, callback.message):
+                return
+
+            await callback.message.edit_text(
+                "**🔄 Applying Edits**\n\n"
+                "⏳ Please wait..."
+            )
+            graph = self.session_graph(session)
+            probe_data = await self.video_processor.ffmpeg.probe_video(session['file_path'])
+            metadata = self.compiler.output_metadata(graph, probe_data)
+            output_path = await self.bot.scheduler.submit(
+                lambda: self.video_processor.process_graph(
+                    session['file_path'],
+                    graph,
+                    callback.message
+                ),
+                user_id=session['user_id'],
+                chat_id=session.get('chat_id'),
+                cost=metadata['duration'] / self.bot.config.COPY_SPEED
+            )
+
+            if output_path:
+                if await self.send_output(callback, session, output_path, metadata, "edited"):
+                    # Delivered, later operations start from the source again
+                    self.store_graph(token, session, OperationGraph())
+                    await callback.message.edit_text("✅ Edits applied successfully!")
+            else:
+                await callback.message.edit_text(
+                    "❌ Processing failed. Please try again."
+                )
+
+        except Exception as e:
+            logger.error(f"Error applying edits: {e}")
+            await self.handle_error(callback)
+
+        finally:
+            self.bot.release_job_slot(user_id, token)
+
+    async def session_probe(self, callback: CallbackQuery, token: str) -> Optional[Dict]:
+        """Probe data of the session's video, downloading it if inspection had none"""
+        session = self.bot.user_data[token]
+        probe_data = session.get('probe_data')
+        if probe_data is None:
+            file_path = await self.bot.download_session_file(token, callback.message)
+            if not file_path:
+                return None
+            probe_data = await self.video_processor.ffmpeg.probe_video(file_path)
+            session['probe_data'] = probe_data
+            self.bot.user_data[token] = session
+        return probe_data
+
+    @staticmethod
+    def session_graph(session) -> OperationGraph:
+        """The edits queued in a session so far"""
+        return OperationGraph.from_list(session.get('graph') or [])
+
+    def store_graph(self, token: str, session, graph: OperationGraph):
+        """Save the queued edits, the next compression or process applies them"""
+        session['graph'] = graph.to_list()
+        self.bot.user_data[token] = session
+
+    @staticmethod
+    def queued_text(session) -> str:
+        """Menu line listing how many edits are waiting"""
+        queued = len(session.get('graph') or [])
+        if not queued:
+            return ""
+        return f"📝 Queued edits: {queued} (applied with the next single-size compression or ✅ Process)\n"
+
+    async def run_scheduled(
+        self,
+        callback: CallbackQuery,
+        session,
+        func,
+        resolutions: List[Optional[str]],
+        quality: Optional[str] = None
+    ):
+        """Run processing work through the shared fair-share scheduler"""
+        scheduler = self.bot.scheduler
+        probe_data = await self.video_processor.ffmpeg.probe_video(session['file_path'])
+        predictions = [
+            scheduler.predict(probe_data, resolution, quality)
+            for resolution in resolutions
+        ]
+        cost = sum(prediction['seconds'] for prediction in predictions)
+
+        estimate = f"⏱ Estimated Time: {TimeFormatter.format_duration(cost)}\n"
+        if all(prediction['size'] for prediction in predictions):
+            size = sum(prediction['size'] for prediction in predictions)
+            estimate += f"💾 Estimated Size: {SizeFormatter.format_size(size)}\n"
+
+        if len(scheduler.running) >= scheduler.slots:
+            wait = scheduler.estimate_wait()
+            await callback.message.edit_text(
+                "**🕒 Queued**\n\n"
+                f"Jobs waiting: {scheduler.waiting + 1}\n"
+                f"⌛ Estimated Wait: {TimeFormatter.format_duration(wait)}\n"
+                + estimate
+            )
+        else:
+            await callback.message.edit_text(
+                "**🔄 Starting Compression**\n\n"
+                + estimate
+                + "⏳ Please wait while I process your video..."
+            )
+
+        return await scheduler.submit(
+            func,
+            user_id=session['user_id'],
+            chat_id=session.get('chat_id'),
+            cost=cost
+        )
+
+    async def acquire_job_slot(self, callback: CallbackQuery, user_id: int, token: str) -> bool:
+        """Reserve one of the user's concurrent job slots, pinning the session"""
+        if self.bot.try_acquire_job_slot(user_id, token):
+            return True
+        await callback.answer(
+            "⚠️ You already have "
+            f"{self.bot.config.MAX_JOBS_PER_USER} jobs running. "
+            "Please wait for one to finish.",
+            show_alert=True
+        )
+        return False
+
     async def handle_error(self, callback: CallbackQuery):
         """Handle errors in callback processing"""
         try:
@@ -161,13 +842,22 @@ class CallbackHandler:
         except:
             pass
 
-    async def handle_cancel(self, callback: CallbackQuery, user_id: int):
+    async def handle_cancel(self, callback: CallbackQuery, token: str):
         """Handle cancel button"""
         try:
-            # Cleanup user data
-            await self.file_manager.cleanup_user_files(user_id)
-            if user_id in self.bot.user_data:
-                del self.bot.user_data[user_id]
+            # Cleanup this session only, other jobs of the user keep running
+            session = self.bot.get_session(token, callback.from_user.id)
+            if session and self.bot.user_data.is_pinned(token):
+                # Its job still reads the input, deleting it would break the encode
+                await callback.answer(
+                    "⏳ A job is still running on this video. "
+                    "Cancel once it has finished.",
+                    show_alert=True
+                )
+                return
+            if session:
+                self.bot.release_session(token, session)
+                del self.bot.user_data[token]
             
             # Delete message
             await callback.message.delete()
@@ -28,9 +28,11 @@ class MessageHandler:
                 )
                 return
 
-            # Store file info
-            user_id = message.from_user.id
-            self.bot.user_data[user_id] = {
+            # Store file info, keyed by a per-message session token
+            token = self.bot.new_session_token()
+            self.bot.user_data[token] = {
+                'user_id': message.from_user.id,
+                'chat_id': message.chat.id,
                 'file_id': message.video.file_id if message.video else message.document.file_id,
                 'file_name': message.video.file_name if message.video else message.document.file_name,
                 'file_size': message.video.file_size if message.video else message.document.file_size,
@@ -39,11 +41,11 @@ class MessageHandler:
             }
 
             # Show main menu
-            keyboard = self.keyboard.get_main_keyboard()
+            keyboard = self.keyboard.get_main_keyboard(token)
             await progress_msg.edit_text(
                 "**🎥 Video Processor**\n\n"
-                f"File: `{self.bot.user_data[user_id]['file_name']}`\n"
-                f"Size: {await self.file_manager.format_size(self.bot.user_data[user_id]['file_size'])}\n\n"
+                f"File: `{self.bot.user_data[token]['file_name']}`\n"
+                f"Size: {await self.file_manager.format_size(self.bot.user_data[token]['file_size'])}\n\n"
                 "Select an operation:",
                 reply_markup=keyboard
             )
@@ -4,6 +4,7 @@ import logging
 from typing import Dict, Optional, Union
 from pyrogram.types import Message
 from datetime import datetime
+from processors.job_scheduler import current_job
 
 logger = logging.getLogger(__name__)
 
@@ -45,8 +46,10 @@ class ProgressHandler:
             if now - self.last_update_time < self.update_interval:
                 return
 
-            # Calculate progress metrics
-            elapsed_time = now - self.start_time
+            # Calculate progress metrics, excluding time the job spent preempted
+            job = current_job.get()
+            paused = job.paused_seconds() if job is not None else 0
+            elapsed_time = max(0, now - self.start_time - paused)
             percentage = (current * 100) / total if total > 0 else 0
             speed = current / elapsed_time if elapsed_time > 0 else 0
             eta = (total - current) / speed if speed > 0 else 0
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import os
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class BatchPipeline:
+    """Three-stage download → process → upload pipeline for a batch of files
+
+    File N+1 downloads while file N is encoding and file N-1 is uploading,
+    so network and CPU work overlap instead of running back to back.
+    """
+
+    def __init__(
+        self,
+        download: Callable,
+        process: Callable,
+        upload: Callable,
+        prefetch: int = 1,
+        on_update: Optional[Callable] = None
+    ):
+        self.download = download
+        self.process = process
+        self.upload = upload
+        self.prefetch = prefetch
+        self.on_update = on_update
+        self.status: Dict[str, int] = {
+            'downloaded': 0,
+            'processed': 0,
+            'uploaded': 0,
+            'failed': 0
+        }
+
+    async def run(self, items: List[Any]) -> List[Optional[Any]]:
+        """Run every item through the pipeline, returning per-item upload results"""
+        results: List[Optional[Any]] = [None] * len(items)
+        to_process: asyncio.Queue = asyncio.Queue()
+        to_upload: asyncio.Queue = asyncio.Queue()
+
+        # Bounds how far downloads run ahead of encoding (disk usage)
+        ahead = asyncio.Semaphore(self.prefetch + 1)
+
+        async def download_stage():
+            for index, item in enumerate(items):
+                await ahead.acquire()
+                path = await self._run_stage(self.download, 'downloaded', item)
+                await to_process.put((index, item, path))
+            await to_process.put(None)
+
+        async def process_stage():
+            while True:
+                entry = await to_process.get()
+                if entry is None:
+                    break
+                index, item, path = entry
+                output = None
+                if path:
+                    output = await self._run_stage(self.process, 'processed', item, path)
+                    self._remove(path)
+                ahead.release()
+                await to_upload.put((index, item, output))
+            await to_upload.put(None)
+
+        async def upload_stage():
+            while True:
+                entry = await to_upload.get()
+                if entry is None:
+                    break
+                index, item, output = entry
+                if output:
+                    results[index] = await self._run_stage(
+                        self.upload, 'uploaded', item, output
+                    )
+                    self._remove(output)
+
+        stages = [
+            asyncio.create_task(download_stage()),
+            asyncio.create_task(process_stage()),
+            asyncio.create_task(upload_stage())
+        ]
+        try:
+            await asyncio.gather(*stages)
+        except BaseException:
+            for task in stages:
+                task.cancel()
+            raise
+
+        return results
+
+    async def _run_stage(self, func: Callable, counter: str, *args) -> Optional[Any]:
+        """Run one stage for one item, isolating failures to that item"""
+        try:
+            result = await func(*args)
+        except Exception as e:
+            logger.error(f"Error in batch stage '{counter}': {e}")
+            result = None
+
+        if result:
+            self.status[counter] += 1
+        else:
+            self.status['failed'] += 1
+
+        if self.on_update:
+            try:
+                await self.on_update(dict(self.status))
+            except Exception as e:
+                logger.error(f"Error updating batch status: {e}")
+
+        return result
+
+    @staticmethod
+    def _remove(path: str):
+        """Delete an intermediate file once the next stage is done with it"""
+        try:
+            if os.path.isfile(path):
+                os.remove(path)
+        except Exception as e:
+            logger.error(f"Error removing {path}: {e}")
@@ -0,0 +1,149 @@
+import io
+import os
+import asyncio
+import logging
+import zipfile
+from typing import AsyncIterable, AsyncIterator, List, Tuple
+from config import Config
+from .ffmpeg_processor import FFmpegProcessor
+
+logger = logging.getLogger(__name__)
+
+class _ZipSink(io.RawIOBase):
+    """Unseekable target for ZipFile; written bytes are collected until drained"""
+
+    def __init__(self):
+        super().__init__()
+        self.buffer = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.buffer += data
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+class Bundler:
+    """Stream the outputs of a multi-output job into one container
+
+    Outputs are never archived on disk first: they go into a ZIP that is
+    built as each file is read, optionally removing every source once it is
+    in the archive. The result is an async byte stream for
+    ``Uploader.send_stream``, so the whole job goes up as one message.
+    Selected audio tracks are copied into a single Matroska file instead,
+    a short job that can run in an interactive slot.
+    """
+
+    # Text outputs are deflated, media is already compressed and only stored
+    COMPRESSIBLE = {'.m3u8', '.mpd', '.srt', '.vtt', '.ass', '.ssa', '.txt', '.json', '.xml'}
+    READ_SIZE = 1024 * 1024
+
+    def __init__(self, ffmpeg: FFmpegProcessor):
+        self.config = Config()
+        self.ffmpeg = ffmpeg
+
+    async def mux_audio(self, input_path: str, stream_indices: List[int], output_path: str) -> bool:
+        """Copy the given streams (absolute indices) into one Matroska file"""
+        cmd = ["ffmpeg", "-hide_banner", "-nostats", "-i", input_path]
+        for index in stream_indices:
+            cmd.extend(["-map", f"0:{index}"])
+        cmd.extend(["-map_metadata", "0", "-c", "copy", "-f", "matroska", "-y", output_path])
+
+        probe_data = await self.ffmpeg.probe_video(input_path)
+        duration = float(probe_data.get('format', {}).get('duration') or 0)
+        result = await self.ffmpeg.supervisor.run(
+            cmd,
+            budget=self.ffmpeg.supervisor.budget(duration),
+            stall_timeout=self.config.FFMPEG_STALL_TIMEOUT
+        )
+        if not result.ok:
+            logger.error(f"Error muxing audio: {result.killed or result.stderr}")
+        return result.ok
+
+    async def command_stream(self, cmd: List[str], duration: float = 0) -> AsyncIterator[bytes]:
+        """Yield a command's stdout as it is produced
+
+        The queue is bounded, so a slow upload holds ffmpeg back instead of
+        buffering the whole output in memory.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.config.BUNDLE_BUFFER_CHUNKS)
+
+        async def on_stdout(chunk: bytes):
+            await queue.put(chunk)
+
+        async def run():
+            try:
+                return await self.ffmpeg.supervisor.run(
+                    cmd,
+                    budget=self.ffmpeg.supervisor.budget(duration),
+                    stall_timeout=self.config.FFMPEG_STALL_TIMEOUT,
+                    on_stdout=on_stdout
+                )
+            finally:
+                await queue.put(None)
+
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                chunk = await queue.get()
+                if chunk is None:
+                    break
+                yield chunk
+            result = await task
+            if not result.ok:
+                raise Exception(f"Bundling failed: {result.killed or result.stderr}")
+        finally:
+            if not task.done():
+                task.cancel()
+
+    async def zip_stream(
+        self,
+        files: AsyncIterable[Tuple[str, str]],
+        remove: bool = True
+    ) -> AsyncIterator[bytes]:
+        """Build a ZIP from ``(path, name)`` pairs as they arrive
+
+        Entries use data descriptors, so nothing has to be seeked back to.
+        With ``remove`` each source is deleted once it has been archived.
+        """
+        sink = _ZipSink()
+        with zipfile.ZipFile(sink, mode='w') as archive:
+            async for path, name in files:
+                info = zipfile.ZipInfo.from_file(path, name)
+                if os.path.splitext(name)[1].lower() in self.COMPRESSIBLE:
+                    info.compress_type = zipfile.ZIP_DEFLATED
+                with open(path, 'rb') as source, archive.open(info, 'w') as entry:
+                    while True:
+                        block = source.read(self.READ_SIZE)
+                        if not block:
+                            break
+                        entry.write(block)
+                        if sink.buffer:
+                            yield sink.drain()
+                if remove:
+                    os.remove(path)
+                yield sink.drain()
+        # Central directory
+        yield sink.drain()
+
+    @staticmethod
+    async def directory_files(directory: str, prefix: str = "") -> AsyncIterator[Tuple[str, str]]:
+        """Every file below a directory, named relative to it"""
+        for root, _, names in os.walk(directory):
+            for name in sorted(names):
+                path = os.path.join(root, name)
+                yield path, os.path.join(prefix, os.path.relpath(path, directory))
+
+    @staticmethod
+    def directory_size(directory: str) -> int:
+        """Total size of the files below a directory"""
+        return sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, _, names in os.walk(directory)
+            for name in names
+        )
@@ -0,0 +1,192 @@
+import os
+import sqlite3
+import statistics
+import time
+import logging
+from typing import Dict, List, Optional
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class CostModel:
+    """Learned encode cost from completed jobs (SQLite)
+
+    Every finished encode records its features and measured run time and
+    output size. Predictions use the median of the most recent matching
+    samples, normalized per second of media and per pixel of work (output
+    pixels encoded plus a share for the source pixels decoded), and widen
+    the match (codec, then target size) until enough samples are found.
+    Without history they fall back to the static preset heuristic.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.config = Config()
+        self.db_path = str(db_path or self.config.COST_MODEL_PATH)
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.create_tables()
+        self.prune()
+
+    def create_tables(self):
+        """Create sample table"""
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS samples (
+                src_codec TEXT,
+                src_height INTEGER,
+                target_height INTEGER NOT NULL,
+                preset TEXT NOT NULL,
+                crf INTEGER,
+                duration REAL NOT NULL,
+                seconds REAL NOT NULL,
+                output_bytes INTEGER,
+                recorded REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS samples_match
+                ON samples (preset, target_height, src_codec, recorded);
+            """
+        )
+
+    def features(
+        self,
+        probe_data: Dict,
+        resolution: Optional[str],
+        quality: Optional[str],
+        duration: Optional[float] = None
+    ) -> Dict:
+        """Describe a job by the inputs that drive its encode cost"""
+        video = next(
+            (s for s in probe_data.get('streams', []) if s.get('codec_type') == 'video'),
+            {}
+        )
+        src_height = int(video.get('height') or 0) or None
+        target = self.config.RESOLUTION_PRESETS.get(resolution)
+        target_height = target['height'] if target else (src_height or 1080)
+        compression = self.config.COMPRESSION_PRESETS.get(quality or 'medium', {})
+
+        if duration is None:
+            duration = float(probe_data.get('format', {}).get('duration', 0))
+
+        return {
+            'src_codec': video.get('codec_name'),
+            'src_height': src_height,
+            'target_height': target_height,
+            'preset': compression.get('preset', 'medium'),
+            'crf': compression.get('crf'),
+            'duration': max(duration, 1.0)
+        }
+
+    def predict(self, features: Dict) -> Dict:
+        """Predict run time (slot seconds) and output size in bytes
+
+        ``size`` is None until the model has seen outputs at this quality.
+        """
+        pixels = self.pixels(features['target_height'])
+        work = self.work(features['src_height'], features['target_height'])
+        duration = features['duration']
+        rate = None
+        size = None
+
+        try:
+            rows = self._match(
+                features,
+                [('preset', 'target_height', 'src_codec'), ('preset', 'target_height'), ('preset',)]
+            )
+            if rows:
+                rate = statistics.median(
+                    row['seconds'] / (row['duration'] * self.work(row['src_height'], row['target_height']))
+                    for row in rows
+                )
+
+            rows = self._match(features, [('crf', 'target_height'), ('crf',)], sized=True)
+            if rows:
+                density = statistics.median(
+                    row['output_bytes'] / (row['duration'] * self.pixels(row['target_height']))
+                    for row in rows
+                )
+                size = int(density * duration * pixels)
+
+        except Exception as e:
+            logger.error(f"Error predicting encode cost: {e}")
+
+        learned = rate is not None
+        if not learned:
+            rate = self.config.COST_MODEL_PRIOR_SPEED * self.config.PRESET_COST.get(
+                features['preset'], 1.0
+            )
+
+        return {
+            'seconds': rate * duration * work,
+            'size': size,
+            'learned': learned
+        }
+
+    def record(self, features: Dict, seconds: float, output_bytes: Optional[int] = None):
+        """Store the measured cost of a finished encode"""
+        try:
+            if seconds <= 0:
+                return
+            self.conn.execute(
+                "INSERT INTO samples VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    features['src_codec'],
+                    features['src_height'],
+                    features['target_height'],
+                    features['preset'],
+                    features['crf'],
+                    features['duration'],
+                    seconds,
+                    output_bytes,
+                    time.time()
+                )
+            )
+            self.prune()
+        except Exception as e:
+            logger.error(f"Error recording encode sample: {e}")
+
+    def prune(self, keep: Optional[int] = None):
+        """Keep only the most recent samples"""
+        try:
+            self.conn.execute(
+                "DELETE FROM samples WHERE rowid NOT IN "
+                "(SELECT rowid FROM samples ORDER BY recorded DESC LIMIT ?)",
+                (keep or self.config.COST_MODEL_KEEP_SAMPLES,)
+            )
+        except Exception as e:
+            logger.error(f"Error pruning encode samples: {e}")
+
+    def close(self):
+        """Close the database"""
+        try:
+            self.conn.close()
+        except Exception as e:
+            logger.error(f"Error closing cost model: {e}")
+
+    @staticmethod
+    def pixels(height: int) -> float:
+        """Output size in 1080p frames (16:9 assumed)"""
+        return (height / 1080) ** 2
+
+    def work(self, src_height: Optional[int], target_height: int) -> float:
+        """Pixels decoded and encoded, 1.0 for a 1080p to 1080p encode"""
+        share = self.config.COST_MODEL_DECODE_SHARE
+        source = self.pixels(src_height or target_height)
+        return (self.pixels(target_height) + share * source) / (1 + share)
+
+    def _match(self, features: Dict, levels: List[tuple], sized: bool = False) -> List[sqlite3.Row]:
+        """Get recent samples at the most specific level that has enough of them"""
+        for columns in levels:
+            clauses = [f"{column} IS ?" for column in columns]
+            if sized:
+                clauses.append("output_bytes IS NOT NULL")
+            rows = self.conn.execute(
+                f"SELECT * FROM samples WHERE {' AND '.join(clauses)} "
+                "ORDER BY recorded DESC LIMIT ?",
+                [features[column] for column in columns] + [self.config.COST_MODEL_MAX_SAMPLES]
+            ).fetchall()
+            if len(rows) >= self.config.COST_MODEL_MIN_SAMPLES:
+                return rows
+        return []
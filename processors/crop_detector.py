@@ -0,0 +1,167 @@
+import os
+import re
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+from config import Config
+from .ffmpeg_processor import FFmpegProcessor
+
+logger = logging.getLogger(__name__)
+
+class CropDetector:
+    """Find letterbox/pillarbox bars from a few short samples of the input
+
+    ``cropdetect`` runs on ``CROP_SAMPLES`` windows spread over the file,
+    several at once. Each window starts exactly on a keyframe so the
+    input-side seek decodes nothing before it. The rectangle covering every
+    sample's picture is used, so a dark scene can't crop a bright one.
+    """
+
+    CROP_PATTERN = re.compile(r"crop=(-?\d+):(-?\d+):(-?\d+):(-?\d+)")
+
+    def __init__(self, ffmpeg: FFmpegProcessor):
+        self.config = Config()
+        self.ffmpeg = ffmpeg
+        self.cache: 'OrderedDict[tuple, Optional[Tuple[int, int, int, int]]]' = OrderedDict()
+
+    async def detect(self, input_path: str) -> Optional[Tuple[int, int, int, int]]:
+        """Crop rectangle (width, height, x, y), or None if not worth cropping"""
+        key = self.cache_key(input_path)
+        if key in self.cache:
+            return self.cached(input_path)
+
+        try:
+            probe_data = await self.ffmpeg.probe_video(input_path)
+            video = next(
+                (s for s in probe_data.get('streams', []) if s.get('codec_type') == 'video'),
+                None
+            )
+            duration = float(probe_data['format'].get('duration') or 0)
+            if video is None or not duration:
+                return None
+            width, height = int(video['width']), int(video['height'])
+
+            positions = await self.sample_positions(input_path, duration)
+            limit = asyncio.Semaphore(self.config.CROP_PARALLEL)
+
+            async def sample(position: float):
+                async with limit:
+                    return await self.sample(input_path, position)
+
+            samples = [
+                crop for crop in await asyncio.gather(*(sample(p) for p in positions))
+                if crop and crop[0] > 0 and crop[1] > 0
+            ]
+            crop = None
+            # Mostly-black files give no usable samples; don't guess from a few
+            if len(samples) * 2 >= len(positions):
+                crop = self.combine(samples, width, height)
+
+            self.cache[key] = crop
+            if len(self.cache) > self.config.PROBE_CACHE_SIZE:
+                self.cache.popitem(last=False)
+            return crop
+
+        except Exception as e:
+            logger.error(f"Error detecting crop: {e}")
+            return None
+
+    def cached(self, input_path: str) -> Optional[Tuple[int, int, int, int]]:
+        """Crop found earlier for a file, None if there is none or it wasn't detected"""
+        key = self.cache_key(input_path)
+        if key not in self.cache:
+            return None
+        self.cache.move_to_end(key)
+        return self.cache[key]
+
+    async def sample_positions(self, input_path: str, duration: float) -> List[float]:
+        """Keyframe times closest to evenly spaced points between 5% and 95%"""
+        count = self.config.CROP_SAMPLES
+        targets = [
+            duration * (0.05 + 0.9 * i / max(1, count - 1))
+            for i in range(count)
+        ]
+
+        # Packet flags come from demuxing alone, nothing is decoded
+        result = await self.ffmpeg.supervisor.run(
+            [
+                "ffprobe", "-v", "error",
+                "-select_streams", "v:0",
+                "-show_entries", "packet=pts_time,flags",
+                "-of", "csv=print_section=0",
+                input_path
+            ],
+            budget=self.config.FFPROBE_TIMEOUT
+        )
+        keyframes = []
+        if result.ok:
+            for line in result.stdout.decode(errors='replace').splitlines():
+                pts, _, flags = line.partition(',')
+                if 'K' in flags:
+                    try:
+                        keyframes.append(float(pts))
+                    except ValueError:
+                        continue
+        if not keyframes:
+            return targets
+
+        positions = []
+        for target in targets:
+            position = min(keyframes, key=lambda k: abs(k - target))
+            if position not in positions:
+                positions.append(position)
+        return positions
+
+    async def sample(self, input_path: str, position: float) -> Optional[Tuple[int, int, int, int]]:
+        """Run cropdetect over a few frames from ``position``"""
+        found = {}
+
+        async def on_line(line: str):
+            match = self.CROP_PATTERN.search(line)
+            if match:
+                found['crop'] = tuple(int(value) for value in match.groups())
+
+        result = await self.ffmpeg.supervisor.run(
+            [
+                "ffmpeg", "-hide_banner", "-nostats",
+                "-ss", f"{position:.3f}",
+                "-i", input_path,
+                "-map", "0:v:0",
+                "-frames:v", str(self.config.CROP_SAMPLE_FRAMES),
+                "-vf", f"cropdetect=limit={self.config.CROP_LIMIT}:round=2:reset=0",
+                "-f", "null", "-"
+            ],
+            on_line=on_line,
+            budget=self.config.FFPROBE_TIMEOUT,
+            stall_timeout=self.config.FFPROBE_TIMEOUT
+        )
+        if not result.ok:
+            return None
+        return found.get('crop')
+
+    def combine(
+        self,
+        samples: List[Tuple[int, int, int, int]],
+        width: int,
+        height: int
+    ) -> Optional[Tuple[int, int, int, int]]:
+        """Union of the sampled rectangles, if it removes enough pixels"""
+        left = max(0, min(x for _, _, x, _ in samples))
+        top = max(0, min(y for _, _, _, y in samples))
+        right = min(width, max(x + w for w, _, x, _ in samples))
+        bottom = min(height, max(y + h for _, h, _, y in samples))
+
+        crop_width = (right - left) // 2 * 2
+        crop_height = (bottom - top) // 2 * 2
+        if crop_width <= 0 or crop_height <= 0:
+            return None
+        saving = 1 - (crop_width * crop_height) / (width * height)
+        if saving < self.config.CROP_MIN_SAVING:
+            return None
+        return (crop_width, crop_height, left, top)
+
+    @staticmethod
+    def cache_key(path: str) -> tuple:
+        stat = os.stat(path)
+        return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
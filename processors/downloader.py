@@ -0,0 +1,234 @@
+import os
+import asyncio
+import logging
+from typing import Callable, Optional
+from pyrogram import Client
+from pyrogram.errors import FloodWait
+from pyrogram.types import Message
+from config import Config
+from utils.metrics import FAILURES, STAGE_SECONDS, failure_cause
+from .transfer_pool import TransferInterrupted, TransferPool
+
+logger = logging.getLogger(__name__)
+
+class ChunkedDownloader:
+    """Download Telegram media over several concurrent ranged streams
+
+    The file is preallocated at full size and split into parts of
+    ``DOWNLOAD_PART_CHUNKS`` chunks; parts are fetched concurrently and
+    written in place. Finished parts are recorded in a bitmap sidecar
+    (``<path>.parts``) that is removed once the file is complete, so an
+    interrupted download resumes with only the missing parts.
+    """
+
+    PARTS_SUFFIX = ".parts"
+
+    # Telegram streams files in fixed 1 MiB chunks; offsets count these
+    STREAM_CHUNK = 1024 * 1024
+
+    def __init__(self, pool: TransferPool):
+        self.config = Config()
+        self.pool = pool
+        self.chunk_size = self.STREAM_CHUNK
+        self.part_chunks = max(
+            1, self.config.CHUNK_SIZE * self.config.DOWNLOAD_PART_CHUNKS // self.STREAM_CHUNK
+        )
+
+    async def download(
+        self,
+        message: Message,
+        path: str,
+        file_size: int,
+        progress: Optional[Callable] = None,
+        progress_args: tuple = ()
+    ) -> str:
+        """Download (or resume) a message's media into ``path``"""
+        if self.is_complete(path) and os.path.getsize(path) == file_size:
+            return path
+
+        try:
+            with STAGE_SECONDS.time(stage="download"):
+                return await self.fetch_parts(message, path, file_size, progress, progress_args)
+        except Exception as e:
+            FAILURES.inc(stage="download", cause=failure_cause(e))
+            raise
+
+    async def fetch_parts(
+        self,
+        message: Message,
+        path: str,
+        file_size: int,
+        progress: Optional[Callable] = None,
+        progress_args: tuple = ()
+    ) -> str:
+        """Fetch the parts the bitmap doesn't have yet"""
+        part_size = self.chunk_size * self.part_chunks
+        part_count = max(1, -(-file_size // part_size))
+        bitmap = self.load_bitmap(path, part_count)
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            self.preallocate(fd, file_size)
+
+            pending = [i for i in range(part_count) if not self.is_set(bitmap, i)]
+            done_bytes = (part_count - len(pending)) * part_size
+            state = {'done': min(done_bytes, file_size)}
+            if len(pending) < part_count:
+                logger.info(f"Resuming download of {path}: {len(pending)}/{part_count} parts left")
+
+            queue: asyncio.Queue = asyncio.Queue()
+            for index in pending:
+                queue.put_nowait(index)
+
+            async def worker():
+                while True:
+                    try:
+                        index = queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        return
+                    first_chunk = index * self.part_chunks
+                    chunks = min(
+                        self.part_chunks,
+                        -(-(file_size - first_chunk * self.chunk_size) // self.chunk_size)
+                    )
+                    # Each part goes to whichever session is least busy
+                    written = await self.pool.run(lambda client: self.fetch_range(
+                        client, message, fd, first_chunk, chunks, state, progress,
+                        progress_args, file_size
+                    ))
+                    # Only a complete part may be recorded, its gaps would stay zeros
+                    if written != self.range_size(first_chunk, chunks, file_size):
+                        raise Exception(f"Part {index} of {path} is incomplete")
+                    os.fdatasync(fd)
+                    self.set_bit(bitmap, index)
+                    self.save_bitmap(path, bitmap)
+
+            connections = self.config.DOWNLOAD_CONNECTIONS * len(self.pool.clients)
+            tasks = [
+                asyncio.create_task(worker())
+                for _ in range(min(connections, len(pending)))
+            ]
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                # Every worker must be gone before the fd is closed, or a late
+                # pwrite lands in whatever file reuses the number
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+
+        finally:
+            os.close(fd)
+
+        # Complete: the sidecar is the only marker of a partial file
+        os.remove(path + self.PARTS_SUFFIX)
+        return path
+
+    async def fetch_range(
+        self,
+        client: Client,
+        message: Message,
+        fd: int,
+        first_chunk: int,
+        chunks: int,
+        state: Optional[dict] = None,
+        progress: Optional[Callable] = None,
+        progress_args: tuple = (),
+        file_size: int = 0
+    ) -> int:
+        """Stream a run of chunks into place, retrying from where it stopped
+
+        Pyrogram ends ``stream_media`` quietly on errors it swallows (long
+        FloodWaits, network and RPC errors). A stream that stops before the
+        range is complete raises TransferInterrupted, so the pool throttles
+        this session and moves the range to another one.
+        """
+        expected = self.range_size(first_chunk, chunks, file_size)
+        written = 0
+        for attempt in range(self.config.DOWNLOAD_RETRIES):
+            try:
+                async for chunk in client.stream_media(
+                    message,
+                    limit=chunks - written // self.chunk_size,
+                    offset=first_chunk + written // self.chunk_size
+                ):
+                    os.pwrite(fd, chunk, first_chunk * self.chunk_size + written)
+                    written += len(chunk)
+                    if state is not None:
+                        state['done'] += len(chunk)
+                        if progress:
+                            await progress(state['done'], file_size, *progress_args)
+                if written < expected:
+                    raise TransferInterrupted(f"stream ended after {written} of {expected} bytes")
+                return written
+            except (FloodWait, TransferInterrupted):
+                # The pool retries the whole range on another session
+                if state is not None:
+                    state['done'] -= written
+                raise
+            except Exception as e:
+                if attempt == self.config.DOWNLOAD_RETRIES - 1:
+                    raise
+                logger.warning(f"Range at chunk {first_chunk} failed ({e}), retrying")
+                # Restart the current chunk, keep the ones already written
+                if state is not None:
+                    state['done'] -= written % self.chunk_size
+                written -= written % self.chunk_size
+                await asyncio.sleep(2 ** attempt)
+        return written
+
+    def range_size(self, first_chunk: int, chunks: int, file_size: int = 0) -> int:
+        """Bytes a run of chunks holds, shorter for the file's last part"""
+        size = chunks * self.chunk_size
+        if file_size:
+            size = min(size, file_size - first_chunk * self.chunk_size)
+        return max(0, size)
+
+    @classmethod
+    def is_complete(cls, path: Optional[str]) -> bool:
+        """Check that a download finished (no sidecar left)"""
+        return bool(path) and os.path.exists(path) and not os.path.exists(path + cls.PARTS_SUFFIX)
+
+    @classmethod
+    def discard(cls, path: str):
+        """Delete a file and its sidecar"""
+        for target in (path, path + cls.PARTS_SUFFIX):
+            if os.path.exists(target):
+                os.remove(target)
+
+    @staticmethod
+    def preallocate(fd: int, size: int):
+        """Reserve the file's blocks up front, falling back to a sparse file"""
+        try:
+            os.posix_fallocate(fd, 0, size)
+        except (AttributeError, OSError):
+            os.ftruncate(fd, size)
+
+    def load_bitmap(self, path: str, part_count: int) -> bytearray:
+        """Read finished parts, or start over if the data or sidecar is missing"""
+        sidecar = path + self.PARTS_SUFFIX
+        size = -(-part_count // 8)
+        if os.path.exists(path) and os.path.exists(sidecar):
+            with open(sidecar, "rb") as f:
+                bitmap = bytearray(f.read())
+            if len(bitmap) == size:
+                return bitmap
+        bitmap = bytearray(size)
+        self.save_bitmap(path, bitmap)
+        return bitmap
+
+    def save_bitmap(self, path: str, bitmap: bytearray):
+        """Atomically replace the sidecar"""
+        sidecar = path + self.PARTS_SUFFIX
+        with open(sidecar + ".tmp", "wb") as f:
+            f.write(bitmap)
+        os.replace(sidecar + ".tmp", sidecar)
+
+    @staticmethod
+    def is_set(bitmap: bytearray, index: int) -> bool:
+        return bool(bitmap[index // 8] & (1 << (index % 8)))
+
+    @staticmethod
+    def set_bit(bitmap: bytearray, index: int):
+        bitmap[index // 8] |= 1 << (index % 8)
@@ -2,19 +2,36 @@ import asyncio
 import json
 import logging
 import os
+import time
+from collections import OrderedDict
 from typing import Dict, List, Optional, Tuple
 from pyrogram.types import Message
 from config import Config
+from .operation_graph import OperationGraph, GraphCompiler
+from .process_supervisor import ProcessSupervisor
+from utils.metrics import STAGE_SECONDS
 
 logger = logging.getLogger(__name__)
 
 class FFmpegProcessor:
+    # Audio codecs an MP4 can carry, anything else is transcoded to AAC
+    MP4_AUDIO_CODECS = {'aac', 'mp3', 'ac3', 'eac3', 'opus', 'flac', 'alac'}
+
     def __init__(self):
         self.config = Config()
+        self.compiler = GraphCompiler()
+        self.supervisor = ProcessSupervisor()
+        self.probe_cache: 'OrderedDict[tuple, Dict]' = OrderedDict()
 
     async def probe_video(self, file_path: str) -> Dict:
-        """Get video information using FFprobe"""
+        """Get video information using FFprobe (cached per file version)"""
         try:
+            stat = os.stat(file_path)
+            key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+            if key in self.probe_cache:
+                self.probe_cache.move_to_end(key)
+                return self.probe_cache[key]
+
             cmd = [
                 "ffprobe",
                 "-v", "quiet",
@@ -24,18 +41,17 @@ class FFmpegProcessor:
                 file_path
             ]
             
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            stdout, stderr = await process.communicate()
-            
-            if process.returncode != 0:
-                raise Exception(f"FFprobe failed: {stderr.decode()}")
+            with STAGE_SECONDS.time(stage="probe"):
+                result = await self.supervisor.run(cmd, budget=self.config.FFPROBE_TIMEOUT)
+
+            if not result.ok:
+                raise Exception(f"FFprobe failed: {result.killed or result.stderr}")
                 
-            return json.loads(stdout.decode())
+            probe_data = json.loads(result.stdout.decode())
+            self.probe_cache[key] = probe_data
+            if len(self.probe_cache) > self.config.PROBE_CACHE_SIZE:
+                self.probe_cache.popitem(last=False)
+            return probe_data
             
         except Exception as e:
             logger.error(f"Error probing video: {e}")
@@ -101,13 +117,121 @@ class FFmpegProcessor:
         if options.get('duration'):
             cmd.extend(["-t", str(options['duration'])])
         if options.get('faststart', True):
-            cmd.extend(["-movflags", "+faststart"])
+            cmd.extend(self.compiler.finalize_args(
+                output_path,
+                await self.probe_video(input_path),
+                options.get('duration')
+            ))
 
         # Output options
         cmd.extend(["-y", output_path])
 
         return cmd
 
+    async def build_ladder_command(
+        self,
+        input_path: str,
+        output_dir: str,
+        resolutions: List[str],
+        quality: str = 'medium',
+        packaging: Optional[str] = None
+    ) -> Tuple[List[str], List[str]]:
+        """Build one FFmpeg command that decodes once and encodes every rendition"""
+        preset = self.config.COMPRESSION_PRESETS[quality]
+        probe_data = await self.probe_video(input_path)
+        count = len(resolutions)
+        audio_codecs = [
+            s.get('codec_name') for s in probe_data.get('streams', [])
+            if s.get('codec_type') == 'audio'
+        ]
+
+        # Split the decoded frames into one scaled branch per rendition;
+        # a rendition that isn't a preset keeps the source size
+        branches = []
+        for i, res in enumerate(resolutions):
+            size = self.config.RESOLUTION_PRESETS.get(res)
+            scale = (
+                f"scale={size['width']}:{size['height']}:force_original_aspect_ratio=decrease,"
+                if size else ""
+            )
+            branches.append(f"[s{i}]{scale}pad=ceil(iw/2)*2:ceil(ih/2)*2[v{i}]")
+        split = f"[0:v:0]split={count}" + "".join(f"[s{i}]" for i in range(count))
+        filtergraph = ";".join([split] + branches)
+
+        video_args = [
+            "-crf", str(preset['crf']),
+            "-preset", preset['preset'],
+            "-tune", preset['tune'],
+            "-x265-params", preset['x265-params']
+        ]
+
+        cmd = ["ffmpeg", "-hide_banner", "-i", input_path, "-filter_complex", filtergraph]
+        outputs = []
+
+        if packaging == 'hls':
+            for i in range(count):
+                cmd.extend(["-map", f"[v{i}]"])
+                if audio_codecs:
+                    cmd.extend(["-map", "0:a:0"])
+            cmd.extend(["-c:v", "libx265", *video_args, "-tag:v", "hvc1"])
+            if audio_codecs:
+                cmd.extend(["-c:a", "aac", "-b:a", "128k"])
+            cmd.extend([
+                "-f", "hls",
+                "-hls_time", str(self.config.LADDER_SEGMENT_TIME),
+                "-hls_playlist_type", "vod",
+                "-hls_segment_type", "fmp4",
+                "-hls_segment_filename", os.path.join(output_dir, "%v_%03d.m4s"),
+                "-master_pl_name", "master.m3u8",
+                "-var_stream_map", " ".join(
+                    f"v:{i},a:{i},name:{res}" if audio_codecs else f"v:{i},name:{res}"
+                    for i, res in enumerate(resolutions)
+                ),
+                "-y", os.path.join(output_dir, "%v.m3u8")
+            ])
+            outputs.append(os.path.join(output_dir, "master.m3u8"))
+
+        elif packaging == 'dash':
+            for i in range(count):
+                cmd.extend(["-map", f"[v{i}]"])
+            if audio_codecs:
+                cmd.extend(["-map", "0:a:0"])
+            cmd.extend(["-c:v", "libx265", *video_args, "-tag:v", "hvc1"])
+            if audio_codecs:
+                cmd.extend(["-c:a", "aac", "-b:a", "128k"])
+            cmd.extend([
+                "-f", "dash",
+                "-seg_duration", str(self.config.LADDER_SEGMENT_TIME),
+                "-adaptation_sets", (
+                    "id=0,streams=v id=1,streams=a" if audio_codecs else "id=0,streams=v"
+                ),
+                "-y", os.path.join(output_dir, "manifest.mpd")
+            ])
+            outputs.append(os.path.join(output_dir, "manifest.mpd"))
+
+        else:
+            # Independent MP4 files, all fed from the same decoder; audio is
+            # copied where MP4 can hold it
+            audio_args = []
+            for index, codec in enumerate(audio_codecs):
+                if codec in self.MP4_AUDIO_CODECS:
+                    audio_args.extend([f"-c:a:{index}", "copy"])
+                else:
+                    audio_args.extend([f"-c:a:{index}", "aac", f"-b:a:{index}", "128k"])
+            for i, res in enumerate(resolutions):
+                output_path = os.path.join(output_dir, f"{res}.mp4")
+                cmd.extend([
+                    "-map", f"[v{i}]",
+                    "-map", "0:a?",
+                    "-c:v", "libx265", *video_args,
+                    *audio_args,
+                    *self.compiler.finalize_args(output_path, probe_data),
+                    "-y", output_path
+                ])
+                outputs.append(output_path)
+
+        return cmd, outputs
+
     async def process_video(
         self,
         input_path: str,
@@ -119,39 +243,109 @@ class FFmpegProcessor:
         """Process video with FFmpeg"""
         try:
             cmd = await self.build_ffmpeg_command(input_path, output_path, options)
-            
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
+            return await self.run_command(
+                cmd,
+                input_path,
+                progress_callback,
+                message
             )
 
-            if progress_callback and message:
-                # Get video duration
-                probe_data = await self.probe_video(input_path)
-                duration = float(probe_data['format']['duration'])
+        except Exception as e:
+            logger.error(f"Error processing video: {e}")
+            return False
+
+    async def process_graph(
+        self,
+        input_path: str,
+        output_path: str,
+        graph: OperationGraph,
+        progress_callback: Optional[callable] = None,
+        message: Optional[Message] = None
+    ) -> bool:
+        """Run a whole operation graph as one FFmpeg invocation"""
+        try:
+            probe_data = await self.probe_video(input_path)
+            cmd = self.compiler.compile(graph, input_path, output_path, probe_data)
 
-                while True:
-                    line = await process.stderr.readline()
-                    if not line:
-                        break
-                        
-                    line_text = line.decode('utf-8')
-                    if "time=" in line_text:
-                        await progress_callback(line_text, duration, message)
+            # Progress is measured against the trimmed duration
+            state = self.compiler.reduce(graph, probe_data)
+            duration = state['duration']
+            if duration is None:
+                duration = float(probe_data['format']['duration']) - state['start']
 
-            stdout, stderr = await process.communicate()
-            
-            if process.returncode != 0:
-                logger.error(f"FFmpeg error: {stderr.decode()}")
-                return False
+            return await self.run_command(
+                cmd,
+                input_path,
+                progress_callback,
+                message,
+                duration=duration
+            )
 
-            return True
+        except Exception as e:
+            logger.error(f"Error processing operation graph: {e}")
+            return False
+
+    async def process_ladder(
+        self,
+        input_path: str,
+        output_dir: str,
+        resolutions: List[str],
+        quality: str = 'medium',
+        packaging: Optional[str] = None,
+        progress_callback: Optional[callable] = None,
+        message: Optional[Message] = None
+    ) -> List[str]:
+        """Encode a rendition ladder from a single decode pass"""
+        try:
+            cmd, outputs = await self.build_ladder_command(
+                input_path,
+                output_dir,
+                resolutions,
+                quality,
+                packaging
+            )
+
+            success = await self.run_command(cmd, input_path, progress_callback, message)
+            return outputs if success else []
 
         except Exception as e:
-            logger.error(f"Error processing video: {e}")
+            logger.error(f"Error processing ladder: {e}")
+            return []
+
+    async def run_command(
+        self,
+        cmd: List[str],
+        input_path: str,
+        progress_callback: Optional[callable] = None,
+        message: Optional[Message] = None,
+        duration: Optional[float] = None
+    ) -> bool:
+        """Run an FFmpeg command under the watchdog, forwarding progress lines"""
+        on_line = None
+        if progress_callback and message:
+            # Get video duration
+            if duration is None:
+                probe_data = await self.probe_video(input_path)
+                duration = float(probe_data['format']['duration'])
+
+            async def on_line(line: str):
+                if "time=" in line:
+                    await progress_callback(line, duration, message)
+
+        with STAGE_SECONDS.time(stage="encode"):
+            result = await self.supervisor.run(
+                cmd,
+                on_line=on_line,
+                budget=self.supervisor.budget(duration),
+                stall_timeout=self.config.FFMPEG_STALL_TIMEOUT
+            )
+
+        if not result.ok:
+            logger.error(f"FFmpeg error: {result.killed or result.stderr}")
             return False
 
+        return True
+
     async def extract_audio(
         self,
         input_path: str,
@@ -172,14 +366,11 @@ class FFmpegProcessor:
                 output_path
             ]
 
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
+            result = await self.supervisor.run(
+                cmd,
+                stall_timeout=self.config.FFMPEG_STALL_TIMEOUT
             )
-
-            await process.communicate()
-            return process.returncode == 0
+            return result.ok
 
         except Exception as e:
             logger.error(f"Error extracting audio: {e}")
@@ -214,35 +405,31 @@ class FFmpegProcessor:
                 output_path
             ]
 
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
+            # Calculate total duration
+            total_duration = 0
+            for video in video_paths:
+                probe_data = await self.probe_video(video)
+                total_duration += float(probe_data['format']['duration'])
 
+            on_line = None
             if progress_callback and message:
-                # Calculate total duration
-                total_duration = 0
-                for video in video_paths:
-                    probe_data = await self.probe_video(video)
-                    total_duration += float(probe_data['format']['duration'])
-
-                while True:
-                    line = await process.stderr.readline()
-                    if not line:
-                        break
-                    line_text = line.decode('utf-8')
-                    if "time=" in line_text:
-                        await progress_callback(line_text, total_duration, message)
-
-            stdout, stderr = await process.communicate()
+                async def on_line(line: str):
+                    if "time=" in line:
+                        await progress_callback(line, total_duration, message)
+
+            result = await self.supervisor.run(
+                cmd,
+                on_line=on_line,
+                budget=self.supervisor.budget(total_duration),
+                stall_timeout=self.config.FFMPEG_STALL_TIMEOUT
+            )
             
             # Cleanup concat file
             if os.path.exists(concat_file):
                 os.remove(concat_file)
 
-            if process.returncode != 0:
-                logger.error(f"FFmpeg error: {stderr.decode()}")
+            if not result.ok:
+                logger.error(f"FFmpeg error: {result.killed or result.stderr}")
                 return False
 
             return True
@@ -1,5 +1,6 @@
 import os
 import time
+import uuid
 import shutil
 import logging
 import asyncio
@@ -7,12 +8,14 @@ from typing import Optional, List
 from datetime import datetime
 from pathlib import Path
 from config import Config
+from .process_supervisor import ProcessSupervisor
 
 logger = logging.getLogger(__name__)
 
 class FileManager:
     def __init__(self):
         self.config = Config()
+        self.supervisor = ProcessSupervisor()
         self.create_directories()
 
     def create_directories(self):
@@ -20,6 +23,7 @@ class FileManager:
         try:
             os.makedirs(self.config.TEMP_DIR, exist_ok=True)
             os.makedirs(self.config.THUMB_DIR, exist_ok=True)
+            os.makedirs(self.config.DATA_DIR, exist_ok=True)
         except Exception as e:
             logger.error(f"Error creating directories: {e}")
             raise
@@ -61,6 +65,35 @@ class FileManager:
         except Exception as e:
             logger.error(f"Error cleaning up files: {e}")
 
+    async def reclaim_orphans(self, keep: List[str], pattern: str = '*') -> int:
+        """Remove temp files not referenced by any live job, returns bytes freed"""
+        freed = 0
+        try:
+            keep_paths = {os.path.abspath(str(path)) for path in keep if path}
+            # Partial downloads keep their progress sidecar
+            keep_paths |= {path + ".parts" for path in keep_paths}
+            for file_path in Path(self.config.TEMP_DIR).glob(pattern):
+                if os.path.abspath(str(file_path)) in keep_paths:
+                    continue
+                try:
+                    if file_path.is_file():
+                        freed += file_path.stat().st_size
+                        file_path.unlink()
+                    elif file_path.is_dir():
+                        freed += sum(
+                            f.stat().st_size for f in file_path.rglob('*') if f.is_file()
+                        )
+                        shutil.rmtree(file_path)
+                except Exception as e:
+                    logger.error(f"Error removing {file_path}: {e}")
+
+            if freed:
+                logger.info(f"Reclaimed {self.format_size(freed)} of orphaned files")
+
+        except Exception as e:
+            logger.error(f"Error reclaiming orphaned files: {e}")
+        return freed
+
     async def generate_thumbnail(
         self,
         video_path: str,
@@ -71,7 +104,7 @@ class FileManager:
         try:
             thumb_path = os.path.join(
                 self.config.THUMB_DIR,
-                f"thumb_{int(time.time())}.jpg"
+                f"thumb_{uuid.uuid4().hex}.jpg"
             )
             
             cmd = [
@@ -84,14 +117,12 @@ class FileManager:
                 thumb_path
             ]
             
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
+            await self.supervisor.run(
+                cmd,
+                budget=self.config.FFPROBE_TIMEOUT,
+                stall_timeout=self.config.FFMPEG_STALL_TIMEOUT
             )
             
-            await process.communicate()
-            
             if os.path.exists(thumb_path):
                 return thumb_path
             return None
@@ -124,10 +155,10 @@ class FileManager:
             return {}
 
     async def create_temp_file(self, prefix: str = "", suffix: str = "") -> str:
-        """Create a temporary file path"""
+        """Create a unique temporary path (callers create a file or directory there)"""
         return os.path.join(
             self.config.TEMP_DIR,
-            f"{prefix}{int(time.time())}{suffix}"
+            f"{prefix}{uuid.uuid4().hex}{suffix}"
         )
 
     async def cleanup_user_files(self, user_id: int):
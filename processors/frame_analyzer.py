@@ -0,0 +1,243 @@
+import os
+import re
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from config import Config
+from .ffmpeg_processor import FFmpegProcessor
+from .operation_graph import OperationGraph
+
+logger = logging.getLogger(__name__)
+
+class FrameAnalyzer:
+    """Find duplicate and black stretches before spending encoder time on them
+
+    ffmpeg decodes the video to tiny grayscale frames on stdout; they are
+    compared in NumPy batches (mean absolute difference to the previous
+    frame, mean and peak luma). Mostly-duplicate content gets ``mpdecimate``
+    with VFR output. Black lead-ins/tails are trimmed where the audio is
+    silent too, found by ``silencedetect`` in the same decode; frame times
+    come from ``showinfo`` so variable frame rate sources cut correctly.
+    """
+
+    WIDTH = 64
+    HEIGHT = 36
+    # Audio may end slightly before or after the last frame
+    EDGE_TOLERANCE = 0.1
+
+    PTS_PATTERN = re.compile(r"Parsed_showinfo_\d+ .*\bpts_time:\s*(\S+)")
+    SILENCE_START_PATTERN = re.compile(r"silence_start:\s*(\S+)")
+    SILENCE_END_PATTERN = re.compile(r"silence_end:\s*([^\s|]+)")
+
+    def __init__(self, ffmpeg: FFmpegProcessor):
+        self.config = Config()
+        self.ffmpeg = ffmpeg
+        self.cache: 'OrderedDict[tuple, Dict]' = OrderedDict()
+
+    async def analyze(self, input_path: str) -> Optional[Dict]:
+        """Classify every frame, returns run statistics or None on failure"""
+        cached = self.cached(input_path)
+        if cached is not None:
+            return cached
+
+        try:
+            probe_data = await self.ffmpeg.probe_video(input_path)
+            duration = float(probe_data['format']['duration'])
+            audio_count = sum(
+                1 for stream in probe_data.get('streams', [])
+                if stream.get('codec_type') == 'audio'
+            )
+            frame_size = self.WIDTH * self.HEIGHT
+            batch_bytes = frame_size * self.config.FRAME_ANALYSIS_BATCH
+            state = {
+                'buffer': bytearray(),
+                'previous': None,
+                'duplicate': [],
+                'black': [],
+                'timestamps': [],
+                'silence': []
+            }
+
+            async def on_stdout(chunk: bytes):
+                state['buffer'] += chunk
+                if len(state['buffer']) >= batch_bytes:
+                    usable = len(state['buffer']) // frame_size * frame_size
+                    self.classify(bytes(state['buffer'][:usable]), state)
+                    del state['buffer'][:usable]
+
+            async def on_line(line: str):
+                self.parse_line(line, state)
+
+            # Passthrough keeps one raw frame per decoded frame, so the
+            # showinfo timestamps line up with the classified frames
+            filters = [f"[0:v:0]scale={self.WIDTH}:{self.HEIGHT},format=gray,showinfo[v]"]
+            if audio_count:
+                # Silence has to hold on every track, so they are mixed first
+                inputs = "".join(f"[0:a:{i}]" for i in range(audio_count))
+                mix = f"amix=inputs={audio_count}," if audio_count > 1 else ""
+                filters.append(
+                    f"{inputs}{mix}silencedetect="
+                    f"noise={self.config.SILENCE_NOISE_LEVEL}dB"
+                    f":duration={self.config.BLACK_TRIM_MIN_DURATION}[a]"
+                )
+            cmd = [
+                "ffmpeg", "-hide_banner", "-nostats",
+                "-i", input_path,
+                "-filter_complex", ";".join(filters),
+                "-map", "[v]", "-fps_mode", "passthrough",
+                "-f", "rawvideo", "-"
+            ]
+            if audio_count:
+                cmd.extend(["-map", "[a]", "-f", "null", "-"])
+            result = await self.ffmpeg.supervisor.run(
+                cmd,
+                on_line=on_line,
+                budget=self.ffmpeg.supervisor.budget(duration),
+                stall_timeout=self.config.FFMPEG_STALL_TIMEOUT,
+                on_stdout=on_stdout
+            )
+            if not result.ok:
+                logger.error(f"Frame analysis failed: {result.killed or result.stderr}")
+                return None
+            usable = len(state['buffer']) // frame_size * frame_size
+            if usable:
+                self.classify(bytes(state['buffer'][:usable]), state)
+
+            duplicate = np.concatenate(state['duplicate']) if state['duplicate'] else np.zeros(0, bool)
+            black = np.concatenate(state['black']) if state['black'] else np.zeros(0, bool)
+            frames = min(len(black), len(state['timestamps']))
+            analysis = {
+                'frames': frames,
+                'duration': duration,
+                'timestamps': np.array(state['timestamps'][:frames], dtype=np.float64),
+                'duplicate_ratio': float(duplicate[:frames].mean()) if frames else 0.0,
+                'black_runs': self.runs(black[:frames]),
+                # None when there is no audio to keep
+                'silence': [
+                    (start, duration if end is None else end)
+                    for start, end in state['silence']
+                ] if audio_count else None
+            }
+
+            key = self.cache_key(input_path)
+            self.cache[key] = analysis
+            if len(self.cache) > self.config.PROBE_CACHE_SIZE:
+                self.cache.popitem(last=False)
+            return analysis
+
+        except Exception as e:
+            logger.error(f"Error analyzing frames: {e}")
+            return None
+
+    def cached(self, input_path: str) -> Optional[Dict]:
+        """Analysis of a file if it was already done"""
+        key = self.cache_key(input_path)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        return None
+
+    def parse_line(self, line: str, state: Dict):
+        """Collect frame timestamps and silent intervals from ffmpeg's log"""
+        match = self.PTS_PATTERN.search(line)
+        if match:
+            state['timestamps'].append(float(match.group(1)))
+            return
+        match = self.SILENCE_START_PATTERN.search(line)
+        if match:
+            state['silence'].append([float(match.group(1)), None])
+            return
+        match = self.SILENCE_END_PATTERN.search(line)
+        if match and state['silence']:
+            state['silence'][-1][1] = float(match.group(1))
+
+    def classify(self, data: bytes, state: Dict):
+        """Mark the duplicate and black frames of one batch"""
+        frames = np.frombuffer(data, dtype=np.uint8).reshape(-1, self.HEIGHT * self.WIDTH)
+        frames = frames.astype(np.int16)
+
+        # Difference to the previous frame, the first one compared across batches
+        previous = state['previous'] if state['previous'] is not None else frames[:1]
+        shifted = np.concatenate([previous, frames[:-1]])
+        difference = np.abs(frames - shifted).mean(axis=1)
+        duplicate = difference < self.config.DUPLICATE_FRAME_THRESHOLD
+        if state['previous'] is None:
+            duplicate[0] = False
+
+        black = (frames.mean(axis=1) < self.config.BLACK_FRAME_LUMA) & \
+            (frames.max(axis=1) < self.config.BLACK_FRAME_LUMA * 2)
+
+        state['duplicate'].append(duplicate)
+        state['black'].append(black)
+        state['previous'] = frames[-1:]
+
+    @staticmethod
+    def runs(mask: np.ndarray) -> List[Tuple[int, int]]:
+        """Start/end frame indices (end exclusive) of the True runs in a mask"""
+        if not len(mask):
+            return []
+        edges = np.diff(np.concatenate([[0], mask.astype(np.int8), [0]]))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+        return list(zip(starts.tolist(), ends.tolist()))
+
+    def apply(self, graph: OperationGraph, analysis: Dict) -> Tuple[OperationGraph, List[str]]:
+        """Put decimation and black trims ahead of a graph's operations
+
+        Black is only trimmed where the audio is silent as well, and only
+        when the user hasn't picked a window of their own, whose times refer
+        to the untrimmed input. Returns the new graph and what was changed.
+        """
+        planned = OperationGraph()
+        changes: List[str] = []
+        frames = analysis['frames']
+        if not frames:
+            return graph.copy(), changes
+        times = analysis['timestamps']
+        total = analysis['duration']
+        min_black = self.config.BLACK_TRIM_MIN_DURATION
+
+        # Only leading and trailing black is cut, gaps inside are content
+        start = 0.0
+        end = total
+        for first, last in analysis['black_runs']:
+            if first == 0:
+                start = float(times[last]) if last < frames else total
+            elif last == frames:
+                end = float(times[first])
+
+        # Narration or music over black is kept
+        silence = analysis['silence']
+        if silence is not None:
+            start = min(start, max(
+                (e for s, e in silence if s <= self.EDGE_TOLERANCE), default=0.0
+            ))
+            end = max(end, min(
+                (s for s, e in silence if e >= total - self.EDGE_TOLERANCE), default=total
+            ))
+
+        if start < min_black:
+            start = 0.0
+        if total - end < min_black:
+            end = total
+        user_trimmed = any(op['type'] == 'trim' for op in graph.operations)
+        if not user_trimmed and start < end and (start or end < total):
+            planned.trim(start=start, duration=end - start)
+            changes.append(
+                f"Trimmed {start + total - end:.1f}s of black frames"
+            )
+
+        if analysis['duplicate_ratio'] >= self.config.DECIMATE_MIN_RATIO:
+            planned.decimate()
+            changes.append(
+                f"Dropping duplicate frames ({analysis['duplicate_ratio']:.0%} of the video)"
+            )
+
+        planned.operations.extend(graph.copy().operations)
+        return planned, changes
+
+    @staticmethod
+    def cache_key(path: str) -> tuple:
+        stat = os.stat(path)
+        return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
@@ -0,0 +1,360 @@
+import json
+import os
+import socket
+import sqlite3
+import time
+import uuid
+import asyncio
+import threading
+import logging
+from typing import Any, Dict, List, Optional
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class JobBroker:
+    """Queue between the bot frontend and encode workers
+
+    Jobs move queued -> claimed -> done | failed | cancelled. A worker that
+    claims a job must heartbeat it; claims whose heartbeat is older than the
+    timeout go back to the queue so a crashed worker never loses a job.
+    Other backends (e.g. Redis) only need to implement these methods. They
+    block, so async callers run them with ``asyncio.to_thread``, and must be
+    safe to call from several threads.
+    """
+
+    def submit(self, kind: str, payload: Dict) -> str:
+        """Queue a job and return its id"""
+        raise NotImplementedError
+
+    def claim(self, worker_id: str, kinds: Optional[List[str]] = None) -> Optional[Dict]:
+        """Atomically take the oldest queued job"""
+        raise NotImplementedError
+
+    def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        """Keep a claim alive, returns False if the job was cancelled or lost"""
+        raise NotImplementedError
+
+    def report_progress(self, job_id: str, progress: Dict):
+        """Publish the latest progress of a claimed job"""
+        raise NotImplementedError
+
+    def complete(self, job_id: str, worker_id: str, result: Any) -> bool:
+        """Mark a job done with its result, returns False if the claim was lost"""
+        raise NotImplementedError
+
+    def fail(self, job_id: str, worker_id: str, error: str) -> bool:
+        """Mark a job failed, returns False if the claim was lost"""
+        raise NotImplementedError
+
+    def cancel(self, job_id: str):
+        """Withdraw a queued job or ask the worker to stop a claimed one"""
+        raise NotImplementedError
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        """Get a job's state, progress and result"""
+        raise NotImplementedError
+
+    def requeue_stale(self, timeout: float) -> int:
+        """Put claims with an expired heartbeat back in the queue"""
+        raise NotImplementedError
+
+    def close(self):
+        """Release the backend connection"""
+
+
+class SQLiteBroker(JobBroker):
+    """Broker on a SQLite file (single host, or a shared disk with working locks)"""
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.config = Config()
+        self.db_path = str(db_path or self.config.BROKER_PATH)
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self.conn = sqlite3.connect(
+            self.db_path, isolation_level=None, timeout=30, check_same_thread=False
+        )
+        # One connection shared by the threads the calls run in
+        self.lock = threading.RLock()
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS broker_jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL,
+                worker TEXT,
+                progress TEXT,
+                result TEXT,
+                error TEXT,
+                created REAL NOT NULL,
+                heartbeat REAL
+            )
+            """
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS broker_jobs_state ON broker_jobs (state, created)"
+        )
+
+    def submit(self, kind: str, payload: Dict) -> str:
+        with self.lock:
+            job_id = uuid.uuid4().hex
+            self.conn.execute(
+                "INSERT INTO broker_jobs (id, kind, payload, state, created) "
+                "VALUES (?, ?, ?, 'queued', ?)",
+                (job_id, kind, json.dumps(payload), time.time())
+            )
+            return job_id
+
+    def claim(self, worker_id: str, kinds: Optional[List[str]] = None) -> Optional[Dict]:
+        with self.lock:
+            query = "SELECT id FROM broker_jobs WHERE state = 'queued'"
+            args: List[Any] = []
+            if kinds:
+                query += f" AND kind IN ({','.join('?' * len(kinds))})"
+                args.extend(kinds)
+            query += " ORDER BY created LIMIT 1"
+
+            # IMMEDIATE takes the write lock up front so two workers can't claim the same row
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(query, args).fetchone()
+                if row is None:
+                    self.conn.execute("COMMIT")
+                    return None
+                self.conn.execute(
+                    "UPDATE broker_jobs SET state = 'claimed', worker = ?, heartbeat = ? "
+                    "WHERE id = ?",
+                    (worker_id, time.time(), row['id'])
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            return self.get_job(row['id'])
+
+    def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        with self.lock:
+            cursor = self.conn.execute(
+                "UPDATE broker_jobs SET heartbeat = ? "
+                "WHERE id = ? AND worker = ? AND state = 'claimed'",
+                (time.time(), job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def report_progress(self, job_id: str, progress: Dict):
+        with self.lock:
+            self.conn.execute(
+                "UPDATE broker_jobs SET progress = ? WHERE id = ?",
+                (json.dumps(progress), job_id)
+            )
+
+    def complete(self, job_id: str, worker_id: str, result: Any) -> bool:
+        # A requeued job may be running on another worker by now
+        with self.lock:
+            cursor = self.conn.execute(
+                "UPDATE broker_jobs SET state = 'done', result = ? "
+                "WHERE id = ? AND worker = ? AND state = 'claimed'",
+                (json.dumps(result), job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, job_id: str, worker_id: str, error: str) -> bool:
+        with self.lock:
+            cursor = self.conn.execute(
+                "UPDATE broker_jobs SET state = 'failed', error = ? "
+                "WHERE id = ? AND worker = ? AND state = 'claimed'",
+                (error, job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def cancel(self, job_id: str):
+        with self.lock:
+            self.conn.execute(
+                "UPDATE broker_jobs SET state = 'cancelled' "
+                "WHERE id = ? AND state IN ('queued', 'claimed')",
+                (job_id,)
+            )
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM broker_jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = dict(row)
+            for key in ('payload', 'progress', 'result'):
+                job[key] = json.loads(job[key]) if job[key] else None
+            return job
+
+    def requeue_stale(self, timeout: float) -> int:
+        with self.lock:
+            cursor = self.conn.execute(
+                "UPDATE broker_jobs SET state = 'queued', worker = NULL "
+                "WHERE state = 'claimed' AND heartbeat < ?",
+                (time.time() - timeout,)
+            )
+            return cursor.rowcount
+
+    def prune(self, max_age: int = 24 * 3600):
+        """Drop finished jobs older than max_age seconds"""
+        with self.lock:
+            self.conn.execute(
+                "DELETE FROM broker_jobs WHERE state NOT IN ('queued', 'claimed') AND created < ?",
+                (time.time() - max_age,)
+            )
+
+    def close(self):
+        try:
+            self.conn.close()
+        except Exception as e:
+            logger.error(f"Error closing job broker: {e}")
+
+
+class SocketBroker(JobBroker):
+    """Client for a broker served over a Unix socket by ``BrokerServer``
+
+    Lets workers in other containers share the frontend's broker through a
+    mounted socket instead of opening the database themselves. Requests are
+    one JSON line each way.
+    """
+
+    METHODS = (
+        'submit', 'claim', 'heartbeat', 'report_progress', 'complete',
+        'fail', 'cancel', 'get_job', 'requeue_stale'
+    )
+
+    def __init__(self, socket_path: Optional[str] = None):
+        self.config = Config()
+        self.socket_path = str(socket_path or self.config.BROKER_SOCKET)
+        self.sock: Optional[socket.socket] = None
+        self.reader = None
+        # Requests and responses on the one socket must not interleave
+        self.lock = threading.Lock()
+
+    def submit(self, kind: str, payload: Dict) -> str:
+        return self._call('submit', kind, payload)
+
+    def claim(self, worker_id: str, kinds: Optional[List[str]] = None) -> Optional[Dict]:
+        return self._call('claim', worker_id, kinds)
+
+    def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        return self._call('heartbeat', job_id, worker_id)
+
+    def report_progress(self, job_id: str, progress: Dict):
+        return self._call('report_progress', job_id, progress)
+
+    def complete(self, job_id: str, worker_id: str, result: Any) -> bool:
+        return self._call('complete', job_id, worker_id, result)
+
+    def fail(self, job_id: str, worker_id: str, error: str) -> bool:
+        return self._call('fail', job_id, worker_id, error)
+
+    def cancel(self, job_id: str):
+        return self._call('cancel', job_id)
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        return self._call('get_job', job_id)
+
+    def requeue_stale(self, timeout: float) -> int:
+        return self._call('requeue_stale', timeout)
+
+    def close(self):
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+            self.reader = None
+
+    def _call(self, method: str, *args) -> Any:
+        """Send one request, reconnecting once if the server went away
+
+        Only a request that never reached the server is retried. Once it
+        was sent the server may have applied it, and calls like ``submit``
+        or ``claim`` must not run twice.
+        """
+        request = (json.dumps({'method': method, 'args': args}) + "\n").encode()
+        with self.lock:
+            return self._request(request)
+
+    def _request(self, request: bytes) -> Any:
+        for attempt in range(2):
+            sent = False
+            try:
+                if self.sock is None:
+                    self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                    self.sock.settimeout(30)
+                    self.sock.connect(self.socket_path)
+                    self.reader = self.sock.makefile('rb')
+                self.sock.sendall(request)
+                sent = True
+                line = self.reader.readline()
+                if not line:
+                    raise ConnectionError("Broker closed the connection")
+                response = json.loads(line)
+                if 'error' in response:
+                    raise Exception(response['error'])
+                return response.get('result')
+            except (OSError, ConnectionError):
+                self.close()
+                if sent or attempt:
+                    raise
+
+
+class BrokerServer:
+    """Serve a local broker to ``SocketBroker`` clients over a Unix socket"""
+
+    def __init__(self, broker: JobBroker, socket_path: Optional[str] = None):
+        self.config = Config()
+        self.broker = broker
+        self.socket_path = str(socket_path or self.config.BROKER_SOCKET)
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        """Start listening"""
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self.server = await asyncio.start_unix_server(self.handle_client, path=self.socket_path)
+        logger.info(f"Job broker listening on {self.socket_path}")
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Answer requests from one client until it disconnects"""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if request['method'] not in SocketBroker.METHODS:
+                        raise Exception(f"Unknown method {request['method']}")
+                    result = await asyncio.to_thread(
+                        getattr(self.broker, request['method']),
+                        *request['args']
+                    )
+                    response = {'result': result}
+                except Exception as e:
+                    response = {'error': str(e)}
+                writer.write((json.dumps(response) + "\n").encode())
+                await writer.drain()
+        except Exception as e:
+            logger.error(f"Error serving broker client: {e}")
+        finally:
+            writer.close()
+
+    async def stop(self):
+        """Stop listening"""
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+
+def create_broker(backend: Optional[str] = None) -> Optional[JobBroker]:
+    """Create the configured broker client (None runs encodes in-process)"""
+    backend = backend or Config.BROKER_BACKEND
+    if backend == 'sqlite':
+        return SQLiteBroker()
+    if backend == 'socket':
+        return SocketBroker()
+    return None
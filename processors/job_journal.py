@@ -0,0 +1,146 @@
+import json
+import sqlite3
+import time
+import logging
+from typing import Dict, List, Optional
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class JobJournal:
+    """Durable record of encode jobs and their finished segments (SQLite)"""
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.config = Config()
+        self.db_path = str(db_path or self.config.JOURNAL_PATH)
+        self.conn = sqlite3.connect(self.db_path, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.create_tables()
+
+    def create_tables(self):
+        """Create journal tables"""
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                user_id INTEGER,
+                chat_id INTEGER,
+                message_id INTEGER,
+                input_path TEXT NOT NULL,
+                output_path TEXT NOT NULL,
+                segment_dir TEXT NOT NULL,
+                graph TEXT NOT NULL,
+                state TEXT NOT NULL,
+                created REAL NOT NULL,
+                updated REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS segments (
+                job_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                path TEXT NOT NULL,
+                start REAL NOT NULL,
+                end REAL NOT NULL,
+                PRIMARY KEY (job_id, idx)
+            );
+            """
+        )
+
+    def create_job(
+        self,
+        job_id: str,
+        input_path: str,
+        output_path: str,
+        segment_dir: str,
+        graph: List[Dict],
+        user_id: Optional[int] = None,
+        chat_id: Optional[int] = None,
+        message_id: Optional[int] = None
+    ):
+        """Register a new running job"""
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'running', ?, ?)",
+            (
+                job_id, user_id, chat_id, message_id, input_path, output_path,
+                segment_dir, json.dumps(graph), now, now
+            )
+        )
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        """Get a job record"""
+        row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def set_state(self, job_id: str, state: str):
+        """Mark a job as running, done or failed"""
+        self.conn.execute(
+            "UPDATE jobs SET state = ?, updated = ? WHERE id = ?",
+            (state, time.time(), job_id)
+        )
+
+    def add_segment(self, job_id: str, idx: int, path: str, start: float, end: float):
+        """Checkpoint a fully written segment"""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO segments VALUES (?, ?, ?, ?, ?)",
+            (job_id, idx, path, start, end)
+        )
+        self.conn.execute(
+            "UPDATE jobs SET updated = ? WHERE id = ?",
+            (time.time(), job_id)
+        )
+
+    def get_segments(self, job_id: str) -> List[Dict]:
+        """Get finished segments in order"""
+        rows = self.conn.execute(
+            "SELECT idx, path, start, end FROM segments WHERE job_id = ? ORDER BY idx",
+            (job_id,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_interrupted_jobs(self) -> List[Dict]:
+        """Get jobs that were running when the process stopped"""
+        rows = self.conn.execute(
+            "SELECT * FROM jobs WHERE state = 'running' ORDER BY created"
+        ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def get_active_paths(self) -> List[str]:
+        """Get every path still referenced by a running job"""
+        paths = []
+        for job in self.get_interrupted_jobs():
+            paths.extend([job['input_path'], job['output_path'], job['segment_dir']])
+        return paths
+
+    def delete_job(self, job_id: str):
+        """Forget a job and its segments"""
+        self.conn.execute("DELETE FROM segments WHERE job_id = ?", (job_id,))
+        self.conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def prune(self, max_age: int = 7 * 24 * 3600):
+        """Drop finished jobs older than max_age seconds"""
+        cutoff = time.time() - max_age
+        self.conn.execute(
+            "DELETE FROM segments WHERE job_id IN "
+            "(SELECT id FROM jobs WHERE state != 'running' AND updated < ?)",
+            (cutoff,)
+        )
+        self.conn.execute(
+            "DELETE FROM jobs WHERE state != 'running' AND updated < ?",
+            (cutoff,)
+        )
+
+    def close(self):
+        """Close the database"""
+        try:
+            self.conn.close()
+        except Exception as e:
+            logger.error(f"Error closing job journal: {e}")
+
+    @staticmethod
+    def _row_to_job(row: sqlite3.Row) -> Dict:
+        """Convert a jobs row into a dict"""
+        job = dict(row)
+        job['graph'] = json.loads(job['graph'])
+        return job
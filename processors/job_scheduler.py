@@ -0,0 +1,521 @@
+import asyncio
+import itertools
+import logging
+import os
+import signal
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from config import Config
+from .cost_model import CostModel
+from utils.metrics import QUEUE_DEPTH, STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Job whose slot the current task is running in (copied into child tasks)
+current_job: ContextVar[Optional['Job']] = ContextVar('current_job', default=None)
+
+class Job:
+    """A unit of work waiting for (or holding) a processing slot"""
+
+    __slots__ = (
+        'id', 'func', 'user_id', 'chat_id', 'cost', 'priority', 'interactive',
+        'deadline', 'future', 'task', 'submitted', 'started', 'processes',
+        'paused_at', 'paused_total', 'preempted_by'
+    )
+
+    def __init__(
+        self,
+        job_id: int,
+        func: Callable[[], Awaitable],
+        user_id: int,
+        chat_id: Optional[int],
+        cost: float,
+        priority: str,
+        interactive: bool = False
+    ):
+        self.id = job_id
+        self.func = func
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.cost = max(cost, 0.001)
+        self.priority = priority
+        self.interactive = interactive
+        self.deadline = 0.0
+        self.future: Optional[asyncio.Future] = None
+        self.task: Optional[asyncio.Task] = None
+        self.submitted = time.time()
+        self.started: Optional[float] = None
+        self.processes: List[asyncio.subprocess.Process] = []
+        self.paused_at: Optional[float] = None
+        self.paused_total = 0.0
+        self.preempted_by = 0
+
+    def paused_seconds(self) -> float:
+        """Time spent suspended for interactive jobs so far"""
+        current = time.time() - self.paused_at if self.paused_at else 0.0
+        return self.paused_total + current
+
+    def active_seconds(self) -> float:
+        """Time spent actually running since the job started"""
+        if self.started is None:
+            return 0.0
+        return max(0.0, time.time() - self.started - self.paused_seconds())
+
+
+def attach_process(process: asyncio.subprocess.Process):
+    """Register a child process with the job running in this context"""
+    job = current_job.get()
+    if job is None:
+        return
+    job.processes.append(process)
+    # A job paused between two commands must not start the next one at full speed
+    if job.paused_at is not None:
+        Preemptor.suspend_process(process)
+
+
+def detach_process(process: asyncio.subprocess.Process):
+    """Forget a finished child process"""
+    job = current_job.get()
+    if job is not None and process in job.processes:
+        job.processes.remove(process)
+
+
+class Preemptor:
+    """Suspend or deprioritize the children of a running job
+
+    ``stop`` freezes the process group with SIGSTOP/SIGCONT, ``nice`` keeps
+    it running at the lowest CPU and idle I/O priority. Restoring niceness
+    needs CAP_SYS_NICE; without it the process stays niced until it exits.
+    """
+
+    mode = 'stop'
+
+    @classmethod
+    def suspend_process(cls, process: asyncio.subprocess.Process):
+        if process.returncode is not None:
+            return
+        try:
+            if cls.mode == 'nice':
+                os.setpriority(os.PRIO_PGRP, cls._group(process), 19)
+                cls._ionice(process, "3")
+            else:
+                cls._signal(process, signal.SIGSTOP)
+        except Exception as e:
+            logger.error(f"Error suspending process {process.pid}: {e}")
+
+    @classmethod
+    def resume_process(cls, process: asyncio.subprocess.Process):
+        if process.returncode is not None:
+            return
+        try:
+            if cls.mode == 'nice':
+                os.setpriority(os.PRIO_PGRP, cls._group(process), 0)
+                cls._ionice(process, "2")
+            else:
+                cls._signal(process, signal.SIGCONT)
+        except Exception as e:
+            logger.error(f"Error resuming process {process.pid}: {e}")
+
+    @staticmethod
+    def _group(process: asyncio.subprocess.Process) -> int:
+        # Children are started in their own session; never touch the bot's group
+        pgid = os.getpgid(process.pid)
+        if pgid == os.getpgid(0):
+            raise Exception("Process shares the bot's process group")
+        return pgid
+
+    @classmethod
+    def _signal(cls, process: asyncio.subprocess.Process, sig: int):
+        os.killpg(cls._group(process), sig)
+
+    @classmethod
+    def _ionice(cls, process: asyncio.subprocess.Process, io_class: str):
+        # Fire and forget, ionice exits immediately
+        os.spawnlp(
+            os.P_NOWAIT, "ionice", "ionice",
+            "-c", io_class, "-P", str(cls._group(process))
+        )
+
+
+class UserFlow:
+    """One user's jobs, served FIFO, shortest first or by earliest deadline"""
+
+    def __init__(self, weights: Dict[str, float], order: str = 'fifo'):
+        self.jobs: deque = deque()
+        self.deficit = 0.0
+        self.weights = weights
+        self.order = order
+
+    @property
+    def weight(self) -> float:
+        head = self.peek()
+        return self.weights.get(head.priority, 1.0) if head else 1.0
+
+    def peek(self) -> Optional[Job]:
+        if not self.jobs:
+            return None
+        if self.order == 'sjf':
+            return min(self.jobs, key=lambda job: job.cost)
+        if self.order == 'deadline':
+            return min(self.jobs, key=lambda job: job.deadline)
+        return self.jobs[0]
+
+    def pop(self) -> Job:
+        job = self.peek()
+        self.jobs.remove(job)
+        return job
+
+    def remove(self, job: Job) -> bool:
+        try:
+            self.jobs.remove(job)
+            return True
+        except ValueError:
+            return False
+
+
+class DeficitQueue:
+    """Deficit round robin over weighted flows
+
+    Each flow earns ``quantum * weight`` credit per round and may dispatch
+    its head job once its credit covers the job's cost, so a flow's share
+    of processing time follows its weight regardless of how many or how
+    large the jobs it submits are.
+    """
+
+    def __init__(self, quantum: float):
+        self.quantum = quantum
+        self.active: 'OrderedDict[Any, Any]' = OrderedDict()
+
+    def activate(self, key: Any, flow: Any):
+        """Put a flow with waiting work into the rotation"""
+        if key not in self.active:
+            self.active[key] = flow
+
+    def is_empty(self) -> bool:
+        return not self.active
+
+    def select(self) -> Optional[Job]:
+        """Dispatch the next job according to deficits"""
+        while self.active:
+            key, flow = next(iter(self.active.items()))
+            head = flow.peek()
+            if head is None:
+                # Flow drained (cancelled jobs), it loses its credit
+                flow.deficit = 0.0
+                del self.active[key]
+                continue
+
+            if flow.deficit >= head.cost:
+                flow.deficit -= head.cost
+                job = flow.pop()
+                if flow.peek() is None:
+                    flow.deficit = 0.0
+                    del self.active[key]
+                return job
+
+            # Grant every flow the rounds needed for the first one to afford
+            # its head job in a single step instead of looping quantum by quantum
+            rounds = min(
+                max(1, -(-(f.peek().cost - f.deficit) // (self.quantum * f.weight)))
+                for f in self.active.values() if f.peek() is not None
+            )
+            for f in self.active.values():
+                f.deficit += rounds * self.quantum * f.weight
+
+            # The flow that could not afford its job goes to the back
+            self.active.move_to_end(key)
+        return None
+
+
+class ChatFlow:
+    """All flows of one chat, itself scheduled as a single flow"""
+
+    def __init__(self, quantum: float, weights: Dict[str, float], order: str = 'fifo'):
+        self.users: Dict[int, UserFlow] = {}
+        self.order = order
+        self.queue = DeficitQueue(quantum)
+        self.pending: Optional[Job] = None
+        self.deficit = 0.0
+        self.weights = weights
+
+    @property
+    def weight(self) -> float:
+        """Weight of the highest priority tier waiting in the chat"""
+        if self.pending is not None:
+            return self.weights.get(self.pending.priority, 1.0)
+        weights = [flow.weight for flow in self.users.values() if flow.jobs]
+        return max(weights, default=1.0)
+
+    def add(self, job: Job):
+        flow = self.users.get(job.user_id)
+        if flow is None:
+            flow = self.users[job.user_id] = UserFlow(self.weights, self.order)
+        flow.jobs.append(job)
+        self.queue.activate(job.user_id, flow)
+
+    def peek(self) -> Optional[Job]:
+        # The inner choice is committed so the outer queue sees a stable cost
+        if self.pending is None:
+            self.pending = self.queue.select()
+        return self.pending
+
+    def pop(self) -> Job:
+        job = self.peek()
+        self.pending = None
+        self._prune()
+        return job
+
+    def remove(self, job: Job) -> bool:
+        if self.pending is job:
+            self.pending = None
+            return True
+        flow = self.users.get(job.user_id)
+        removed = bool(flow and flow.remove(job))
+        self._prune()
+        return removed
+
+    def _prune(self):
+        for user_id in [u for u, f in self.users.items() if not f.jobs]:
+            del self.users[user_id]
+
+
+class JobScheduler:
+    """Weighted fair-share scheduler for processing jobs
+
+    Slots are shared fairly between chats first and between the users of a
+    chat second, using deficit round robin on predicted job cost. Priority
+    tiers scale a flow's weight. Within one user's flow jobs are served in
+    ``SCHEDULER_ORDER``: fifo, sjf or earliest deadline, where a deadline
+    is the submit time plus ``DEADLINE_SLACK`` times the predicted run
+    time so long jobs cannot be starved by a stream of short ones.
+    """
+
+    def __init__(self, slots: Optional[int] = None):
+        self.config = Config()
+        self.slots = slots or self.config.MAX_CONCURRENT_JOBS
+        self.weights = self.config.PRIORITY_WEIGHTS
+        self.quantum = self.config.SCHEDULER_QUANTUM
+        self.chats: Dict[Any, ChatFlow] = {}
+        self.queue = DeficitQueue(self.quantum)
+        self.order = self.config.SCHEDULER_ORDER
+        self.cost_model = CostModel()
+        self.running: Dict[int, Job] = {}
+        self.interactive: Dict[int, Job] = {}
+        self.interactive_queue: deque = deque()
+        self.waiting = 0
+        self.ids = itertools.count(1)
+        Preemptor.mode = self.config.PREEMPTION_MODE
+        QUEUE_DEPTH.set_function(self.depth)
+
+    async def submit(
+        self,
+        func: Callable[[], Awaitable],
+        user_id: int,
+        chat_id: Optional[int] = None,
+        cost: float = 1.0,
+        priority: Optional[str] = None,
+        interactive: bool = False
+    ) -> Any:
+        """Queue a job and wait for its result
+
+        Interactive jobs (seconds long) skip the fair queue and, when every
+        slot is busy, run in a borrowed slot while a bulk job is preempted.
+        """
+        priority = priority or self.get_priority(user_id)
+        job = Job(next(self.ids), func, user_id, chat_id, cost, priority, interactive)
+        job.deadline = job.submitted + self.config.DEADLINE_SLACK * job.cost
+        job.future = asyncio.get_running_loop().create_future()
+
+        if interactive:
+            self.interactive_queue.append(job)
+            self._dispatch_interactive()
+            try:
+                return await asyncio.shield(job.future)
+            except asyncio.CancelledError:
+                self.cancel(job)
+                raise
+
+        # Each private chat only has one user, fall back to per-user fairness
+        chat_key = chat_id if chat_id is not None else ('user', user_id)
+        chat = self.chats.setdefault(chat_key, ChatFlow(self.quantum, self.weights, self.order))
+        chat.add(job)
+        self.queue.activate(chat_key, chat)
+        self.waiting += 1
+        self._dispatch()
+
+        try:
+            return await asyncio.shield(job.future)
+        except asyncio.CancelledError:
+            self.cancel(job)
+            raise
+
+    def cancel(self, job: Job):
+        """Withdraw a queued job or stop a running one"""
+        if job.task is not None:
+            job.task.cancel()
+            return
+        if job in self.interactive_queue:
+            self.interactive_queue.remove(job)
+            job.future.cancel()
+            return
+        for chat in self.chats.values():
+            if chat.remove(job):
+                self.waiting -= 1
+                break
+        if not job.future.done():
+            job.future.cancel()
+
+    def get_priority(self, user_id: int) -> str:
+        """Get the configured priority tier of a user"""
+        return self.config.USER_PRIORITY.get(user_id, 'normal')
+
+    def predict(
+        self,
+        probe_data: Dict,
+        resolution: Optional[str],
+        quality: Optional[str],
+        duration: Optional[float] = None
+    ) -> Dict:
+        """Predict run time and output size of an encode from past jobs"""
+        features = self.cost_model.features(probe_data, resolution, quality, duration)
+        return self.cost_model.predict(features)
+
+    def estimate_cost(
+        self,
+        probe_data: Dict,
+        resolution: Optional[str],
+        quality: Optional[str],
+        duration: Optional[float] = None
+    ) -> float:
+        """Job cost for scheduling: predicted encode seconds"""
+        return self.predict(probe_data, resolution, quality, duration)['seconds']
+
+    def estimate_wait(self) -> float:
+        """Seconds until a job submitted now would get a slot (rough)"""
+        remaining = sum(
+            max(0.0, job.cost - job.active_seconds()) for job in self.running.values()
+        )
+        queued = sum(
+            job.cost
+            for chat in self.chats.values()
+            for flow in chat.users.values()
+            for job in flow.jobs
+        )
+        queued += sum(
+            chat.pending.cost for chat in self.chats.values() if chat.pending is not None
+        )
+        if len(self.running) < self.slots and not queued:
+            return 0.0
+        return (remaining + queued) / self.slots
+
+    def depth(self) -> Dict[tuple, int]:
+        """Job counts by state, for the metrics endpoint"""
+        return {
+            ('queued',): self.waiting,
+            ('running',): len(self.running),
+            ('interactive_queued',): len(self.interactive_queue),
+            ('interactive_running',): len(self.interactive)
+        }
+
+    def _dispatch(self):
+        """Start queued jobs while slots are free"""
+        while len(self.running) + len(self.interactive) < self.slots:
+            job = self.queue.select()
+            if job is None:
+                break
+            self.waiting -= 1
+            self._prune_chats()
+            if job.future.done():
+                continue
+            job.started = time.time()
+            self.running[job.id] = job
+            job.task = asyncio.create_task(self._run(job))
+
+    def _dispatch_interactive(self):
+        """Start interactive jobs, preempting bulk jobs when slots are full"""
+        limit = self.config.MAX_INTERACTIVE_JOBS
+        while self.interactive_queue and len(self.interactive) < limit:
+            job = self.interactive_queue.popleft()
+            if job.future.done():
+                continue
+
+            if len(self.running) + len(self.interactive) >= self.slots:
+                victim = self._pick_victim()
+                if victim is None and self.config.PREEMPTION_MODE == 'off':
+                    # Wait for a regular slot instead of oversubscribing
+                    self.interactive_queue.appendleft(job)
+                    break
+                if victim is not None:
+                    self._preempt(victim)
+                    job.preempted_by = victim.id
+
+            job.started = time.time()
+            self.interactive[job.id] = job
+            job.task = asyncio.create_task(self._run(job))
+
+    def _pick_victim(self) -> Optional[Job]:
+        """Choose the running bulk job to suspend (largest cost first)"""
+        if self.config.PREEMPTION_MODE == 'off':
+            return None
+        candidates = [
+            job for job in self.running.values()
+            if job.processes and job.paused_at is None
+        ]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda job: job.cost)
+
+    def _preempt(self, job: Job):
+        """Suspend a bulk job for the duration of an interactive one"""
+        job.paused_at = time.time()
+        for process in list(job.processes):
+            Preemptor.suspend_process(process)
+        logger.info(f"Preempted job {job.id} ({self.config.PREEMPTION_MODE})")
+
+    def _release_preemption(self, job: Job):
+        """Resume the bulk job an interactive job had suspended"""
+        victim = self.running.get(job.preempted_by)
+        if victim is None or victim.paused_at is None:
+            return
+        # Other interactive jobs may still be borrowing the same slot
+        if any(other.preempted_by == victim.id for other in self.interactive.values()):
+            return
+        victim.paused_total += time.time() - victim.paused_at
+        victim.paused_at = None
+        for process in list(victim.processes):
+            Preemptor.resume_process(process)
+
+    async def _run(self, job: Job):
+        """Run a job in its slot and hand the outcome to the submitter"""
+        current_job.set(job)
+        STAGE_SECONDS.observe(job.started - job.submitted, stage="queue_wait")
+        try:
+            result = await job.func()
+            if not job.future.done():
+                job.future.set_result(result)
+        except asyncio.CancelledError:
+            if not job.future.done():
+                job.future.cancel()
+        except Exception as e:
+            logger.error(f"Error running job {job.id}: {e}")
+            if not job.future.done():
+                job.future.set_exception(e)
+        finally:
+            self.running.pop(job.id, None)
+            if job.interactive:
+                self.interactive.pop(job.id, None)
+                self._release_preemption(job)
+                self._dispatch_interactive()
+            else:
+                # A suspended job that is cancelled must not stay frozen
+                for process in list(job.processes):
+                    Preemptor.resume_process(process)
+            self._dispatch()
+
+    def _prune_chats(self):
+        """Forget chats that have nothing queued"""
+        for key in [k for k, c in self.chats.items() if not c.users and c.pending is None]:
+            if key not in self.queue.active:
+                del self.chats[key]
@@ -0,0 +1,151 @@
+import re
+import json
+import math
+import logging
+from typing import Dict, List, Optional
+from config import Config
+from .ffmpeg_processor import FFmpegProcessor
+
+logger = logging.getLogger(__name__)
+
+class LoudnessNormalizer:
+    """EBU R128 loudness normalization of every audio track
+
+    All tracks are measured in a single decode, one ``loudnorm`` branch per
+    track, and the results are cached in the file's probe data. The apply
+    pass then runs linear ``loudnorm`` with the measured values only on the
+    tracks that are off target; video and the other tracks are copied.
+    """
+
+    FILTER_PATTERN = re.compile(r"Parsed_loudnorm_(\d+)")
+
+    def __init__(self, ffmpeg: FFmpegProcessor):
+        self.config = Config()
+        self.ffmpeg = ffmpeg
+
+    @property
+    def target(self) -> str:
+        return (
+            f"I={self.config.LOUDNESS_TARGET}"
+            f":TP={self.config.LOUDNESS_TRUE_PEAK}"
+            f":LRA={self.config.LOUDNESS_RANGE}"
+        )
+
+    async def measure(self, input_path: str) -> List[Optional[Dict]]:
+        """Loudness of each audio track (None where it couldn't be measured)"""
+        probe_data = await self.ffmpeg.probe_video(input_path)
+        if 'loudness' in probe_data:
+            return probe_data['loudness']
+
+        count = sum(
+            1 for stream in probe_data.get('streams', [])
+            if stream.get('codec_type') == 'audio'
+        )
+        if not count:
+            return []
+
+        # One filter per chain, so Parsed_loudnorm_N is the Nth audio track
+        branches = ";".join(
+            f"[0:a:{i}]loudnorm={self.target}:print_format=json[m{i}]"
+            for i in range(count)
+        )
+        cmd = ["ffmpeg", "-hide_banner", "-nostats", "-i", input_path, "-filter_complex", branches]
+        for i in range(count):
+            cmd.extend(["-map", f"[m{i}]"])
+        cmd.extend(["-f", "null", "-"])
+
+        results: List[Optional[Dict]] = [None] * count
+        state = {'track': None, 'lines': []}
+
+        async def on_line(line: str):
+            match = self.FILTER_PATTERN.search(line)
+            if match:
+                state['track'] = int(match.group(1))
+                state['lines'] = []
+                return
+            if state['track'] is None:
+                return
+            state['lines'].append(line)
+            if line.strip() == "}":
+                try:
+                    values = json.loads("\n".join(state['lines']))
+                    if state['track'] < count:
+                        results[state['track']] = values
+                except ValueError as e:
+                    logger.error(f"Error parsing loudnorm output: {e}")
+                state['track'] = None
+
+        duration = float(probe_data.get('format', {}).get('duration') or 0)
+        result = await self.ffmpeg.supervisor.run(
+            cmd,
+            on_line=on_line,
+            budget=self.ffmpeg.supervisor.budget(duration),
+            stall_timeout=self.config.FFMPEG_STALL_TIMEOUT
+        )
+        if not result.ok:
+            raise Exception(f"Loudness measurement failed: {result.killed or result.stderr}")
+
+        # Kept with the cached probe, so the apply pass doesn't measure again
+        probe_data['loudness'] = results
+        return results
+
+    def needs_adjustment(self, measurement: Optional[Dict]) -> bool:
+        """Check whether a track is outside the target loudness or peak"""
+        if not measurement:
+            return False
+        loudness = float(measurement['input_i'])
+        peak = float(measurement['input_tp'])
+        # Silence can't be brought up to a target
+        if not math.isfinite(loudness):
+            return False
+        return (
+            abs(loudness - self.config.LOUDNESS_TARGET) > self.config.LOUDNESS_TOLERANCE
+            or peak > self.config.LOUDNESS_TRUE_PEAK
+        )
+
+    def build_command(
+        self,
+        input_path: str,
+        output_path: str,
+        probe_data: Dict,
+        measurements: List[Optional[Dict]]
+    ) -> Optional[List[str]]:
+        """Command applying the measured correction, None if no track needs it"""
+        adjust = [i for i, m in enumerate(measurements) if self.needs_adjustment(m)]
+        if not adjust:
+            return None
+
+        audio_streams = [
+            stream for stream in probe_data.get('streams', [])
+            if stream.get('codec_type') == 'audio'
+        ]
+        branches = []
+        for i in adjust:
+            m = measurements[i]
+            # loudnorm works at 192 kHz; go back to the track's own rate
+            sample_rate = audio_streams[i].get('sample_rate') or 48000
+            branches.append(
+                f"[0:a:{i}]loudnorm={self.target}"
+                f":measured_I={m['input_i']}:measured_TP={m['input_tp']}"
+                f":measured_LRA={m['input_lra']}:measured_thresh={m['input_thresh']}"
+                f":offset={m['target_offset']}:linear=true:print_format=none,"
+                f"aresample={sample_rate}[n{i}]"
+            )
+
+        extension = output_path[output_path.rfind('.'):].lower()
+        codec = 'libopus' if extension == '.webm' else 'aac'
+
+        cmd = [
+            "ffmpeg", "-hide_banner",
+            "-i", input_path,
+            "-filter_complex", ";".join(branches),
+            "-map", "0:v?"
+        ]
+        for i in range(len(measurements)):
+            cmd.extend(["-map", f"[n{i}]" if i in adjust else f"0:a:{i}"])
+        cmd.extend(["-map", "0:s?", "-c", "copy"])
+        for i in adjust:
+            cmd.extend([f"-c:a:{i}", codec, f"-b:a:{i}", self.config.LOUDNESS_AUDIO_BITRATE])
+        cmd.extend(self.ffmpeg.compiler.finalize_args(output_path, probe_data))
+        cmd.extend(["-y", output_path])
+        return cmd
@@ -0,0 +1,191 @@
+import os
+import struct
+import logging
+from typing import Dict, List, Optional, Tuple
+from pyrogram.types import Message
+from hachoir.parser import createParser
+from hachoir.metadata import extractMetadata
+from config import Config
+from .ffmpeg_processor import FFmpegProcessor
+from .downloader import ChunkedDownloader
+
+logger = logging.getLogger(__name__)
+
+class MediaInspector:
+    """Identify and probe a Telegram file from its header without downloading it
+
+    The first chunks are streamed into a sparse file of the full size. MP4
+    files whose ``moov`` box sits after the media data get that box fetched
+    from the tail as well. ffprobe then reads the sparse file like the real
+    one; hachoir is the fallback for headers ffprobe rejects when truncated.
+    """
+
+    STREAM_CHUNK = ChunkedDownloader.STREAM_CHUNK
+
+    # Magic bytes -> (format, extension, is_video)
+    SIGNATURES = [
+        (4, b"ftypqt", ('mov', '.mov', True)),
+        (4, b"ftyp", ('mp4', '.mp4', True)),
+        (0, b"\x1a\x45\xdf\xa3", ('matroska', '.mkv', True)),
+        (0, b"FLV", ('flv', '.flv', True)),
+        (0, b"ID3", ('mp3', '.mp3', False)),
+        (0, b"fLaC", ('flac', '.flac', False)),
+        (0, b"OggS", ('ogg', '.ogg', False)),
+        (0, b"%PDF", ('pdf', '.pdf', False)),
+        (0, b"PK\x03\x04", ('zip', '.zip', False)),
+        (0, b"Rar!", ('rar', '.rar', False)),
+        (0, b"\x89PNG", ('png', '.png', False)),
+        (0, b"\xff\xd8\xff", ('jpeg', '.jpg', False))
+    ]
+
+    def __init__(self, ffmpeg: FFmpegProcessor, downloader: ChunkedDownloader):
+        self.config = Config()
+        self.ffmpeg = ffmpeg
+        self.downloader = downloader
+
+    async def inspect(self, message: Message, file_size: int, path: str) -> Dict:
+        """Fetch the header (and moov tail), sniff the format and probe it
+
+        Returns ``format``, ``extension``, ``is_video`` and ``probe_data``
+        (None when the header couldn't be parsed). The sparse file at
+        ``path`` is removed afterwards.
+        """
+        try:
+            head_chunks = self.config.INSPECT_HEAD_CHUNKS
+            head = await self.fetch(message, path, 0, head_chunks, file_size)
+
+            result = {
+                'format': None,
+                'extension': None,
+                'is_video': False,
+                'probe_data': None
+            }
+            sniffed = self.sniff(head)
+            if sniffed is None:
+                return result
+            result['format'], result['extension'], result['is_video'] = sniffed
+            if not result['is_video']:
+                return result
+
+            if result['format'] in ('mp4', 'mov'):
+                moov = self.find_moov(head, file_size)
+                if moov is not None and moov >= len(head):
+                    first = moov // self.STREAM_CHUNK
+                    count = -(-(file_size - first * self.STREAM_CHUNK) // self.STREAM_CHUNK)
+                    if count > self.config.INSPECT_MAX_TAIL_CHUNKS:
+                        logger.info("moov box too large to fetch, skipping header probe")
+                        return result
+                    await self.fetch(message, path, first, count, file_size)
+
+            result['probe_data'] = await self.probe(path, file_size)
+            return result
+
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+    async def fetch(
+        self,
+        message: Message,
+        path: str,
+        first_chunk: int,
+        chunks: int,
+        file_size: int
+    ) -> bytes:
+        """Stream a range of chunks into place in a sparse file of the full size"""
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, file_size)
+            written = await self.downloader.pool.run(
+                lambda client: self.downloader.fetch_range(
+                    client, message, fd, first_chunk, chunks, file_size=file_size
+                )
+            )
+            return os.pread(fd, written, first_chunk * self.STREAM_CHUNK)
+        finally:
+            os.close(fd)
+
+    def sniff(self, head: bytes) -> Optional[Tuple[str, str, bool]]:
+        """Identify the real container from magic bytes"""
+        for offset, magic, info in self.SIGNATURES:
+            if head[offset:offset + len(magic)] == magic:
+                if info[0] == 'matroska' and b"webm" in head[:64]:
+                    return ('webm', '.webm', True)
+                return info
+        if head[:4] == b"RIFF" and head[8:12] == b"AVI ":
+            return ('avi', '.avi', True)
+        if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+            return ('wav', '.wav', False)
+        # MPEG-TS: sync byte every 188 bytes
+        if len(head) >= 188 * 3 and all(head[i * 188] == 0x47 for i in range(3)):
+            return ('mpegts', '.ts', True)
+        return None
+
+    @staticmethod
+    def find_moov(head: bytes, file_size: int) -> Optional[int]:
+        """Walk top-level MP4 boxes and return the offset of ``moov``
+
+        Box headers past the fetched head are found from the sizes of the
+        boxes before them, so a ``moov`` at the end is located without
+        reading the ``mdat`` in between.
+        """
+        offset = 0
+        while offset + 8 <= file_size:
+            if offset + 16 > len(head):
+                # Only the box we are standing on can be outside the head
+                return None
+            size, box_type = struct.unpack(">I4s", head[offset:offset + 8])
+            if size == 1:
+                size = struct.unpack(">Q", head[offset + 8:offset + 16])[0]
+            elif size == 0:
+                size = file_size - offset
+            if box_type == b"moov":
+                return offset
+            if size < 8:
+                return None
+            offset += size
+            if offset >= len(head) and offset < file_size:
+                # Next box starts beyond the head: assume it's the trailing moov
+                return offset
+        return None
+
+    async def probe(self, path: str, file_size: int) -> Optional[Dict]:
+        """Probe the sparse file with ffprobe, falling back to hachoir"""
+        try:
+            probe_data = await self.ffmpeg.probe_video(path)
+            probe_data.setdefault('format', {})['size'] = str(file_size)
+            return probe_data
+        except Exception as e:
+            logger.info(f"ffprobe couldn't read the header, trying hachoir: {e}")
+
+        try:
+            parser = createParser(path)
+            if not parser:
+                return None
+            with parser:
+                metadata = extractMetadata(parser)
+            if not metadata:
+                return None
+            return self.metadata_to_probe(metadata, file_size)
+        except Exception as e:
+            logger.error(f"Error parsing header with hachoir: {e}")
+            return None
+
+    @staticmethod
+    def metadata_to_probe(metadata, file_size: int) -> Dict:
+        """Convert hachoir metadata into the subset of ffprobe output we use"""
+        streams: List[Dict] = []
+        if metadata.has('width') and metadata.has('height'):
+            streams.append({
+                'index': 0,
+                'codec_type': 'video',
+                'codec_name': metadata.get('compression', 'unknown'),
+                'width': metadata.get('width'),
+                'height': metadata.get('height')
+            })
+        fmt = {'size': str(file_size), 'format_name': metadata.get('mime_type', 'unknown')}
+        if metadata.has('duration'):
+            fmt['duration'] = str(metadata.get('duration').total_seconds())
+        if metadata.has('bit_rate'):
+            fmt['bit_rate'] = str(metadata.get('bit_rate'))
+        return {'format': fmt, 'streams': streams}
@@ -0,0 +1,479 @@
+import logging
+from typing import Dict, List, Optional
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class OperationGraph:
+    """Chain of edit operations applied to a single input file"""
+
+    def __init__(self):
+        self.operations: List[Dict] = []
+
+    def add(self, op_type: str, **params) -> 'OperationGraph':
+        """Append an operation node"""
+        self.operations.append({'type': op_type, 'params': params})
+        return self
+
+    def trim(
+        self,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        duration: Optional[float] = None
+    ) -> 'OperationGraph':
+        """Keep only part of the timeline, relative to the previous trims"""
+        return self.add('trim', start=start, end=end, duration=duration)
+
+    def select_streams(
+        self,
+        video: bool = True,
+        audio: Optional[List[int]] = None,
+        drop_audio: Optional[List[int]] = None,
+        subtitles: Optional[List[int]] = None
+    ) -> 'OperationGraph':
+        """Choose which streams are carried to the output (track indices are per type)"""
+        return self.add(
+            'streams',
+            video=video,
+            audio=audio,
+            drop_audio=drop_audio,
+            subtitles=subtitles
+        )
+
+    def scale(self, resolution: str) -> 'OperationGraph':
+        """Scale video to one of the resolution presets"""
+        return self.add('scale', resolution=resolution)
+
+    def encode(
+        self,
+        codec: Optional[str] = 'libx265',
+        quality: str = 'medium',
+        audio_codec: Optional[str] = None,
+        audio_bitrate: Optional[str] = None
+    ) -> 'OperationGraph':
+        """Set video/audio encoding (None codec means stream copy)"""
+        return self.add(
+            'encode',
+            codec=codec,
+            quality=quality,
+            audio_codec=audio_codec,
+            audio_bitrate=audio_bitrate
+        )
+
+    def crop(self, width: int, height: int, x: int, y: int) -> 'OperationGraph':
+        """Cut the picture down to a rectangle of the source frame"""
+        return self.add('crop', width=width, height=height, x=x, y=y)
+
+    def decimate(self) -> 'OperationGraph':
+        """Drop near-duplicate frames, keeping the timing of the rest (VFR output)"""
+        return self.add('decimate')
+
+    def subtitles(self, mode: str = 'copy') -> 'OperationGraph':
+        """Subtitle handling: copy, drop or convert (to the container's text format)"""
+        return self.add('subtitles', mode=mode)
+
+    def metadata(
+        self,
+        title: Optional[str] = None,
+        strip: bool = False,
+        tags: Optional[Dict[str, str]] = None
+    ) -> 'OperationGraph':
+        """Set or strip container metadata"""
+        return self.add('metadata', title=title, strip=strip, tags=tags or {})
+
+    def is_empty(self) -> bool:
+        """Check whether any operation has been added"""
+        return not self.operations
+
+    def needs_video_encode(self) -> bool:
+        """Check whether the video stream has to be decoded"""
+        return any(op['type'] in ('scale', 'crop', 'decimate') for op in self.operations) or any(
+            op['type'] == 'encode' and op['params'].get('codec')
+            for op in self.operations
+        )
+
+    def to_list(self) -> List[Dict]:
+        """Serialize the graph (JSON compatible)"""
+        return self.copy().operations
+
+    @classmethod
+    def from_list(cls, operations: List[Dict]) -> 'OperationGraph':
+        """Rebuild a graph serialized with to_list"""
+        graph = cls()
+        for op in operations:
+            graph.add(op['type'], **op.get('params', {}))
+        return graph
+
+    def copy(self) -> 'OperationGraph':
+        """Return a shallow copy of the graph"""
+        graph = OperationGraph()
+        graph.operations = [
+            {'type': op['type'], 'params': dict(op['params'])}
+            for op in self.operations
+        ]
+        return graph
+
+
+class GraphCompiler:
+    """Lower an OperationGraph into one FFmpeg invocation"""
+
+    # Text subtitle codec each container can hold
+    SUBTITLE_CODECS = {
+        '.mp4': 'mov_text',
+        '.m4v': 'mov_text',
+        '.mov': 'mov_text',
+        '.mkv': 'srt',
+        '.webm': 'webvtt'
+    }
+
+    # Index bytes per sample in the moov box (stsz, stco/co64, stts, ctts, stss)
+    MOOV_SAMPLE_BYTES = {'video': 32, 'audio': 16}
+    MOOV_BASE_SIZE = 64 * 1024
+
+    def __init__(self):
+        self.config = Config()
+
+    def compile(
+        self,
+        graph: OperationGraph,
+        input_path: str,
+        output_path: str,
+        probe_data: Optional[Dict] = None,
+        seek_offset: float = 0.0,
+        output_args: Optional[List[str]] = None
+    ) -> List[str]:
+        """Build the FFmpeg command for the whole graph
+
+        ``seek_offset`` skips the beginning of the (already trimmed) output,
+        used when resuming from a checkpoint. ``output_args`` replaces the
+        default muxer options and output path.
+        """
+        state = self.reduce(graph, probe_data)
+
+        cmd = ["ffmpeg", "-hide_banner"]
+
+        # Trims become input-side seeks so skipped parts are never decoded
+        start = state['start'] + seek_offset
+        if start:
+            cmd.extend(["-ss", f"{start:.3f}"])
+        if state['duration'] is not None:
+            cmd.extend(["-t", f"{max(0.0, state['duration'] - seek_offset):.3f}"])
+        cmd.extend(["-i", input_path])
+
+        # Filtergraph and stream mapping
+        video_filters = state['video_filters']
+        if state['video']:
+            if video_filters:
+                cmd.extend([
+                    "-filter_complex",
+                    f"[0:v:0]{','.join(video_filters)}[vout]"
+                ])
+                cmd.extend(["-map", "[vout]"])
+            else:
+                cmd.extend(["-map", "0:v:0?"])
+
+        if state['audio'] is None:
+            cmd.extend(["-map", "0:a?"])
+        else:
+            for index in state['audio']:
+                cmd.extend(["-map", f"0:a:{index}"])
+
+        if state['subtitle_mode'] != 'drop':
+            if state['subtitles'] is None:
+                cmd.extend(["-map", "0:s?"])
+            else:
+                for index in state['subtitles']:
+                    cmd.extend(["-map", f"0:s:{index}"])
+
+        # Codecs
+        if state['video']:
+            # Filtering forces a re-encode, fall back to x265 if no codec was chosen
+            codec = state['codec'] or ('libx265' if video_filters else None)
+            if codec:
+                cmd.extend(["-c:v", codec])
+                if codec == 'libx265':
+                    preset = self.config.COMPRESSION_PRESETS[state['quality']]
+                    cmd.extend([
+                        "-crf", str(preset['crf']),
+                        "-preset", preset['preset'],
+                        "-tune", preset['tune'],
+                        "-x265-params", preset['x265-params']
+                    ])
+            else:
+                cmd.extend(["-c:v", "copy"])
+            if state['vfr']:
+                # Keep dropped frames dropped instead of duplicating them back
+                cmd.extend(["-fps_mode", "vfr"])
+        else:
+            cmd.extend(["-vn"])
+
+        if state['audio'] == []:
+            cmd.extend(["-an"])
+        elif state['audio_codec']:
+            cmd.extend(["-c:a", state['audio_codec']])
+            if state['audio_bitrate']:
+                cmd.extend(["-b:a", state['audio_bitrate']])
+        else:
+            cmd.extend(["-c:a", "copy"])
+
+        if state['subtitle_mode'] == 'drop':
+            cmd.extend(["-sn"])
+        elif state['subtitle_mode'] == 'convert':
+            extension = output_path[output_path.rfind('.'):].lower()
+            cmd.extend(["-c:s", self.SUBTITLE_CODECS.get(extension, 'copy')])
+        else:
+            cmd.extend(["-c:s", "copy"])
+
+        # Metadata
+        if state['strip_metadata']:
+            cmd.extend(["-map_metadata", "-1", "-map_chapters", "-1"])
+        if state['title'] is not None:
+            cmd.extend(["-metadata", f"title={state['title']}"])
+        for key, value in state['tags'].items():
+            cmd.extend(["-metadata", f"{key}={value}"])
+
+        if output_args is not None:
+            cmd.extend(output_args)
+            return cmd
+
+        cmd.extend(self.finalize_args(output_path, probe_data, state['duration']))
+        cmd.extend(["-y", output_path])
+        return cmd
+
+    def finalize_args(
+        self,
+        output_path: str,
+        probe_data: Optional[Dict] = None,
+        duration: Optional[float] = None
+    ) -> List[str]:
+        """Muxer options that put the MP4 index up front without a second pass
+
+        ``+faststart`` rewrites the whole file after encoding to move the
+        moov box forward. ``moov_reserve`` leaves room for it at the start
+        instead, sized from the probe; ``fragmented`` writes fragments that
+        need no final index at all.
+        """
+        if not output_path.lower().endswith(('.mp4', '.m4v', '.mov')):
+            return []
+
+        mode = self.config.OUTPUT_FINALIZATION
+        if mode == 'moov_reserve':
+            size = self.estimate_moov_size(probe_data, duration)
+            if size:
+                return ["-moov_size", str(size)]
+            # Unknown length, nothing to size the reservation from
+            return ["-movflags", "+faststart"]
+        if mode == 'fragmented':
+            return ["-movflags", "+frag_keyframe+empty_moov+default_base_moof"]
+        if mode == 'faststart':
+            return ["-movflags", "+faststart"]
+        return []
+
+    def estimate_moov_size(
+        self,
+        probe_data: Optional[Dict],
+        duration: Optional[float] = None
+    ) -> Optional[int]:
+        """Upper bound for the moov box of an output of ``duration`` seconds"""
+        if not probe_data:
+            return None
+        total = float(probe_data.get('format', {}).get('duration') or 0)
+        if duration is None:
+            duration = total
+        if not duration:
+            return None
+
+        size = self.MOOV_BASE_SIZE
+        for stream in probe_data.get('streams', []):
+            kind = stream.get('codec_type')
+            if kind == 'video':
+                frames = int(stream.get('nb_frames') or 0)
+                if frames and total:
+                    rate = frames / total
+                else:
+                    rate = self._frame_rate(stream.get('avg_frame_rate')) or \
+                        self._frame_rate(stream.get('r_frame_rate')) or 60
+            elif kind == 'audio':
+                # One sample per encoded frame, 1024 PCM samples for AAC
+                rate = int(stream.get('sample_rate') or 48000) / 1024
+            else:
+                continue
+            size += int(duration * rate * self.MOOV_SAMPLE_BYTES[kind])
+
+        # ffmpeg fails the output if the reservation is too small
+        return int(size * self.config.MOOV_RESERVE_FACTOR)
+
+    @staticmethod
+    def _frame_rate(value: Optional[str]) -> float:
+        """Parse an ffprobe rate like ``30000/1001``"""
+        try:
+            num, _, den = (value or "").partition('/')
+            return float(num) / float(den or 1)
+        except (ValueError, ZeroDivisionError):
+            return 0.0
+
+    def reduce(self, graph: OperationGraph, probe_data: Optional[Dict] = None) -> Dict:
+        """Fold the operation chain into the final output state"""
+        state = {
+            'start': 0.0,
+            'duration': None,
+            'video': True,
+            'video_filters': [],
+            'resolution': None,
+            'crop': None,
+            'vfr': False,
+            'audio': None,
+            'subtitles': None,
+            'subtitle_mode': 'copy',
+            'codec': None,
+            'quality': 'medium',
+            'audio_codec': None,
+            'audio_bitrate': None,
+            'title': None,
+            'strip_metadata': False,
+            'tags': {}
+        }
+
+        for op in graph.operations:
+            params = op['params']
+            op_type = op['type']
+
+            if op_type == 'trim':
+                self._apply_trim(state, params)
+
+            elif op_type == 'streams':
+                state['video'] = params.get('video', True)
+                if params.get('audio') is not None:
+                    current = self._audio_tracks(state, probe_data)
+                    # Indices refer to the tracks left by previous selections
+                    state['audio'] = [
+                        current[i] for i in params['audio'] if i < len(current)
+                    ]
+                if params.get('drop_audio'):
+                    current = self._audio_tracks(state, probe_data)
+                    dropped = set(params['drop_audio'])
+                    state['audio'] = [
+                        track for position, track in enumerate(current)
+                        if position not in dropped
+                    ]
+                if params.get('subtitles') is not None:
+                    state['subtitles'] = list(params['subtitles'])
+
+            elif op_type == 'scale':
+                scale_params = self.config.RESOLUTION_PRESETS[params['resolution']]
+                state['resolution'] = params['resolution']
+                # A later scale replaces the earlier one instead of scaling twice
+                state['video_filters'] = [
+                    f for f in state['video_filters']
+                    if not f.startswith(('scale=', 'pad='))
+                ]
+                state['video_filters'].extend([
+                    f"scale={scale_params['width']}:{scale_params['height']}"
+                    ":force_original_aspect_ratio=decrease",
+                    "pad=ceil(iw/2)*2:ceil(ih/2)*2"
+                ])
+
+            elif op_type == 'crop':
+                state['video_filters'] = [
+                    f for f in state['video_filters'] if not f.startswith('crop=')
+                ]
+                # Before scaling, so the scaler only sees the picture
+                position = next(
+                    (i for i, f in enumerate(state['video_filters']) if f.startswith('scale=')),
+                    len(state['video_filters'])
+                )
+                state['video_filters'].insert(
+                    position,
+                    f"crop={params['width']}:{params['height']}:{params['x']}:{params['y']}"
+                )
+                state['crop'] = (params['width'], params['height'])
+
+            elif op_type == 'decimate':
+                if 'mpdecimate' not in state['video_filters']:
+                    # Ahead of any scaling so it compares full frames cheaply once
+                    state['video_filters'].insert(0, 'mpdecimate')
+                state['vfr'] = True
+
+            elif op_type == 'encode':
+                state['codec'] = params.get('codec')
+                state['quality'] = params.get('quality') or state['quality']
+                if params.get('audio_codec'):
+                    state['audio_codec'] = params['audio_codec']
+                    state['audio_bitrate'] = params.get('audio_bitrate')
+
+            elif op_type == 'subtitles':
+                state['subtitle_mode'] = params.get('mode', 'copy')
+
+            elif op_type == 'metadata':
+                if params.get('strip'):
+                    state['strip_metadata'] = True
+                    state['tags'] = {}
+                if params.get('title') is not None:
+                    state['title'] = params['title']
+                state['tags'].update(params.get('tags', {}))
+
+            else:
+                logger.warning(f"Unknown operation in graph: {op_type}")
+
+        return state
+
+    def output_metadata(self, graph: OperationGraph, probe_data: Dict) -> Dict:
+        """Predict the output's duration and frame size without probing it"""
+        state = self.reduce(graph, probe_data)
+        duration = state['duration']
+        if duration is None:
+            total = float(probe_data.get('format', {}).get('duration') or 0)
+            duration = max(0.0, total - state['start'])
+
+        video = next(
+            (s for s in probe_data.get('streams', []) if s.get('codec_type') == 'video'),
+            {}
+        )
+        width = int(video.get('width') or 0)
+        height = int(video.get('height') or 0)
+        if state['crop']:
+            width, height = state['crop']
+        if state['resolution'] and width and height:
+            # Same arithmetic as scale=...:force_original_aspect_ratio=decrease + even pad
+            target = self.config.RESOLUTION_PRESETS[state['resolution']]
+            factor = min(target['width'] / width, target['height'] / height)
+            width = -(-int(width * factor) // 2) * 2
+            height = -(-int(height * factor) // 2) * 2
+
+        return {
+            'duration': duration,
+            'width': width,
+            'height': height,
+            'video': bool(state['video'] and video)
+        }
+
+    @staticmethod
+    def _apply_trim(state: Dict, params: Dict):
+        """Compose a trim with the window selected so far"""
+        start = float(params.get('start') or 0)
+        if params.get('duration') is not None:
+            length = float(params['duration'])
+        elif params.get('end') is not None:
+            length = max(0.0, float(params['end']) - start)
+        else:
+            length = None
+
+        if state['duration'] is not None:
+            remaining = max(0.0, state['duration'] - start)
+            length = remaining if length is None else min(length, remaining)
+
+        state['start'] += start
+        state['duration'] = length
+
+    @staticmethod
+    def _audio_tracks(state: Dict, probe_data: Optional[Dict]) -> List[int]:
+        """Get the audio tracks currently selected"""
+        if state['audio'] is not None:
+            return state['audio']
+        if not probe_data:
+            raise ValueError("Probe data is required to select audio tracks")
+        count = sum(
+            1 for stream in probe_data.get('streams', [])
+            if stream.get('codec_type') == 'audio'
+        )
+        return list(range(count))
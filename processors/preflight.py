@@ -0,0 +1,282 @@
+import os
+import shutil
+import logging
+from typing import Dict, List, Optional, Tuple
+from config import Config
+from .ffmpeg_processor import FFmpegProcessor
+from .operation_graph import OperationGraph
+
+logger = logging.getLogger(__name__)
+
+class PreflightError(Exception):
+    """The planned job cannot produce a valid output"""
+
+
+class Preflight:
+    """Check a planned job against the input and the output container
+
+    Problems with a known fix (subtitles the container can't hold, audio
+    that can't be stream-copied) are corrected by appending operations to
+    the graph; anything else raises ``PreflightError`` before the encode
+    starts. An optional one-second trial run catches what the table can't.
+    """
+
+    TEXT_SUBTITLES = {'subrip', 'srt', 'ass', 'ssa', 'webvtt', 'mov_text', 'text'}
+
+    # Codecs each container can carry; None means anything goes
+    CONTAINER_CAPABILITIES = {
+        '.mp4': {
+            'video': {'h264', 'hevc', 'mpeg4', 'av1', 'vp9', 'mpeg2video'},
+            'audio': FFmpegProcessor.MP4_AUDIO_CODECS,
+            'subtitle': {'mov_text'}
+        },
+        '.mov': {
+            'video': {'h264', 'hevc', 'mpeg4', 'prores', 'mjpeg', 'mpeg2video'},
+            'audio': {'aac', 'mp3', 'ac3', 'eac3', 'alac', 'pcm_s16le', 'pcm_s24le'},
+            'subtitle': {'mov_text'}
+        },
+        '.webm': {
+            'video': {'vp8', 'vp9', 'av1'},
+            'audio': {'opus', 'vorbis'},
+            'subtitle': {'webvtt'}
+        },
+        '.avi': {
+            'video': {'h264', 'mpeg4', 'mjpeg', 'msmpeg4v3'},
+            'audio': {'mp3', 'ac3', 'pcm_s16le'},
+            'subtitle': set()
+        },
+        '.mkv': None,
+        '.flv': {
+            'video': {'h264', 'flv1'},
+            'audio': {'aac', 'mp3'},
+            'subtitle': set()
+        }
+    }
+    CONTAINER_CAPABILITIES['.m4v'] = CONTAINER_CAPABILITIES['.mp4']
+
+    # Codec name ffprobe reports for the output of an encoder
+    ENCODER_CODECS = {
+        'libx265': 'hevc',
+        'libx264': 'h264',
+        'libvpx-vp9': 'vp9',
+        'libaom-av1': 'av1',
+        'libsvtav1': 'av1',
+        'aac': 'aac',
+        'libopus': 'opus',
+        'libmp3lame': 'mp3'
+    }
+
+    # Audio encoder used when copying is impossible
+    FALLBACK_AUDIO = {
+        '.webm': ('libopus', '128k')
+    }
+
+    def __init__(self, ffmpeg: FFmpegProcessor):
+        self.config = Config()
+        self.ffmpeg = ffmpeg
+
+    async def check(
+        self,
+        input_path: str,
+        output_path: str,
+        graph: OperationGraph
+    ) -> Tuple[OperationGraph, List[str]]:
+        """Validate a job, returns the corrected graph and the corrections made"""
+        probe_data = await self.ffmpeg.probe_video(input_path)
+        graph = graph.copy()
+        fixes: List[str] = []
+
+        extension = os.path.splitext(output_path)[1].lower()
+        caps = self.CONTAINER_CAPABILITIES.get(extension)
+        state = self.ffmpeg.compiler.reduce(graph, probe_data)
+        streams = self.streams_by_type(probe_data)
+        total = float(probe_data.get('format', {}).get('duration') or 0)
+
+        if total and state['start'] >= total:
+            raise PreflightError(
+                f"Start position {state['start']:.1f}s is past the end of the video ({total:.1f}s)"
+            )
+        if state['video'] and state['video_filters'] and not streams['video']:
+            raise PreflightError("The file has no video stream to process")
+
+        if caps is not None:
+            self._check_video(state, streams, caps, extension)
+            self._fix_audio(graph, state, streams, caps, extension, fixes)
+            self._fix_subtitles(graph, state, streams, caps, extension, fixes)
+
+        if self.config.PREFLIGHT_DRY_RUN:
+            await self.dry_run(input_path, output_path, graph, probe_data)
+
+        for fix in fixes:
+            logger.info(f"Preflight: {fix}")
+        return graph, fixes
+
+    async def dry_run(
+        self,
+        input_path: str,
+        output_path: str,
+        graph: OperationGraph,
+        probe_data: Dict
+    ):
+        """Encode one second into the real container and discard it"""
+        base, extension = os.path.splitext(output_path)
+        trial_path = f"{base}.preflight{extension}"
+        cmd = self.ffmpeg.compiler.compile(
+            graph,
+            input_path,
+            output_path,
+            probe_data,
+            output_args=["-t", "1", "-y", trial_path]
+        )
+        try:
+            await self.run_trial(cmd)
+        finally:
+            if os.path.exists(trial_path):
+                os.remove(trial_path)
+
+    async def check_ladder(
+        self,
+        input_path: str,
+        output_dir: str,
+        resolutions: List[str],
+        quality: str = 'medium',
+        packaging: Optional[str] = None
+    ):
+        """Validate a rendition ladder with the command that will run
+
+        The ladder is one command rather than a graph, so the trial encodes
+        one second of it into a scratch directory next to ``output_dir``.
+        """
+        probe_data = await self.ffmpeg.probe_video(input_path)
+        if not self.streams_by_type(probe_data)['video']:
+            raise PreflightError("The file has no video stream to process")
+        if not self.config.PREFLIGHT_DRY_RUN:
+            return
+
+        trial_dir = f"{output_dir}.preflight"
+        os.makedirs(trial_dir, exist_ok=True)
+        try:
+            cmd, _ = await self.ffmpeg.build_ladder_command(
+                input_path, trial_dir, resolutions, quality, packaging
+            )
+            # As an input option the limit applies to every rendition at once
+            position = cmd.index("-i")
+            cmd[position:position] = ["-t", "1"]
+            await self.run_trial(cmd)
+        finally:
+            shutil.rmtree(trial_dir, ignore_errors=True)
+
+    async def run_trial(self, cmd: List[str]):
+        """Run a trial encode, raising PreflightError with FFmpeg's last words"""
+        result = await self.ffmpeg.supervisor.run(
+            cmd,
+            budget=self.config.PREFLIGHT_TIMEOUT,
+            stall_timeout=self.config.PREFLIGHT_TIMEOUT
+        )
+        if not result.ok:
+            lines = result.stderr.strip().splitlines() or ["unknown error"]
+            raise PreflightError(f"Trial encode failed: {result.killed or lines[-1]}")
+
+    def _check_video(self, state: Dict, streams: Dict, caps: Dict, extension: str):
+        """Reject video the container can't hold"""
+        if not state['video'] or not streams['video']:
+            return
+        codec = state['codec'] or ('libx265' if state['video_filters'] else None)
+        if codec:
+            name = self.ENCODER_CODECS.get(codec, codec)
+        else:
+            name = streams['video'][0].get('codec_name')
+        if name not in caps['video']:
+            raise PreflightError(f"{extension} can't hold {name} video")
+
+    def _fix_audio(
+        self,
+        graph: OperationGraph,
+        state: Dict,
+        streams: Dict,
+        caps: Dict,
+        extension: str,
+        fixes: List[str]
+    ):
+        """Re-encode audio that can't be copied into the container"""
+        if state['audio'] == []:
+            return
+        tracks = streams['audio']
+        if state['audio'] is not None:
+            tracks = [tracks[i] for i in state['audio'] if i < len(tracks)]
+
+        if state['audio_codec']:
+            codec = self.ENCODER_CODECS.get(state['audio_codec'], state['audio_codec'])
+            incompatible = [] if codec in caps['audio'] else [codec]
+        else:
+            incompatible = [
+                track.get('codec_name') for track in tracks
+                if track.get('codec_name') not in caps['audio']
+            ]
+        if not incompatible:
+            return
+
+        audio_codec, bitrate = self.FALLBACK_AUDIO.get(extension, ('aac', '192k'))
+        graph.encode(
+            codec=state['codec'],
+            quality=state['quality'],
+            audio_codec=audio_codec,
+            audio_bitrate=bitrate
+        )
+        fixes.append(
+            f"Audio ({', '.join(sorted(set(incompatible)))}) re-encoded to "
+            f"{audio_codec}, {extension} can't hold it"
+        )
+
+    def _fix_subtitles(
+        self,
+        graph: OperationGraph,
+        state: Dict,
+        streams: Dict,
+        caps: Dict,
+        extension: str,
+        fixes: List[str]
+    ):
+        """Convert text subtitles and drop image subtitles the container can't hold"""
+        if state['subtitle_mode'] == 'drop' or not streams['subtitle']:
+            return
+        selected = state['subtitles']
+        if selected is None:
+            selected = list(range(len(streams['subtitle'])))
+        selected = [i for i in selected if i < len(streams['subtitle'])]
+
+        keep = []
+        dropped = []
+        needs_convert = False
+        for index in selected:
+            codec = streams['subtitle'][index].get('codec_name')
+            if codec in caps['subtitle'] and state['subtitle_mode'] == 'copy':
+                keep.append(index)
+            elif codec in self.TEXT_SUBTITLES and caps['subtitle']:
+                keep.append(index)
+                needs_convert = True
+            else:
+                dropped.append(codec)
+
+        if not keep:
+            graph.subtitles('drop')
+        else:
+            if dropped:
+                graph.select_streams(video=state['video'], subtitles=keep)
+            if needs_convert and state['subtitle_mode'] != 'convert':
+                graph.subtitles('convert')
+                fixes.append(f"Text subtitles converted for {extension}")
+        if dropped:
+            fixes.append(
+                f"Subtitles ({', '.join(sorted(set(map(str, dropped))))}) dropped, "
+                f"{extension} can't hold them"
+            )
+
+    @staticmethod
+    def streams_by_type(probe_data: Dict) -> Dict[str, List[Dict]]:
+        """Group probed streams by type, in per-type index order"""
+        streams: Dict[str, List[Dict]] = {'video': [], 'audio': [], 'subtitle': []}
+        for stream in probe_data.get('streams', []):
+            if stream.get('codec_type') in streams:
+                streams[stream['codec_type']].append(stream)
+        return streams
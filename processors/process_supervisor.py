@@ -0,0 +1,272 @@
+import os
+import re
+import time
+import signal
+import asyncio
+import resource
+import logging
+from collections import deque
+from typing import Awaitable, Callable, List, Optional
+from config import Config
+from utils.metrics import FAILURES, JOB_FPS, JOB_SPEED, PROCESSES
+from .job_scheduler import attach_process, current_job, detach_process
+
+logger = logging.getLogger(__name__)
+
+class ProcessResult:
+    """Outcome of a supervised child process"""
+
+    __slots__ = ('returncode', 'stdout', 'stderr', 'killed')
+
+    def __init__(self, returncode: int, stdout: bytes, stderr: str, killed: Optional[str]):
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.killed = killed
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0 and self.killed is None
+
+
+class ProcessSupervisor:
+    """Run ffmpeg/ffprobe children under a watchdog
+
+    Each child gets its own process group and data-size/CPU limits.
+    It is killed (SIGTERM, then SIGKILL after a grace period) when it stops
+    making progress for ``stall_timeout`` seconds or outlives its wall-clock
+    budget. Time the job spends paused by the scheduler counts towards
+    neither.
+    """
+
+    TIME_PATTERN = re.compile(r"time=\s*(\S+)")
+    FPS_PATTERN = re.compile(r"fps=\s*([\d.]+)")
+    SPEED_PATTERN = re.compile(r"speed=\s*([\d.]+)x")
+
+    def __init__(self):
+        self.config = Config()
+
+    def budget(self, duration: Optional[float]) -> float:
+        """Wall-clock allowance for processing ``duration`` seconds of media
+
+        The hard cap grows with the cost model's prediction for the running
+        job, so a long encode expected to be slow isn't killed halfway.
+        """
+        cap = self.config.FFMPEG_MAX_RUNTIME
+        job = current_job.get()
+        if job is not None:
+            cap = max(cap, job.cost * self.config.FFMPEG_PREDICTION_MARGIN)
+        if not duration:
+            return cap
+        return min(
+            cap,
+            max(self.config.FFMPEG_MIN_BUDGET, duration * self.config.FFMPEG_BUDGET_FACTOR)
+        )
+
+    async def run(
+        self,
+        cmd: List[str],
+        on_line: Optional[Callable[[str], Awaitable]] = None,
+        budget: Optional[float] = None,
+        stall_timeout: Optional[float] = None,
+        on_stdout: Optional[Callable[[bytes], Awaitable]] = None
+    ) -> ProcessResult:
+        """Run a command to completion or until the watchdog kills it
+
+        ``on_line`` receives every stderr line, split on both ``\\r`` and
+        ``\\n`` since ffmpeg rewrites its stats line in place. With
+        ``on_stdout`` the output is streamed to it in chunks instead of
+        being collected.
+        """
+        budget = budget or self.budget(None)
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True
+        )
+        self._apply_limits(process.pid, budget)
+        attach_process(process)
+        command = os.path.basename(cmd[0])
+        PROCESSES.inc(command=command)
+
+        tail: deque = deque(maxlen=50)
+        job = current_job.get()
+        state = {
+            'activity': time.monotonic(),
+            'last_time': None,
+            # fps/speed gauges are per scheduler job, or per child outside of one
+            'label': str(job.id) if job is not None else f"pid{process.pid}",
+            'reported': False
+        }
+        if on_stdout:
+            stdout_task = asyncio.create_task(self._stream_stdout(process, on_stdout, state))
+        else:
+            stdout_task = asyncio.create_task(process.stdout.read())
+        stderr_task = asyncio.create_task(self._read_stderr(process, on_line, tail, state))
+        killed = None
+
+        try:
+            killed = await self._watch(process, budget, stall_timeout, state)
+            stdout = await stdout_task
+            await stderr_task
+            await process.wait()
+        except asyncio.CancelledError:
+            await self.kill(process)
+            raise
+        finally:
+            stdout_task.cancel()
+            stderr_task.cancel()
+            detach_process(process)
+            PROCESSES.dec(command=command)
+            if state['reported']:
+                JOB_FPS.remove(job=state['label'])
+                JOB_SPEED.remove(job=state['label'])
+
+        if killed:
+            logger.error(f"Killed {cmd[0]} (pid {process.pid}): {killed}")
+            FAILURES.inc(stage=command, cause="budget" if "budget" in killed else "stalled")
+        elif process.returncode != 0:
+            FAILURES.inc(stage=command, cause="signal" if process.returncode < 0 else "exit_status")
+        return ProcessResult(process.returncode, stdout, "\n".join(tail), killed)
+
+    async def _watch(
+        self,
+        process: asyncio.subprocess.Process,
+        budget: float,
+        stall_timeout: Optional[float],
+        state: dict
+    ) -> Optional[str]:
+        """Poll the child until it exits; returns why it was killed, if it was"""
+        job = current_job.get()
+        started = time.monotonic()
+        paused_before = job.paused_seconds() if job else 0.0
+
+        while True:
+            try:
+                await asyncio.wait_for(asyncio.shield(process.wait()), timeout=1)
+                return None
+            except asyncio.TimeoutError:
+                pass
+
+            now = time.monotonic()
+            if job is not None and job.paused_at is not None:
+                # A stopped child can't make progress, don't hold it against it
+                state['activity'] = now
+                continue
+
+            paused = job.paused_seconds() - paused_before if job else 0.0
+            if now - started - paused > budget:
+                await self.kill(process)
+                return f"exceeded its {int(budget)}s budget"
+            if stall_timeout and now - state['activity'] > stall_timeout:
+                await self.kill(process)
+                return f"no progress for {int(stall_timeout)}s"
+
+    async def _stream_stdout(
+        self,
+        process: asyncio.subprocess.Process,
+        on_stdout: Callable[[bytes], Awaitable],
+        state: dict
+    ) -> bytes:
+        """Hand stdout to the consumer as it arrives; data counts as progress"""
+        while True:
+            chunk = await process.stdout.read(1024 * 1024)
+            if not chunk:
+                return b""
+            state['activity'] = time.monotonic()
+            await on_stdout(chunk)
+
+    async def _read_stderr(
+        self,
+        process: asyncio.subprocess.Process,
+        on_line: Optional[Callable[[str], Awaitable]],
+        tail: deque,
+        state: dict
+    ):
+        """Split stderr into lines, track progress and keep a bounded tail"""
+        buffer = b""
+        while True:
+            chunk = await process.stderr.read(4096)
+            if not chunk:
+                break
+            buffer += chunk
+            parts = re.split(rb"[\r\n]", buffer)
+            buffer = parts.pop()
+            for part in parts:
+                if part:
+                    await self._handle_line(part.decode('utf-8', 'replace'), on_line, tail, state)
+        if buffer:
+            await self._handle_line(buffer.decode('utf-8', 'replace'), on_line, tail, state)
+
+    async def _handle_line(
+        self,
+        line: str,
+        on_line: Optional[Callable[[str], Awaitable]],
+        tail: deque,
+        state: dict
+    ):
+        # A repeated stats line with the same timestamp is not progress
+        match = self.TIME_PATTERN.search(line)
+        if match is None or match.group(1) != state['last_time']:
+            state['activity'] = time.monotonic()
+        if match is not None:
+            state['last_time'] = match.group(1)
+            fps = self.FPS_PATTERN.search(line)
+            speed = self.SPEED_PATTERN.search(line)
+            if fps:
+                JOB_FPS.set(float(fps.group(1)), job=state['label'])
+                state['reported'] = True
+            if speed:
+                JOB_SPEED.set(float(speed.group(1)), job=state['label'])
+                state['reported'] = True
+        else:
+            tail.append(line)
+
+        if on_line:
+            try:
+                await on_line(line)
+            except Exception as e:
+                logger.error(f"Error handling process output: {e}")
+
+    async def kill(self, process: asyncio.subprocess.Process):
+        """Terminate the child's whole process group, escalating to SIGKILL"""
+        if process.returncode is not None:
+            return
+        try:
+            pgid = os.getpgid(process.pid)
+            if pgid == os.getpgid(0):
+                raise Exception("Process shares the bot's process group")
+            os.killpg(pgid, signal.SIGTERM)
+            # A preempted child only sees SIGTERM once it runs again
+            os.killpg(pgid, signal.SIGCONT)
+            try:
+                await asyncio.wait_for(process.wait(), timeout=self.config.KILL_GRACE_PERIOD)
+            except asyncio.TimeoutError:
+                os.killpg(pgid, signal.SIGKILL)
+                await process.wait()
+        except ProcessLookupError:
+            pass
+        except Exception as e:
+            logger.error(f"Error killing process {process.pid}: {e}")
+            process.kill()
+
+    def _apply_limits(self, pid: int, budget: float):
+        """Set resource limits on a started child with prlimit(2)
+
+        A preexec_fn isn't safe here, the bot runs threads (asyncio.to_thread,
+        SQLite) and forking with them can deadlock the child before exec.
+        """
+        memory = self.config.FFMPEG_MEMORY_LIMIT
+        # CPU time adds up over every encoder thread
+        cpu = int(budget * (os.cpu_count() or 1))
+        try:
+            if memory:
+                # Heap and anonymous mappings only; RLIMIT_AS also counted the
+                # address space x265 reserves per thread and broke large encodes
+                resource.prlimit(pid, resource.RLIMIT_DATA, (memory, memory))
+            resource.prlimit(pid, resource.RLIMIT_CPU, (cpu, cpu + 30))
+        except ProcessLookupError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.error(f"Error limiting process {pid}: {e}")
@@ -0,0 +1,132 @@
+import time
+import asyncio
+import logging
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+from pyrogram.types import Message
+from config import Config
+from .job_broker import JobBroker
+from .operation_graph import OperationGraph
+from .job_scheduler import current_job
+
+logger = logging.getLogger(__name__)
+
+class BrokerProgress:
+    """Stands in for the progress message on a worker
+
+    Processors report progress by editing a message; on a worker the text
+    is published to the broker instead and the frontend edits the real one.
+    """
+
+    def __init__(self, broker: JobBroker, job_id: str, chat_id: int, message_id: int):
+        self.config = Config()
+        self.broker = broker
+        self.job_id = job_id
+        self.chat = SimpleNamespace(id=chat_id)
+        self.id = message_id
+        self.last_update = 0.0
+
+    async def edit_text(self, text: str, *args, **kwargs):
+        now = time.time()
+        if now - self.last_update < self.config.PROGRESS_UPDATE_DELAY:
+            return
+        self.last_update = now
+        await asyncio.to_thread(
+            self.broker.report_progress, self.job_id, {'text': text, 'time': now}
+        )
+
+
+class RemoteProcessor:
+    """Runs encodes on workers through the broker
+
+    Mirrors the ``VideoProcessor`` methods the handlers call. Input files
+    and outputs are exchanged through TEMP_DIR, which must be shared storage
+    mounted at the same path on the frontend and every worker.
+    """
+
+    def __init__(self, broker: JobBroker):
+        self.config = Config()
+        self.broker = broker
+
+    async def compress_video(
+        self,
+        input_path: str,
+        settings: Dict,
+        message: Message,
+        graph: Optional[OperationGraph] = None
+    ) -> Optional[Dict]:
+        """Compress video on a worker (same result as VideoProcessor.compress_video)"""
+        return await self.run_remote(
+            'compress_video',
+            {
+                'input_path': input_path,
+                'settings': settings,
+                'graph': graph.to_list() if graph else None
+            },
+            message
+        )
+
+    async def compress_ladder(
+        self,
+        input_path: str,
+        settings: Dict,
+        message: Message,
+        resolutions: Optional[List[str]] = None,
+        packaging: Optional[str] = None
+    ) -> List[str]:
+        """Compress several resolutions on a worker"""
+        outputs = await self.run_remote(
+            'compress_ladder',
+            {
+                'input_path': input_path,
+                'settings': settings,
+                'resolutions': resolutions,
+                'packaging': packaging
+            },
+            message
+        )
+        return outputs or []
+
+    async def run_remote(self, kind: str, payload: Dict, message: Message):
+        """Queue a job on the broker and relay its progress until it finishes"""
+        # The worker journals the job under the original chat and message, and
+        # sizes its runtime cap from the predicted cost
+        job = current_job.get()
+        payload = dict(
+            payload,
+            chat_id=message.chat.id,
+            message_id=message.id,
+            user_id=job.user_id if job else None,
+            cost=job.cost if job else None
+        )
+        job_id = await asyncio.to_thread(self.broker.submit, kind, payload)
+        last_text = None
+        try:
+            while True:
+                await asyncio.sleep(self.config.WORKER_POLL_INTERVAL)
+                job = await asyncio.to_thread(self.broker.get_job, job_id)
+                if job is None:
+                    raise Exception(f"Broker lost job {job_id}")
+
+                text = (job['progress'] or {}).get('text')
+                if text and text != last_text:
+                    last_text = text
+                    try:
+                        await message.edit_text(text)
+                    except Exception as e:
+                        logger.error(f"Error relaying progress: {e}")
+
+                if job['state'] == 'done':
+                    return job['result']
+                if job['state'] in ('failed', 'cancelled'):
+                    logger.error(f"Remote job {job_id} {job['state']}: {job['error']}")
+                    return None
+
+        except asyncio.CancelledError:
+            await asyncio.to_thread(self.broker.cancel, job_id)
+            raise
+
+        except Exception as e:
+            logger.error(f"Error running remote job: {e}")
+            await asyncio.to_thread(self.broker.cancel, job_id)
+            return None
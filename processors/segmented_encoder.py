@@ -0,0 +1,201 @@
+import csv
+import glob
+import os
+import re
+import shutil
+import logging
+from typing import Dict, Optional
+from pyrogram.types import Message
+from config import Config
+from .ffmpeg_processor import FFmpegProcessor
+from .job_journal import JobJournal
+from .operation_graph import OperationGraph
+
+logger = logging.getLogger(__name__)
+
+class SegmentedEncoder:
+    """Encode in checkpointed segments so interrupted jobs resume where they stopped
+
+    FFmpeg's segment muxer writes fixed-length pieces and appends each one to
+    a CSV list only after it is complete. Those entries are copied into the
+    job journal; on restart the encode seeks past the last finished segment
+    and the pieces are joined with a stream-copy concat at the end.
+    """
+
+    LIST_PATTERN = re.compile(r"list_(\d+)_(\d+)\.csv$")
+
+    def __init__(self, ffmpeg: FFmpegProcessor, journal: JobJournal):
+        self.config = Config()
+        self.ffmpeg = ffmpeg
+        self.journal = journal
+
+    async def encode(
+        self,
+        job_id: str,
+        progress_callback: Optional[callable] = None,
+        message: Optional[Message] = None
+    ) -> bool:
+        """Run (or resume) a journaled job until its output is complete"""
+        job = None
+        try:
+            job = self.journal.get_job(job_id)
+            if not job:
+                raise Exception(f"Unknown job {job_id}")
+
+            os.makedirs(job['segment_dir'], exist_ok=True)
+            graph = OperationGraph.from_list(job['graph'])
+            probe_data = await self.ffmpeg.probe_video(job['input_path'])
+            state = self.ffmpeg.compiler.reduce(graph, probe_data)
+            total = state['duration']
+            if total is None:
+                total = float(probe_data['format']['duration']) - state['start']
+
+            # Pick up checkpoints written before a crash, drop partial pieces
+            self.sync_segments(job)
+            self.reclaim_partial_segments(job)
+
+            segments = self.journal.get_segments(job_id)
+            offset = segments[-1]['end'] if segments else 0.0
+            next_index = segments[-1]['idx'] + 1 if segments else 0
+
+            if total - offset > 0.5:
+                if offset:
+                    logger.info(f"Resuming job {job_id} at {offset:.1f}s (segment {next_index})")
+
+                extension = os.path.splitext(job['output_path'])[1]
+                segment_time = self.config.SEGMENT_DURATION
+                list_path = os.path.join(
+                    job['segment_dir'],
+                    f"list_{next_index:05d}_{int(offset * 1000)}.csv"
+                )
+                output_args = [
+                    "-f", "segment",
+                    "-segment_time", str(segment_time),
+                    "-segment_start_number", str(next_index),
+                    "-segment_list", list_path,
+                    "-segment_list_type", "csv",
+                    "-reset_timestamps", "1",
+                    "-force_key_frames", f"expr:gte(t,n_forced*{segment_time})",
+                    "-y", os.path.join(job['segment_dir'], f"seg_%05d{extension}")
+                ]
+                cmd = self.ffmpeg.compiler.compile(
+                    graph,
+                    job['input_path'],
+                    job['output_path'],
+                    probe_data,
+                    seek_offset=offset,
+                    output_args=output_args
+                )
+
+                # The list only grows when a segment is finished
+                list_size = 0
+
+                async def checkpoint(line: str, duration: float, msg: Message):
+                    nonlocal list_size
+                    try:
+                        size = os.path.getsize(list_path)
+                    except OSError:
+                        size = 0
+                    if size > list_size:
+                        list_size = size
+                        self.sync_segments(job)
+                    if progress_callback:
+                        await progress_callback(line, duration, msg)
+
+                success = await self.ffmpeg.run_command(
+                    cmd,
+                    job['input_path'],
+                    checkpoint,
+                    message,
+                    duration=total - offset
+                )
+                self.sync_segments(job)
+
+                if not success:
+                    self.fail(job)
+                    return False
+
+            if not await self.concat_segments(job):
+                self.fail(job)
+                return False
+
+            shutil.rmtree(job['segment_dir'], ignore_errors=True)
+            self.journal.set_state(job_id, 'done')
+            return True
+
+        except Exception as e:
+            logger.error(f"Error in segmented encode: {e}")
+            if job:
+                self.fail(job)
+            return False
+
+    def sync_segments(self, job: Dict):
+        """Copy completed segments from FFmpeg's segment lists into the journal"""
+        try:
+            for list_path in glob.glob(os.path.join(job['segment_dir'], "list_*.csv")):
+                match = self.LIST_PATTERN.search(list_path)
+                if not match:
+                    continue
+                first_index = int(match.group(1))
+                offset = int(match.group(2)) / 1000
+
+                with open(list_path, newline='', encoding='utf-8') as f:
+                    for position, row in enumerate(csv.reader(f)):
+                        if len(row) < 3:
+                            continue
+                        self.journal.add_segment(
+                            job['id'],
+                            first_index + position,
+                            os.path.join(job['segment_dir'], row[0]),
+                            offset + float(row[1]),
+                            offset + float(row[2])
+                        )
+        except Exception as e:
+            logger.error(f"Error syncing segments: {e}")
+
+    def reclaim_partial_segments(self, job: Dict):
+        """Delete segment files that were never finished"""
+        finished = {segment['path'] for segment in self.journal.get_segments(job['id'])}
+        for path in glob.glob(os.path.join(job['segment_dir'], "seg_*")):
+            if path not in finished:
+                try:
+                    os.remove(path)
+                except Exception as e:
+                    logger.error(f"Error removing partial segment {path}: {e}")
+
+    async def concat_segments(self, job: Dict) -> bool:
+        """Join finished segments into the final output without re-encoding"""
+        segments = self.journal.get_segments(job['id'])
+        if not segments:
+            return False
+
+        concat_file = os.path.join(job['segment_dir'], "concat.txt")
+        with open(concat_file, "w", encoding='utf-8') as f:
+            for segment in segments:
+                f.write(f"file '{segment['path']}'\n")
+
+        cmd = [
+            "ffmpeg",
+            "-hide_banner",
+            "-f", "concat",
+            "-safe", "0",
+            "-i", concat_file,
+            "-map", "0",
+            "-c", "copy"
+        ]
+        probe_data = await self.ffmpeg.probe_video(job['input_path'])
+        state = self.ffmpeg.compiler.reduce(OperationGraph.from_list(job['graph']), probe_data)
+        cmd.extend(self.ffmpeg.compiler.finalize_args(
+            job['output_path'], probe_data, state['duration']
+        ))
+        cmd.extend(["-y", job['output_path']])
+
+        return await self.ffmpeg.run_command(cmd, concat_file)
+
+    def fail(self, job: Dict):
+        """Mark a job failed and release its disk"""
+        self.journal.set_state(job['id'], 'failed')
+        shutil.rmtree(job['segment_dir'], ignore_errors=True)
+        if os.path.exists(job['output_path']):
+            os.remove(job['output_path'])
+
@@ -0,0 +1,119 @@
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, List
+from pyrogram import Client
+from pyrogram.errors import FloodWait
+from config import Config
+from utils.metrics import MeteredClient
+
+logger = logging.getLogger(__name__)
+
+class TransferInterrupted(Exception):
+    """A transfer stopped short without an error reaching us
+
+    Pyrogram's media streams swallow FloodWaits longer than their own
+    threshold and just end, so the session is treated as throttled.
+    """
+
+
+class TransferPool:
+    """Spread file transfers over extra MTProto sessions of the bot
+
+    The bot's own client stays the control client for updates and message
+    edits. Downloads and uploads go to the least-busy transfer session that
+    isn't serving a FloodWait, so a large transfer or a throttled session
+    doesn't hold up the others or the chat. With no extra sessions
+    configured the control client carries the transfers as well.
+    """
+
+    def __init__(self, control: Client):
+        self.config = Config()
+        self.control = control
+        self.clients: List[Client] = [
+            MeteredClient(
+                name=f"video_processor_transfer_{index}",
+                api_id=self.config.API_ID,
+                api_hash=self.config.API_HASH,
+                bot_token=self.config.BOT_TOKEN,
+                in_memory=True,
+                no_updates=True,
+                # Surface every FloodWait of invoke() so the pool can route
+                # around it; media streams report theirs as TransferInterrupted
+                sleep_threshold=0
+            )
+            for index in range(self.config.TRANSFER_SESSIONS)
+        ] or [control]
+        self.load = [0] * len(self.clients)
+        self.throttled_until = [0.0] * len(self.clients)
+
+    async def start(self):
+        """Connect the transfer sessions"""
+        for client in self.clients:
+            if client is not self.control:
+                await client.start()
+        logger.info(f"Transfer pool ready with {len(self.clients)} session(s)")
+
+    async def stop(self):
+        """Disconnect the transfer sessions"""
+        for client in self.clients:
+            if client is not self.control and client.is_connected:
+                try:
+                    await client.stop()
+                except Exception as e:
+                    logger.error(f"Error stopping transfer session: {e}")
+
+    async def acquire(self) -> int:
+        """Reserve the least-loaded session that isn't throttled"""
+        while True:
+            now = time.monotonic()
+            ready = [
+                index for index in range(len(self.clients))
+                if self.throttled_until[index] <= now
+            ]
+            if ready:
+                index = min(ready, key=lambda i: self.load[i])
+                self.load[index] += 1
+                return index
+            await asyncio.sleep(min(self.throttled_until) - now)
+
+    @asynccontextmanager
+    async def transfer(self):
+        """Hold a session for one transfer, recording any FloodWait it hits"""
+        index = await self.acquire()
+        try:
+            yield self.clients[index]
+        except FloodWait as e:
+            self.throttle(self.clients[index], e.value)
+            raise
+        except TransferInterrupted:
+            self.throttle(self.clients[index], self.config.TRANSFER_INTERRUPT_BACKOFF)
+            raise
+        finally:
+            self.load[index] -= 1
+
+    async def run(self, func: Callable[[Client], Awaitable]):
+        """Run a transfer, moving it to another session on FloodWait or interruption"""
+        interruptions = 0
+        while True:
+            try:
+                async with self.transfer() as client:
+                    return await func(client)
+            except FloodWait as e:
+                if e.value > self.config.TRANSFER_MAX_FLOOD_WAIT:
+                    raise
+            except TransferInterrupted as e:
+                interruptions += 1
+                if interruptions > self.config.TRANSFER_REROUTES:
+                    raise
+                logger.warning(f"Transfer interrupted ({e}), moving it to another session")
+
+    def throttle(self, client: Client, seconds: float):
+        """Keep a session out of rotation until its FloodWait ends"""
+        index = self.clients.index(client)
+        logger.warning(f"Transfer session {index} throttled for {seconds}s")
+        self.throttled_until[index] = max(
+            self.throttled_until[index],
+            time.monotonic() + seconds
+        )
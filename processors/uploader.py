@@ -0,0 +1,347 @@
+import os
+import asyncio
+import hashlib
+import logging
+import mimetypes
+from typing import AsyncIterable, Callable, Dict, List, Optional
+from pyrogram import Client, raw, types
+from pyrogram.errors import FloodWait
+from config import Config
+from utils.metrics import FAILURES, STAGE_SECONDS, failure_cause
+from .file_manager import FileManager
+from .transfer_pool import TransferPool
+
+logger = logging.getLogger(__name__)
+
+class Uploader:
+    """Send processed files back over several concurrent part uploads
+
+    The file is cut into 512 KiB parts that are sent by
+    ``UPLOAD_CONNECTIONS`` workers at once; a failed part is retried on
+    its own instead of restarting the file. The video attributes Telegram
+    needs for streaming playback are passed in precomputed, so the output
+    isn't probed again before sending. The whole file goes over one session
+    of the transfer pool, since uploaded parts belong to the session that
+    sent them. Generated outputs can also be sent straight from a byte
+    stream, without a file of their own.
+    """
+
+    # Telegram's maximum part size, and the size above which parts are "big"
+    PART_SIZE = 512 * 1024
+    BIG_FILE_SIZE = 10 * 1024 * 1024
+
+    def __init__(self, pool: TransferPool, file_manager: FileManager):
+        self.config = Config()
+        self.pool = pool
+        self.file_manager = file_manager
+
+    async def send_video(
+        self,
+        chat_id: int,
+        path: str,
+        metadata: Optional[Dict] = None,
+        file_name: Optional[str] = None,
+        caption: str = "",
+        reply_to: Optional[int] = None,
+        progress: Optional[Callable] = None,
+        progress_args: tuple = ()
+    ) -> Optional[types.Message]:
+        """Upload a video and send it as a streamable video message
+
+        ``metadata`` holds ``duration``, ``width`` and ``height`` of the
+        file; without it the file is sent as a plain document.
+        """
+        thumb_path = None
+        try:
+            file_name = file_name or os.path.basename(path)
+            # Same bot account on every session, so the control client's peer is valid
+            peer = await self.pool.control.resolve_peer(chat_id)
+
+            attributes = [raw.types.DocumentAttributeFilename(file_name=file_name)]
+            thumb = None
+            if metadata and metadata.get('video'):
+                attributes.append(raw.types.DocumentAttributeVideo(
+                    duration=int(metadata['duration']),
+                    w=metadata['width'],
+                    h=metadata['height'],
+                    supports_streaming=True
+                ))
+                thumb_path = await self.file_manager.generate_thumbnail(
+                    path,
+                    time_offset=min(1, metadata['duration'] / 2)
+                )
+
+            async with self.pool.transfer() as client:
+                with STAGE_SECONDS.time(stage="upload"):
+                    input_file = await self.upload_file(
+                        client, path, file_name, progress, progress_args
+                    )
+                if thumb_path:
+                    thumb = await self.upload_file(
+                        client, thumb_path, os.path.basename(thumb_path)
+                    )
+
+                media = raw.types.InputMediaUploadedDocument(
+                    file=input_file,
+                    mime_type=mimetypes.guess_type(file_name)[0] or (
+                        "video/mp4" if metadata else "application/octet-stream"
+                    ),
+                    attributes=attributes,
+                    thumb=thumb,
+                    force_file=not metadata
+                )
+                return await self.send_media(client, peer, media, caption, reply_to)
+
+        except Exception as e:
+            logger.error(f"Error uploading {path}: {e}")
+            FAILURES.inc(stage="upload", cause=failure_cause(e))
+            return None
+
+        finally:
+            if thumb_path and os.path.exists(thumb_path):
+                os.remove(thumb_path)
+
+    async def send_stream(
+        self,
+        chat_id: int,
+        chunks: AsyncIterable[bytes],
+        file_name: str,
+        caption: str = "",
+        reply_to: Optional[int] = None,
+        size_hint: int = 0,
+        progress: Optional[Callable] = None,
+        progress_args: tuple = ()
+    ) -> Optional[types.Message]:
+        """Upload bytes as they are produced and send them as a document
+
+        ``size_hint`` is only used for progress, the real size is whatever
+        the stream turns out to be.
+        """
+        try:
+            peer = await self.pool.control.resolve_peer(chat_id)
+            async with self.pool.transfer() as client:
+                with STAGE_SECONDS.time(stage="upload"):
+                    input_file = await self.upload_stream(
+                        client, chunks, file_name, size_hint, progress, progress_args
+                    )
+                media = raw.types.InputMediaUploadedDocument(
+                    file=input_file,
+                    mime_type=mimetypes.guess_type(file_name)[0] or "application/octet-stream",
+                    attributes=[raw.types.DocumentAttributeFilename(file_name=file_name)],
+                    force_file=True
+                )
+                return await self.send_media(client, peer, media, caption, reply_to)
+
+        except Exception as e:
+            logger.error(f"Error uploading stream {file_name}: {e}")
+            FAILURES.inc(stage="upload", cause=failure_cause(e))
+            return None
+
+    async def send_media(self, client: Client, peer, media, caption: str, reply_to: Optional[int]):
+        """Send uploaded media and return the parsed Message"""
+        result = await client.invoke(
+            raw.functions.messages.SendMedia(
+                peer=peer,
+                media=media,
+                message=caption,
+                random_id=client.rnd_id(),
+                reply_to_msg_id=reply_to
+            )
+        )
+        return await self.parse_sent(result)
+
+    async def upload_file(
+        self,
+        client: Client,
+        path: str,
+        file_name: str,
+        progress: Optional[Callable] = None,
+        progress_args: tuple = ()
+    ):
+        """Upload a file's parts concurrently, returns the InputFile to send"""
+        file_size = os.path.getsize(path)
+        big = file_size > self.BIG_FILE_SIZE
+        part_count = max(1, -(-file_size // self.PART_SIZE))
+        file_id = client.rnd_id()
+        state = {'done': 0}
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for index in range(part_count):
+            queue.put_nowait(index)
+
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            async def worker():
+                while True:
+                    try:
+                        index = queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        return
+                    data = os.pread(fd, self.PART_SIZE, index * self.PART_SIZE)
+                    await self.upload_part(client, file_id, index, part_count, data, big)
+                    state['done'] += len(data)
+                    if progress:
+                        await progress(state['done'], file_size, *progress_args)
+
+            workers = min(self.config.UPLOAD_CONNECTIONS, part_count)
+            tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                # Every worker must be gone before the fd is closed, or a late
+                # pread uploads parts of whatever file reuses the number
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+
+            if big:
+                return raw.types.InputFileBig(id=file_id, parts=part_count, name=file_name)
+            # Small files are checked against their MD5 by the server
+            md5 = hashlib.md5()
+            for index in range(part_count):
+                md5.update(os.pread(fd, self.PART_SIZE, index * self.PART_SIZE))
+            return raw.types.InputFile(
+                id=file_id,
+                parts=part_count,
+                name=file_name,
+                md5_checksum=md5.hexdigest()
+            )
+        finally:
+            os.close(fd)
+
+    async def upload_stream(
+        self,
+        client: Client,
+        chunks: AsyncIterable[bytes],
+        file_name: str,
+        size_hint: int = 0,
+        progress: Optional[Callable] = None,
+        progress_args: tuple = ()
+    ):
+        """Upload a stream of unknown length, returns the InputFile to send
+
+        Parts are held back until the stream passes BIG_FILE_SIZE; a smaller
+        stream is sent as a normal file with its MD5. Past that, parts go out
+        as soon as they are cut, as a big file with an unknown part count
+        (-1) that is only stated on the last part.
+        """
+        file_id = client.rnd_id()
+        buffer = bytearray()
+        held: List[bytes] = []
+        tasks: List[asyncio.Task] = []
+        limit = asyncio.Semaphore(self.config.UPLOAD_CONNECTIONS)
+        state = {'parts': 0, 'done': 0, 'big': False}
+
+        async def send(index: int, data: bytes, total: int, big: bool):
+            try:
+                await self.upload_part(client, file_id, index, total, data, big)
+            finally:
+                limit.release()
+            state['done'] += len(data)
+            if progress and size_hint:
+                await progress(min(state['done'], size_hint), size_hint, *progress_args)
+
+        async def submit(data: bytes, total: int, big: bool):
+            for task in [task for task in tasks if task.done()]:
+                tasks.remove(task)
+                if task.exception():
+                    raise task.exception()
+            await limit.acquire()
+            tasks.append(asyncio.create_task(send(state['parts'], data, total, big)))
+            state['parts'] += 1
+
+        try:
+            async for chunk in chunks:
+                buffer += chunk
+                # Always keep the tail, it has to go out as the last part
+                while len(buffer) > self.PART_SIZE:
+                    part = bytes(buffer[:self.PART_SIZE])
+                    del buffer[:self.PART_SIZE]
+                    if state['big']:
+                        await submit(part, -1, True)
+                        continue
+                    held.append(part)
+                    if len(held) * self.PART_SIZE > self.BIG_FILE_SIZE:
+                        state['big'] = True
+                        for part in held:
+                            await submit(part, -1, True)
+                        held.clear()
+
+            if not buffer and not held and not state['parts']:
+                raise Exception("nothing to upload")
+
+            if state['big']:
+                await submit(bytes(buffer), state['parts'] + 1, True)
+                await asyncio.gather(*tasks)
+                return raw.types.InputFileBig(id=file_id, parts=state['parts'], name=file_name)
+
+            held.append(bytes(buffer))
+            md5 = hashlib.md5()
+            for part in held:
+                md5.update(part)
+                await submit(part, len(held), False)
+            await asyncio.gather(*tasks)
+            return raw.types.InputFile(
+                id=file_id,
+                parts=len(held),
+                name=file_name,
+                md5_checksum=md5.hexdigest()
+            )
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def upload_part(
+        self,
+        client: Client,
+        file_id: int,
+        index: int,
+        total: int,
+        data: bytes,
+        big: bool
+    ):
+        """Send one part, retrying it alone with backoff"""
+        if big:
+            request = raw.functions.upload.SaveBigFilePart(
+                file_id=file_id,
+                file_part=index,
+                file_total_parts=total,
+                bytes=data
+            )
+        else:
+            request = raw.functions.upload.SaveFilePart(
+                file_id=file_id,
+                file_part=index,
+                bytes=data
+            )
+
+        attempt = 0
+        while True:
+            try:
+                if await client.invoke(request):
+                    return
+                raise Exception("server rejected the part")
+            except FloodWait as e:
+                # Parts can't move to another session; wait it out, other transfers avoid it
+                if e.value > self.config.TRANSFER_MAX_FLOOD_WAIT:
+                    raise
+                self.pool.throttle(client, e.value)
+                await asyncio.sleep(e.value)
+            except Exception as e:
+                if attempt == self.config.UPLOAD_RETRIES - 1:
+                    raise
+                logger.warning(f"Upload of part {index}/{total} failed ({e}), retrying")
+                await asyncio.sleep(2 ** attempt)
+                attempt += 1
+
+    async def parse_sent(self, result) -> Optional[types.Message]:
+        """Turn the SendMedia updates into the sent Message"""
+        users = {user.id: user for user in getattr(result, 'users', [])}
+        chats = {chat.id: chat for chat in getattr(result, 'chats', [])}
+        for update in getattr(result, 'updates', []):
+            if isinstance(update, (raw.types.UpdateNewMessage, raw.types.UpdateNewChannelMessage)):
+                return await types.Message._parse(
+                    self.pool.control, update.message, users, chats
+                )
+        return None
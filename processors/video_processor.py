@@ -1,10 +1,23 @@
 import logging
 import os
 import time
+import shutil
+import secrets
 from typing import Dict, List, Optional
 from pyrogram.types import Message
 from .ffmpeg_processor import FFmpegProcessor
 from .file_manager import FileManager
+from .operation_graph import OperationGraph
+from .job_journal import JobJournal
+from .segmented_encoder import SegmentedEncoder
+from .cost_model import CostModel
+from .preflight import Preflight, PreflightError
+from .frame_analyzer import FrameAnalyzer
+from .crop_detector import CropDetector
+from .loudness import LoudnessNormalizer
+from .bundler import Bundler
+from .job_scheduler import current_job
+from utils.helpers import TimeFormatter
 from config import Config
 
 logger = logging.getLogger(__name__)
@@ -14,6 +27,14 @@ class VideoProcessor:
         self.config = Config()
         self.ffmpeg = FFmpegProcessor()
         self.file_manager = FileManager()
+        self.journal = JobJournal()
+        self.segmented = SegmentedEncoder(self.ffmpeg, self.journal)
+        self.cost_model = CostModel()
+        self.preflight = Preflight(self.ffmpeg)
+        self.frame_analyzer = FrameAnalyzer(self.ffmpeg)
+        self.crop_detector = CropDetector(self.ffmpeg)
+        self.loudness = LoudnessNormalizer(self.ffmpeg)
+        self.bundler = Bundler(self.ffmpeg)
 
     async def process_video(
         self,
@@ -53,30 +74,411 @@ class VideoProcessor:
             await message.edit_text("❌ Error processing video!")
             return None
 
+    async def process_graph(
+        self,
+        input_path: str,
+        graph: OperationGraph,
+        message: Message,
+        suffix: Optional[str] = None
+    ) -> Optional[str]:
+        """Run all queued operations on a video in a single pass"""
+        try:
+            output_path = await self.file_manager.create_temp_file(
+                prefix="processed_",
+                suffix=suffix or os.path.splitext(input_path)[1]
+            )
+
+            # Check disk space
+            input_size = os.path.getsize(input_path)
+            if not await self.file_manager.ensure_space_available(input_size * 2):
+                await message.edit_text("❌ Not enough disk space available!")
+                return None
+
+            graph = await self.run_preflight(input_path, output_path, graph, message)
+            if graph is None:
+                return None
+
+            success = await self.ffmpeg.process_graph(
+                input_path,
+                output_path,
+                graph,
+                self.handle_progress,
+                message
+            )
+
+            if success:
+                return output_path
+            return None
+
+        except Exception as e:
+            logger.error(f"Error processing operation graph: {e}")
+            await message.edit_text("❌ Error processing video!")
+            return None
+
+    async def process_graph_checkpointed(
+        self,
+        input_path: str,
+        graph: OperationGraph,
+        message: Message,
+        suffix: Optional[str] = None,
+        job_id: Optional[str] = None
+    ) -> Optional[str]:
+        """Run an operation graph as a journaled job that survives restarts
+
+        A ``job_id`` already running in the journal is resumed instead, so a
+        broker job requeued after its worker died continues from the last
+        finished segment.
+        """
+        try:
+            existing = self.journal.get_job(job_id) if job_id else None
+            if existing and existing['state'] == 'running':
+                return await self.resume_job(existing, message)
+
+            output_path = await self.file_manager.create_temp_file(
+                prefix="processed_",
+                suffix=suffix or os.path.splitext(input_path)[1]
+            )
+
+            # Check disk space (segments + final concat copy)
+            input_size = os.path.getsize(input_path)
+            if not await self.file_manager.ensure_space_available(input_size * 3):
+                await message.edit_text("❌ Not enough disk space available!")
+                return None
+
+            graph = await self.run_preflight(input_path, output_path, graph, message)
+            if graph is None:
+                return None
+
+            job_id = job_id or f"{message.chat.id}_{message.id}_{int(time.time())}"
+            scheduled = current_job.get()
+            self.journal.create_job(
+                job_id,
+                input_path,
+                output_path,
+                os.path.join(str(self.config.TEMP_DIR), f"segments_{job_id}"),
+                graph.to_list(),
+                user_id=scheduled.user_id if scheduled else None,
+                chat_id=message.chat.id,
+                message_id=message.id
+            )
+
+            if await self.segmented.encode(job_id, self.handle_progress, message):
+                return output_path
+            return None
+
+        except Exception as e:
+            logger.error(f"Error processing checkpointed graph: {e}")
+            await message.edit_text("❌ Error processing video!")
+            return None
+
+    async def run_preflight(
+        self,
+        input_path: str,
+        output_path: str,
+        graph: OperationGraph,
+        message: Message
+    ) -> Optional[OperationGraph]:
+        """Validate a job before encoding, returns the corrected graph or None"""
+        try:
+            graph, fixes = await self.preflight.check(input_path, output_path, graph)
+            if fixes:
+                await message.edit_text(
+                    "**⚙️ Adjusted for the output format**\n\n"
+                    + "\n".join(f"• {fix}" for fix in fixes)
+                )
+            return graph
+
+        except PreflightError as e:
+            logger.warning(f"Preflight rejected {input_path}: {e}")
+            await message.edit_text(f"❌ This video can't be processed:\n{e}")
+            return None
+
+    async def resume_job(self, job: Dict, message: Optional[Message] = None) -> Optional[str]:
+        """Continue an interrupted job from its last finished segment"""
+        try:
+            if not os.path.exists(job['input_path']):
+                logger.warning(f"Input of job {job['id']} is gone, dropping it")
+                self.segmented.fail(job)
+                return None
+
+            if await self.segmented.encode(job['id'], self.handle_progress, message):
+                return job['output_path']
+            return None
+
+        except Exception as e:
+            logger.error(f"Error resuming job: {e}")
+            return None
+
     async def compress_video(
         self,
         input_path: str,
         settings: Dict,
-        message: Message
-    ) -> Optional[str]:
-        """Compress video with specified settings"""
+        message: Message,
+        graph: Optional[OperationGraph] = None,
+        job_id: Optional[str] = None
+    ) -> Optional[Dict]:
+        """Compress video with specified settings
+
+        Operations already queued in ``graph`` (cuts, track removal, ...)
+        are fused with the compression so the file is decoded only once.
+        ``job_id`` names the checkpointed job, see process_graph_checkpointed.
+        Returns the output ``path`` and the ``metadata`` (duration, frame
+        size) of the plan that produced it, or None on failure.
+        """
         try:
-            options = {
-                'video': True,
-                'audio': True,
-                'codec': 'libx265',
-                'resolution': settings['resolution'],
-                'quality': settings['quality'],
-                'faststart': True
-            }
+            graph = await self.plan_compression(input_path, settings, graph, message)
 
-            return await self.process_video(input_path, options, message)
+            job = current_job.get()
+            started = time.time()
+            paused = job.paused_seconds() if job else 0.0
+
+            if self.config.CHECKPOINT_ENCODES:
+                output_path = await self.process_graph_checkpointed(
+                    input_path, graph, message, job_id=job_id
+                )
+            else:
+                output_path = await self.process_graph(input_path, graph, message)
+
+            if not output_path:
+                return None
+
+            # Feed the measured run time back into the cost model
+            elapsed = time.time() - started
+            if job:
+                elapsed -= job.paused_seconds() - paused
+            probe_data = await self.ffmpeg.probe_video(input_path)
+            metadata = self.ffmpeg.compiler.output_metadata(graph, probe_data)
+            self.cost_model.record(
+                self.cost_model.features(
+                    probe_data,
+                    settings['resolution'],
+                    settings['quality'],
+                    metadata['duration']
+                ),
+                elapsed,
+                os.path.getsize(output_path)
+            )
+            return {'path': output_path, 'metadata': metadata}
 
         except Exception as e:
             logger.error(f"Error compressing video: {e}")
             await message.edit_text("❌ Error compressing video!")
             return None
 
+    async def plan_compression(
+        self,
+        input_path: str,
+        settings: Dict,
+        graph: Optional[OperationGraph] = None,
+        message: Optional[Message] = None,
+        analyze: bool = True
+    ) -> OperationGraph:
+        """Append the compression to the operations queued in ``graph``
+
+        With frame analysis enabled, duplicate and black stretches found in
+        the input are decimated/trimmed first, and with ``autocrop`` black
+        bars are cropped before scaling. ``analyze=False`` only reuses
+        analyses that were already done.
+        """
+        graph = graph.copy() if graph else OperationGraph()
+        if self.config.FRAME_ANALYSIS:
+            if analyze:
+                if message:
+                    await message.edit_text(
+                        "**🔍 Analyzing Frames**\n\n"
+                        "⏳ Looking for static and black stretches..."
+                    )
+                analysis = await self.frame_analyzer.analyze(input_path)
+            else:
+                analysis = self.frame_analyzer.cached(input_path)
+            if analysis:
+                graph, changes = self.frame_analyzer.apply(graph, analysis)
+                for change in changes:
+                    logger.info(f"Frame analysis: {change}")
+
+        if settings.get('autocrop', self.config.AUTOCROP_DEFAULT):
+            if analyze:
+                crop = await self.crop_detector.detect(input_path)
+            else:
+                crop = self.crop_detector.cached(input_path)
+            if crop:
+                logger.info(f"Auto-crop: {crop[0]}x{crop[1]} at {crop[2]},{crop[3]}")
+                graph.crop(*crop)
+
+        graph.scale(settings['resolution'])
+        graph.encode(codec='libx265', quality=settings['quality'])
+        return graph
+
+    def analyses_cached(self, input_path: str, settings: Dict) -> bool:
+        """Check whether plan_compression would run no analysis pass"""
+        if self.config.FRAME_ANALYSIS and self.frame_analyzer.cached(input_path) is None:
+            return False
+        if settings.get('autocrop', self.config.AUTOCROP_DEFAULT):
+            return self.crop_detector.cache_key(input_path) in self.crop_detector.cache
+        return True
+
+    async def preview(
+        self,
+        input_path: str,
+        settings: Dict,
+        message: Message,
+        graph: Optional[OperationGraph] = None
+    ) -> Optional[Dict]:
+        """Encode a few short windows with the chosen settings
+
+        The input is analyzed first (or the cached analyses reused), so the
+        windows are cut and cropped like the full encode. Only the windows
+        are decoded (input-side seeks). Returns the joined
+        clip's ``path``, ``duration`` and ``metadata`` with the output
+        ``size`` and encode ``seconds`` projected from them, or None on
+        failure.
+        """
+        window_paths: List[str] = []
+        stem = await self.file_manager.create_temp_file(prefix=f"preview_{secrets.token_hex(4)}")
+        extension = os.path.splitext(input_path)[1]
+        concat_file = f"{stem}.txt"
+        try:
+            preview_path = f"{stem}{extension}"
+            plan = await self.plan_compression(input_path, settings, graph, message)
+            plan = await self.run_preflight(input_path, preview_path, plan, message)
+            if plan is None:
+                return None
+
+            probe_data = await self.ffmpeg.probe_video(input_path)
+            metadata = self.ffmpeg.compiler.output_metadata(plan, probe_data)
+            duration = metadata['duration']
+            windows = self.config.PREVIEW_WINDOWS
+            length = min(self.config.PREVIEW_WINDOW_SECONDS, duration / windows)
+            if length <= 0:
+                return None
+
+            await message.edit_text(
+                "**👁 Encoding Preview**\n\n"
+                f"⏳ Encoding {windows} × {length:.0f}s samples..."
+            )
+            encode_seconds = 0.0
+            for i in range(windows):
+                # Trims compose with the queued ones, so this is within the output's timeline
+                start = (duration - length) * (i + 0.5) / windows
+                window_path = f"{stem}_{i}{extension}"
+                cmd = self.ffmpeg.compiler.compile(
+                    plan.copy().trim(start=start, duration=length),
+                    input_path,
+                    window_path,
+                    probe_data
+                )
+                started = time.monotonic()
+                result = await self.ffmpeg.supervisor.run(
+                    cmd,
+                    budget=self.ffmpeg.supervisor.budget(length),
+                    stall_timeout=self.config.FFMPEG_STALL_TIMEOUT
+                )
+                encode_seconds += time.monotonic() - started
+                window_paths.append(window_path)
+                if not result.ok:
+                    raise Exception(f"Window {i} failed: {result.killed or result.stderr}")
+
+            with open(concat_file, "w", encoding='utf-8') as f:
+                for window_path in window_paths:
+                    f.write(f"file '{window_path}'\n")
+            result = await self.ffmpeg.supervisor.run(
+                [
+                    "ffmpeg", "-hide_banner",
+                    "-f", "concat", "-safe", "0",
+                    "-i", concat_file,
+                    "-map", "0", "-c", "copy",
+                    *self.ffmpeg.compiler.finalize_args(preview_path),
+                    "-y", preview_path
+                ],
+                budget=self.config.FFPROBE_TIMEOUT
+            )
+            if not result.ok:
+                raise Exception(f"Joining windows failed: {result.killed or result.stderr}")
+
+            sampled = length * windows
+            sample_bytes = sum(os.path.getsize(path) for path in window_paths)
+            return {
+                'path': preview_path,
+                'duration': sampled,
+                'metadata': dict(metadata, duration=sampled),
+                'size': sample_bytes / sampled * duration,
+                # Short windows carry encoder start-up, so this errs on the slow side
+                'seconds': encode_seconds / sampled * duration
+            }
+
+        except Exception as e:
+            logger.error(f"Error encoding preview: {e}")
+            await message.edit_text("❌ Error encoding preview!")
+            return None
+
+        finally:
+            for path in window_paths + [concat_file]:
+                if os.path.exists(path):
+                    os.remove(path)
+
+    async def compress_ladder(
+        self,
+        input_path: str,
+        settings: Dict,
+        message: Message,
+        resolutions: Optional[List[str]] = None,
+        packaging: Optional[str] = None
+    ) -> List[str]:
+        """Compress video into several resolutions with a single decode"""
+        try:
+            resolutions = resolutions or self.config.LADDER_RESOLUTIONS
+            packaging = packaging or self.config.LADDER_PACKAGING
+
+            # Never upscale: drop renditions taller than the source, and encode
+            # one at the source size when even the smallest is too tall
+            probe_data = await self.ffmpeg.probe_video(input_path)
+            source_height = next(
+                (int(s['height']) for s in probe_data.get('streams', [])
+                 if s.get('codec_type') == 'video' and s.get('height')),
+                None
+            )
+            if source_height:
+                fitting = [
+                    res for res in resolutions
+                    if self.config.RESOLUTION_PRESETS[res]['height'] <= source_height
+                ]
+                resolutions = fitting or [f"{source_height}p"]
+
+            output_dir = await self.file_manager.create_temp_file(prefix="ladder_")
+            os.makedirs(output_dir, exist_ok=True)
+
+            # Every rendition is written at once
+            input_size = os.path.getsize(input_path)
+            if not await self.file_manager.ensure_space_available(input_size * len(resolutions)):
+                await message.edit_text("❌ Not enough disk space available!")
+                return []
+
+            quality = settings.get('quality') or 'medium'
+            try:
+                await self.preflight.check_ladder(
+                    input_path, output_dir, resolutions, quality, packaging
+                )
+            except PreflightError as e:
+                logger.warning(f"Preflight rejected {input_path}: {e}")
+                await message.edit_text(f"❌ This video can't be processed:\n{e}")
+                shutil.rmtree(output_dir, ignore_errors=True)
+                return []
+
+            return await self.ffmpeg.process_ladder(
+                input_path,
+                output_dir,
+                resolutions,
+                quality,
+                packaging,
+                self.handle_progress,
+                message
+            )
+
+        except Exception as e:
+            logger.error(f"Error compressing ladder: {e}")
+            await message.edit_text("❌ Error compressing video!")
+            return []
+
     async def extract_audio(
         self,
         input_path: str,
@@ -108,6 +510,41 @@ class VideoProcessor:
             await message.edit_text("❌ Error extracting audio!")
             return []
 
+    async def normalize_audio(self, input_path: str, message: Message) -> Optional[str]:
+        """Bring every audio track to the target loudness, video is copied
+
+        Returns None (after telling the user why) when it failed or no track
+        needed adjusting.
+        """
+        try:
+            await message.edit_text(
+                "**🔊 Measuring Loudness**\n\n"
+                "⏳ Reading all audio tracks..."
+            )
+            measurements = await self.loudness.measure(input_path)
+            probe_data = await self.ffmpeg.probe_video(input_path)
+
+            output_path = await self.file_manager.create_temp_file(
+                prefix="normalized_",
+                suffix=os.path.splitext(input_path)[1]
+            )
+            cmd = self.loudness.build_command(input_path, output_path, probe_data, measurements)
+            if cmd is None:
+                await message.edit_text("✅ Audio is already at the target loudness.")
+                return None
+
+            adjusted = sum(1 for m in measurements if self.loudness.needs_adjustment(m))
+            logger.info(f"Normalizing {adjusted}/{len(measurements)} audio track(s) of {input_path}")
+            if await self.ffmpeg.run_command(cmd, input_path, self.handle_progress, message):
+                return output_path
+            await message.edit_text("❌ Error normalizing audio!")
+            return None
+
+        except Exception as e:
+            logger.error(f"Error normalizing audio: {e}")
+            await message.edit_text("❌ Error normalizing audio!")
+            return None
+
     async def merge_videos(
         self,
         video_paths: List[str],
@@ -154,7 +591,17 @@ class VideoProcessor:
                 fps = self.extract_value(line, "fps=")
                 speed = self.extract_value(line, "speed=")
                 size = self.extract_value(line, "size=")
-                
+
+                # Time spent paused for interactive jobs doesn't count towards the ETA
+                job = current_job.get()
+                status = "⏳ Please wait..."
+                if job is not None and job.paused_at is not None:
+                    status = "⏸ Paused for a short job, resuming shortly..."
+                elif job is not None and current_time > 0:
+                    elapsed = job.active_seconds()
+                    eta = elapsed * (duration - current_time) / current_time
+                    status = f"⏳ ETA: {TimeFormatter.format_duration(eta)}"
+
                 # Update progress message
                 await message.edit_text(
                     f"**🔄 Processing Video**\n\n"
@@ -162,7 +609,7 @@ class VideoProcessor:
                     f"FPS: {fps:.1f}\n"
                     f"Speed: {speed}x\n"
                     f"Size: {self.file_manager.format_size(size)}\n"
-                    f"⏳ Please wait..."
+                    f"{status}"
                 )
 
         except Exception as e:
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modules import each other from the repository root, as bot.py and worker.py do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
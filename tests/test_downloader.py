@@ -0,0 +1,193 @@
+import os
+import asyncio
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("pyrogram")
+
+from config import Config
+from processors.downloader import ChunkedDownloader
+from processors.transfer_pool import TransferPool
+
+CHUNK = 4
+PART_CHUNKS = 2
+PART = CHUNK * PART_CHUNKS
+DATA = bytes(range(30))  # four parts: 8, 8, 8 and 6 bytes
+
+
+class FakeClient:
+    """Serves DATA the way stream_media does, in fixed chunks from a chunk offset"""
+
+    def __init__(self, cut_after=None, fail_once_after=None):
+        self.requests = []
+        self.cut_after = cut_after
+        self.fail_once_after = fail_once_after
+
+    async def stream_media(self, message, limit=0, offset=0):
+        self.requests.append((offset, limit))
+        for sent in range(limit):
+            position = (offset + sent) * CHUNK
+            if position >= len(DATA):
+                return
+            if self.cut_after is not None and sent >= self.cut_after:
+                # Pyrogram ends the stream quietly on errors it swallows
+                return
+            if self.fail_once_after is not None and sent >= self.fail_once_after:
+                self.fail_once_after = None
+                raise ConnectionError("connection reset")
+            await asyncio.sleep(0)
+            yield DATA[position:position + CHUNK]
+
+
+def make_downloader(*clients):
+    pool = TransferPool(clients[0])
+    pool.clients = list(clients)
+    pool.load = [0] * len(clients)
+    pool.throttled_until = [0.0] * len(clients)
+    downloader = ChunkedDownloader(pool)
+    downloader.chunk_size = CHUNK
+    downloader.part_chunks = PART_CHUNKS
+    return downloader
+
+
+@pytest.fixture(autouse=True)
+def single_session(monkeypatch):
+    monkeypatch.setattr(Config, "TRANSFER_SESSIONS", 0)
+    monkeypatch.setattr(Config, "DOWNLOAD_CONNECTIONS", 2)
+
+
+def download(downloader, path):
+    reports = []
+
+    async def progress(done, total):
+        reports.append(done)
+
+    asyncio.run(downloader.download(None, path, len(DATA), progress))
+    return reports
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_download_writes_every_part(tmp_path):
+    path = str(tmp_path / "video.mp4")
+    client = FakeClient()
+    reports = download(make_downloader(client), path)
+
+    assert read(path) == DATA
+    assert ChunkedDownloader.is_complete(path)
+    assert sorted(client.requests) == [(0, 2), (2, 2), (4, 2), (6, 2)]
+    assert reports[-1] == len(DATA)
+    assert len(reports) == -(-len(DATA) // CHUNK)
+
+
+def test_resume_fetches_only_missing_parts(tmp_path):
+    path = str(tmp_path / "video.mp4")
+    downloader = make_downloader(FakeClient())
+    # Parts 0 and 2 finished before the interruption
+    with open(path, "wb") as f:
+        f.write(DATA[:PART] + bytes(PART) + DATA[2 * PART:3 * PART] + bytes(len(DATA) - 3 * PART))
+    bitmap = bytearray(1)
+    downloader.set_bit(bitmap, 0)
+    downloader.set_bit(bitmap, 2)
+    downloader.save_bitmap(path, bitmap)
+
+    client = downloader.pool.clients[0]
+    reports = download(downloader, path)
+
+    assert read(path) == DATA
+    assert sorted(client.requests) == [(2, 2), (6, 2)]
+    # Progress starts from the parts already on disk
+    assert reports[0] > PART
+    assert max(reports) == len(DATA)
+    assert not os.path.exists(path + ChunkedDownloader.PARTS_SUFFIX)
+
+
+def test_complete_file_is_not_fetched_again(tmp_path):
+    path = str(tmp_path / "video.mp4")
+    with open(path, "wb") as f:
+        f.write(DATA)
+    client = FakeClient()
+    download(make_downloader(client), path)
+    assert client.requests == []
+
+
+def test_data_without_sidecar_starts_over(tmp_path):
+    path = str(tmp_path / "video.mp4")
+    downloader = make_downloader(FakeClient())
+    bitmap = bytearray(b"\x0f")
+    downloader.save_bitmap(path, bitmap)
+
+    # The sidecar alone means nothing, its data file is gone
+    assert downloader.load_bitmap(path, 4) == bytearray(1)
+    assert not ChunkedDownloader.is_complete(path)
+
+
+def test_failed_range_resumes_at_chunk_boundary(tmp_path, monkeypatch):
+    async def no_backoff(seconds):
+        pass
+
+    path = str(tmp_path / "video.mp4")
+    client = FakeClient(fail_once_after=1)
+    downloader = make_downloader(client)
+    monkeypatch.setattr(Config, "DOWNLOAD_CONNECTIONS", 1)
+    monkeypatch.setattr("processors.downloader.asyncio.sleep", no_backoff)
+    reports = download(downloader, path)
+
+    assert read(path) == DATA
+    # The retry asked only for the chunk that failed
+    assert client.requests[:2] == [(0, 2), (1, 1)]
+    assert max(reports) == len(DATA)
+
+
+def test_interrupted_stream_moves_to_another_session(tmp_path):
+    path = str(tmp_path / "video.mp4")
+    flaky, healthy = FakeClient(cut_after=1), FakeClient()
+    downloader = make_downloader(flaky, healthy)
+    reports = download(downloader, path)
+
+    assert read(path) == DATA
+    # The short stream's bytes were taken back out of the progress
+    assert max(reports) == len(DATA)
+    assert flaky.requests
+    assert downloader.pool.throttled_until[0] > 0
+    assert downloader.pool.load == [0, 0]
+
+
+def test_failed_range_stops_the_other_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "DOWNLOAD_RETRIES", 1)
+    path = str(tmp_path / "video.mp4")
+    writes = []
+
+    class SlowClient(FakeClient):
+        async def stream_media(self, message, limit=0, offset=0):
+            if offset == 0:
+                raise ConnectionError("range failed for good")
+            async for chunk in super().stream_media(message, limit, offset):
+                # Still streaming when the first range fails
+                await asyncio.sleep(0.05)
+                yield chunk
+
+    downloader = make_downloader(SlowClient())
+    monkeypatch.setattr(Config, "DOWNLOAD_CONNECTIONS", 4)
+    real_pwrite = os.pwrite
+
+    def pwrite(fd, data, offset):
+        writes.append(fd)
+        return real_pwrite(fd, data, offset)
+
+    monkeypatch.setattr(os, "pwrite", pwrite)
+
+    async def run():
+        with pytest.raises(ConnectionError):
+            await downloader.download(None, path, len(DATA))
+        written = len(writes)
+        # Nothing may write through the closed fd afterwards
+        await asyncio.sleep(0.3)
+        return written
+
+    written = asyncio.run(run())
+    assert len(writes) == written
+    assert not ChunkedDownloader.is_complete(path)
@@ -0,0 +1,79 @@
+import pytest
+
+pytest.importorskip("dotenv")
+
+import numpy as np
+
+from processors.frame_analyzer import FrameAnalyzer
+from processors.operation_graph import OperationGraph
+
+# 3s of black at 10 fps, then 2s of content at 50 fps, then 3s of black at 10 fps
+TIMES = np.concatenate([
+    np.arange(0, 3, 0.1),
+    3 + np.arange(0, 2, 0.02),
+    5 + np.arange(0, 3, 0.1)
+])
+FRAMES = len(TIMES)
+
+
+@pytest.fixture
+def analyzer():
+    return FrameAnalyzer(ffmpeg=None)
+
+
+def analysis(silence):
+    return {
+        'frames': FRAMES,
+        'duration': 8.0,
+        'timestamps': TIMES,
+        'duplicate_ratio': 0.0,
+        'black_runs': [(0, 30), (FRAMES - 30, FRAMES)],
+        'silence': silence
+    }
+
+
+def trim_of(graph):
+    (op,) = [op for op in graph.operations if op['type'] == 'trim']
+    return op['params']
+
+
+def test_black_cuts_use_frame_timestamps(analyzer):
+    graph, changes = analyzer.apply(OperationGraph(), analysis(None))
+    params = trim_of(graph)
+    assert params['start'] == pytest.approx(3.0)
+    assert params['duration'] == pytest.approx(2.0)
+    assert changes == ["Trimmed 6.0s of black frames"]
+
+
+def test_black_under_audio_is_kept(analyzer):
+    graph, changes = analyzer.apply(OperationGraph(), analysis([]))
+    assert graph.operations == []
+    assert changes == []
+
+
+def test_only_the_silent_part_of_black_is_cut(analyzer):
+    # Music fades in at 1.5s, the end is silent from 5s to the end of the file
+    graph, _ = analyzer.apply(OperationGraph(), analysis([(0.0, 1.5), (5.0, 8.0)]))
+    params = trim_of(graph)
+    assert params['start'] == pytest.approx(1.5)
+    assert params['duration'] == pytest.approx(3.5)
+
+
+def test_short_silence_is_not_worth_a_cut(analyzer):
+    graph, _ = analyzer.apply(OperationGraph(), analysis([(0.0, 0.5)]))
+    assert graph.operations == []
+
+
+def test_parse_line_collects_timestamps_and_open_silence(analyzer):
+    state = {'timestamps': [], 'silence': []}
+    for line in [
+        "[Parsed_showinfo_2 @ 0x1] config in time_base: 1/1000, frame_rate: 25/1",
+        "[Parsed_showinfo_2 @ 0x1] n:   0 pts:      0 pts_time:0       duration:40",
+        "[Parsed_showinfo_2 @ 0x1] n:   1 pts:     40 pts_time:0.04    duration:40",
+        "[silencedetect @ 0x2] silence_start: 0",
+        "[silencedetect @ 0x2] silence_end: 1.25 | silence_duration: 1.25",
+        "[silencedetect @ 0x2] silence_start: 7.5"
+    ]:
+        analyzer.parse_line(line, state)
+    assert state['timestamps'] == [0.0, 0.04]
+    assert state['silence'] == [[0.0, 1.25], [7.5, None]]
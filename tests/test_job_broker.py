@@ -0,0 +1,206 @@
+import time
+import socket
+import asyncio
+import threading
+import pytest
+
+pytest.importorskip("dotenv")
+
+from processors.job_broker import BrokerServer, SocketBroker, SQLiteBroker
+
+
+@pytest.fixture
+def broker(tmp_path):
+    broker = SQLiteBroker(tmp_path / "broker.db")
+    yield broker
+    broker.close()
+
+
+def test_claim_takes_oldest_queued_job_once(broker):
+    first = broker.submit("compress", {"n": 1})
+    second = broker.submit("compress", {"n": 2})
+
+    job = broker.claim("w1")
+    assert job["id"] == first
+    assert job["state"] == "claimed"
+    assert job["worker"] == "w1"
+    assert job["payload"] == {"n": 1}
+    assert broker.claim("w2")["id"] == second
+    assert broker.claim("w3") is None
+
+
+def test_claim_filters_by_kind(broker):
+    broker.submit("compress", {})
+    ladder = broker.submit("ladder", {})
+
+    assert broker.claim("w1", ["ladder"])["id"] == ladder
+    assert broker.claim("w1", ["ladder"]) is None
+
+
+def test_concurrent_claims_never_share_a_job(broker):
+    ids = {broker.submit("compress", {"n": n}) for n in range(40)}
+    claimed = []
+
+    def worker(name):
+        while True:
+            job = broker.claim(name)
+            if job is None:
+                return
+            claimed.append(job["id"])
+
+    threads = [threading.Thread(target=worker, args=(f"w{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(claimed) == sorted(ids)
+
+
+def test_heartbeat_only_for_the_claiming_worker(broker):
+    job_id = broker.submit("compress", {})
+    broker.claim("w1")
+
+    assert broker.heartbeat(job_id, "w1")
+    assert not broker.heartbeat(job_id, "w2")
+    broker.cancel(job_id)
+    # A cancelled claim tells the worker to stop
+    assert not broker.heartbeat(job_id, "w1")
+
+
+def test_stale_claims_are_requeued(broker):
+    job_id = broker.submit("compress", {})
+    broker.claim("w1")
+    broker.conn.execute("UPDATE broker_jobs SET heartbeat = ?", (time.time() - 120,))
+
+    assert broker.requeue_stale(60) == 1
+    assert broker.get_job(job_id)["state"] == "queued"
+    # The dead worker's claim is gone, the job goes to the next one
+    assert not broker.heartbeat(job_id, "w1")
+    assert broker.claim("w2")["id"] == job_id
+
+
+def test_live_claims_are_not_requeued(broker):
+    broker.submit("compress", {})
+    broker.claim("w1")
+    assert broker.requeue_stale(60) == 0
+
+
+def test_results_and_failures(broker):
+    done = broker.submit("compress", {})
+    failed = broker.submit("compress", {})
+    broker.claim("w1")
+    broker.claim("w1")
+    broker.report_progress(done, {"percent": 50})
+    assert broker.complete(done, "w1", {"path": "/out.mp4"})
+    assert broker.fail(failed, "w1", "boom")
+
+    assert broker.get_job(done)["progress"] == {"percent": 50}
+    assert broker.get_job(done)["result"] == {"path": "/out.mp4"}
+    assert broker.get_job(failed)["state"] == "failed"
+    assert broker.get_job(failed)["error"] == "boom"
+    # Finished jobs stay finished
+    broker.cancel(done)
+    assert broker.get_job(done)["state"] == "done"
+
+
+def test_only_the_claiming_worker_finishes_a_job(broker):
+    job_id = broker.submit("compress", {})
+    broker.claim("w1")
+    broker.conn.execute("UPDATE broker_jobs SET heartbeat = ?", (time.time() - 120,))
+    broker.requeue_stale(60)
+    broker.claim("w2")
+
+    # The first worker comes back after its claim was handed on
+    assert not broker.complete(job_id, "w1", {"path": "/stale.mp4"})
+    assert not broker.fail(job_id, "w1", "boom")
+    assert broker.get_job(job_id)["state"] == "claimed"
+    assert broker.complete(job_id, "w2", {"path": "/out.mp4"})
+    assert broker.get_job(job_id)["result"] == {"path": "/out.mp4"}
+
+
+def test_socket_broker_round_trip(broker, tmp_path):
+    socket_path = str(tmp_path / "broker.sock")
+
+    async def run():
+        server = BrokerServer(broker, socket_path)
+        await server.start()
+        client = SocketBroker(socket_path)
+        try:
+            job_id = await asyncio.to_thread(client.submit, "compress", {"n": 1})
+            job = await asyncio.to_thread(client.claim, "w1")
+            alive = await asyncio.to_thread(client.heartbeat, job_id, "w1")
+            with pytest.raises(Exception):
+                await asyncio.to_thread(client._call, "prune")
+            return job_id, job, alive
+        finally:
+            client.close()
+            await server.stop()
+
+    job_id, job, alive = asyncio.run(run())
+    assert job["id"] == job_id
+    assert job["payload"] == {"n": 1}
+    assert alive
+
+
+def serve_lines(socket_path, handle):
+    """Raw broker stand-in; handle(n) answers the nth request line, None hangs up"""
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen()
+    received = []
+
+    def run():
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            with conn, conn.makefile('rb') as reader:
+                while True:
+                    line = reader.readline()
+                    if not line:
+                        break
+                    received.append(line)
+                    reply = handle(len(received))
+                    if reply is None:
+                        break
+                    conn.sendall(reply)
+
+    threading.Thread(target=run, daemon=True).start()
+    return received, server
+
+
+def test_socket_broker_does_not_resend_an_unanswered_request(tmp_path):
+    socket_path = str(tmp_path / "broker.sock")
+    received, server = serve_lines(socket_path, lambda n: None)
+    client = SocketBroker(socket_path)
+    try:
+        with pytest.raises(ConnectionError):
+            client.submit("compress", {})
+        # The server may have queued it, a second submit would duplicate the job
+        assert len(received) == 1
+    finally:
+        client.close()
+        server.close()
+
+
+def test_socket_broker_reconnects_a_dropped_idle_connection(tmp_path):
+    socket_path = str(tmp_path / "broker.sock")
+    # The connection is dropped on its first request, later ones are answered
+    received, server = serve_lines(
+        socket_path,
+        lambda n: b'{"result": "job"}\n' if n != 1 else None
+    )
+    client = SocketBroker(socket_path)
+    try:
+        client.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.sock.connect(socket_path)
+        client.reader = client.sock.makefile('rb')
+        client.sock.sendall(b'{"method": "get_job", "args": ["x"]}\n')
+        assert client.reader.readline() == b""
+        # The request on the dead socket never reaches the server
+        assert client.submit("compress", {}) == "job"
+        assert len(received) == 2
+    finally:
+        client.close()
+        server.close()
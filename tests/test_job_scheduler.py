@@ -0,0 +1,143 @@
+import asyncio
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("pyrogram")
+
+from config import Config
+from processors.job_scheduler import ChatFlow, DeficitQueue, Job, JobScheduler, UserFlow
+
+QUANTUM = 60
+WEIGHTS = {"high": 4, "normal": 2, "low": 1}
+
+
+def make_job(job_id, user_id, cost=QUANTUM, priority="normal", chat_id=None):
+    return Job(job_id, None, user_id, chat_id, cost, priority)
+
+
+def fill(flow, user_id, count, cost=QUANTUM, priority="normal", start=0):
+    for i in range(count):
+        flow.jobs.append(make_job(start + i, user_id, cost, priority))
+
+
+def drain(queue, count):
+    jobs = []
+    for _ in range(count):
+        job = queue.select()
+        if job is None:
+            break
+        jobs.append(job)
+    return jobs
+
+
+def test_drr_shares_follow_priority_weights():
+    queue = DeficitQueue(QUANTUM)
+    high, low = UserFlow(WEIGHTS), UserFlow(WEIGHTS)
+    fill(high, 1, 50, priority="high")
+    fill(low, 2, 50, priority="low", start=100)
+    queue.activate(1, high)
+    queue.activate(2, low)
+
+    jobs = drain(queue, 20)
+    served = [job.user_id for job in jobs]
+    assert served.count(1) == 16
+    assert served.count(2) == 4
+
+
+def test_drr_shares_cost_not_job_count():
+    queue = DeficitQueue(QUANTUM)
+    small, large = UserFlow(WEIGHTS), UserFlow(WEIGHTS)
+    fill(small, 1, 100, cost=QUANTUM / 4)
+    fill(large, 2, 100, cost=QUANTUM, start=1000)
+    queue.activate(1, small)
+    queue.activate(2, large)
+
+    jobs = drain(queue, 50)
+    spent = {1: 0.0, 2: 0.0}
+    for job in jobs:
+        spent[job.user_id] += job.cost
+    assert spent[1] == pytest.approx(spent[2], rel=0.2)
+    assert sum(job.user_id == 1 for job in jobs) > sum(job.user_id == 2 for job in jobs)
+
+
+def test_drr_drops_drained_flows():
+    queue = DeficitQueue(QUANTUM)
+    flow = UserFlow(WEIGHTS)
+    fill(flow, 1, 2)
+    queue.activate(1, flow)
+
+    assert len(drain(queue, 5)) == 2
+    assert queue.is_empty()
+    assert flow.deficit == 0.0
+
+
+def test_chats_are_shared_before_users():
+    outer = DeficitQueue(QUANTUM)
+    busy = ChatFlow(QUANTUM, WEIGHTS)
+    quiet = ChatFlow(QUANTUM, WEIGHTS)
+    for i in range(10):
+        # Three users in one chat still get the share of a single chat
+        busy.add(make_job(i, 1 + i % 3, chat_id="busy"))
+        quiet.add(make_job(100 + i, 9, chat_id="quiet"))
+    outer.activate("busy", busy)
+    outer.activate("quiet", quiet)
+
+    jobs = drain(outer, 20)
+    chats = [job.chat_id for job in jobs]
+    assert chats.count("busy") == 10
+    assert chats.count("quiet") == 10
+    assert {job.user_id for job in jobs if job.chat_id == "busy"} == {1, 2, 3}
+
+
+def test_user_flow_orders():
+    sjf = UserFlow(WEIGHTS, order="sjf")
+    deadline = UserFlow(WEIGHTS, order="deadline")
+    for flow in (sjf, deadline):
+        for job_id, cost in enumerate((30, 10, 20)):
+            job = make_job(job_id, 1, cost)
+            job.deadline = 100 - job_id
+            flow.jobs.append(job)
+
+    assert [sjf.pop().cost for _ in range(3)] == [10, 20, 30]
+    assert [deadline.pop().id for _ in range(3)] == [2, 1, 0]
+
+
+def test_scheduler_interleaves_users(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "COST_MODEL_PATH", tmp_path / "cost_model.db")
+    monkeypatch.setattr(Config, "SCHEDULER_ORDER", "fifo")
+
+    async def run():
+        scheduler = JobScheduler(slots=1)
+        order = []
+        gate = asyncio.Event()
+
+        async def job(name):
+            order.append(name)
+            if name == "a0":
+                await gate.wait()
+            return name
+
+        tasks = [asyncio.create_task(scheduler.submit(lambda: job("a0"), user_id=1, cost=QUANTUM))]
+        await asyncio.sleep(0)
+        # Queued behind the running job: user 1 has three more, user 2 two
+        for i in (1, 2, 3):
+            tasks.append(asyncio.create_task(
+                scheduler.submit(lambda i=i: job(f"a{i}"), user_id=1, cost=QUANTUM)
+            ))
+        for i in (0, 1):
+            tasks.append(asyncio.create_task(
+                scheduler.submit(lambda i=i: job(f"b{i}"), user_id=2, cost=QUANTUM)
+            ))
+        await asyncio.sleep(0)
+        gate.set()
+
+        results = await asyncio.gather(*tasks)
+        scheduler.cost_model.close()
+        return order, results
+
+    order, results = asyncio.run(run())
+    assert results == ["a0", "a1", "a2", "a3", "b0", "b1"]
+    assert order[0] == "a0"
+    # User 2 queued last but gets an equal share right away, not after a3
+    assert sorted(order[1:5]) == ["a1", "a2", "b0", "b1"]
+    assert order[5] == "a3"
@@ -0,0 +1,136 @@
+import pytest
+
+pytest.importorskip("dotenv")
+
+from config import Config
+from processors.operation_graph import GraphCompiler, OperationGraph
+
+PROBE = {
+    'format': {'duration': '600'},
+    'streams': [
+        {'index': 0, 'codec_type': 'video', 'width': 1920, 'height': 800,
+         'nb_frames': '14400', 'avg_frame_rate': '24/1'},
+        {'index': 1, 'codec_type': 'audio', 'sample_rate': '48000'},
+        {'index': 2, 'codec_type': 'audio', 'sample_rate': '48000'},
+        {'index': 3, 'codec_type': 'audio', 'sample_rate': '44100'},
+        {'index': 4, 'codec_type': 'subtitle'}
+    ]
+}
+
+
+@pytest.fixture
+def compiler():
+    return GraphCompiler()
+
+
+def value_after(cmd, flag):
+    return cmd[cmd.index(flag) + 1]
+
+
+def test_trims_compose_relative_to_earlier_trims(compiler):
+    graph = OperationGraph().trim(start=60, end=360).trim(start=30, duration=500)
+    state = compiler.reduce(graph, PROBE)
+    assert state['start'] == 90
+    assert state['duration'] == 270
+
+
+def test_trims_become_input_seeks(compiler):
+    graph = OperationGraph().trim(start=10, duration=20)
+    cmd = compiler.compile(graph, "in.mkv", "out.mkv", PROBE)
+    # Before -i, so the skipped part is never decoded
+    assert cmd.index("-ss") < cmd.index("-i")
+    assert value_after(cmd, "-ss") == "10.000"
+    assert value_after(cmd, "-t") == "20.000"
+    assert value_after(cmd, "-c:v") == "copy"
+
+
+def test_seek_offset_resumes_inside_the_trim(compiler):
+    graph = OperationGraph().trim(start=10, duration=20)
+    cmd = compiler.compile(graph, "in.mkv", "out.mkv", PROBE, seek_offset=5)
+    assert value_after(cmd, "-ss") == "15.000"
+    assert value_after(cmd, "-t") == "15.000"
+
+
+def test_audio_drops_count_remaining_tracks(compiler):
+    graph = OperationGraph().select_streams(drop_audio=[1]).select_streams(drop_audio=[1])
+    state = compiler.reduce(graph, PROBE)
+    assert state['audio'] == [0]
+
+    cmd = compiler.compile(graph, "in.mkv", "out.mkv", PROBE)
+    assert "0:a:0" in cmd
+    assert "0:a:1" not in cmd and "0:a:2" not in cmd
+
+
+def test_dropping_every_track_disables_audio(compiler):
+    graph = OperationGraph().select_streams(drop_audio=[0, 1, 2])
+    cmd = compiler.compile(graph, "in.mkv", "out.mkv", PROBE)
+    assert "-an" in cmd
+
+
+def test_audio_selection_needs_probe_data(compiler):
+    with pytest.raises(ValueError):
+        compiler.reduce(OperationGraph().select_streams(drop_audio=[0]))
+
+
+def test_crop_goes_before_scale_and_later_scale_wins(compiler):
+    graph = OperationGraph().scale("1080p").crop(1920, 800, 0, 140).scale("720p").encode(quality="high")
+    cmd = compiler.compile(graph, "in.mkv", "out.mkv", PROBE)
+    filters = value_after(cmd, "-filter_complex")
+    assert filters.index("crop=1920:800:0:140") < filters.index("scale=1280:720")
+    assert "scale=1920:1080" not in filters
+    assert value_after(cmd, "-c:v") == "libx265"
+    assert value_after(cmd, "-crf") == str(Config.COMPRESSION_PRESETS["high"]["crf"])
+
+
+def test_decimate_switches_to_vfr(compiler):
+    graph = OperationGraph().scale("720p").decimate()
+    cmd = compiler.compile(graph, "in.mkv", "out.mkv", PROBE)
+    assert value_after(cmd, "-filter_complex").startswith("[0:v:0]mpdecimate,")
+    assert value_after(cmd, "-fps_mode") == "vfr"
+
+
+def test_graph_round_trips_through_lists():
+    graph = OperationGraph().trim(start=5).select_streams(drop_audio=[1]).scale("480p")
+    restored = OperationGraph.from_list(graph.to_list())
+    assert restored.to_list() == graph.to_list()
+    assert restored.needs_video_encode()
+    assert not OperationGraph().trim(start=5).needs_video_encode()
+
+
+def test_output_metadata_predicts_trimmed_scaled_output(compiler):
+    graph = OperationGraph().trim(start=100, end=400).crop(1920, 800, 0, 140).scale("720p")
+    metadata = compiler.output_metadata(graph, PROBE)
+    assert metadata['duration'] == 300
+    assert (metadata['width'], metadata['height']) == (1280, 534)
+    assert metadata['video']
+
+
+def test_moov_size_covers_every_sample(compiler):
+    size = compiler.estimate_moov_size(PROBE)
+    samples = (
+        600 * 24 * GraphCompiler.MOOV_SAMPLE_BYTES['video']
+        + 2 * 600 * 48000 / 1024 * GraphCompiler.MOOV_SAMPLE_BYTES['audio']
+        + 600 * 44100 / 1024 * GraphCompiler.MOOV_SAMPLE_BYTES['audio']
+    )
+    expected = (GraphCompiler.MOOV_BASE_SIZE + samples) * Config.MOOV_RESERVE_FACTOR
+    assert size == pytest.approx(expected, rel=0.001)
+    assert size > GraphCompiler.MOOV_BASE_SIZE + samples
+
+
+def test_moov_size_scales_with_trimmed_duration(compiler):
+    full = compiler.estimate_moov_size(PROBE)
+    tenth = compiler.estimate_moov_size(PROBE, duration=60)
+    assert tenth < full / 5
+    assert compiler.estimate_moov_size(None) is None
+    assert compiler.estimate_moov_size({'format': {}, 'streams': []}) is None
+
+
+def test_mp4_outputs_reserve_the_moov_up_front(compiler, monkeypatch):
+    monkeypatch.setattr(Config, "OUTPUT_FINALIZATION", "moov_reserve")
+    graph = OperationGraph().trim(duration=60)
+    cmd = compiler.compile(graph, "in.mkv", "out.mp4", PROBE)
+    assert int(value_after(cmd, "-moov_size")) == compiler.estimate_moov_size(PROBE, 60)
+    assert "-moov_size" not in compiler.compile(graph, "in.mkv", "out.mkv", PROBE)
+    # Unknown length: nothing to size the box from
+    unknown = {'format': {}, 'streams': PROBE['streams']}
+    assert "+faststart" in compiler.compile(OperationGraph(), "in.mkv", "out.mp4", unknown)
@@ -0,0 +1,136 @@
+import time
+from utils.session_store import Session, SessionStore
+
+
+def age(store, key, seconds):
+    """Pretend a session was last used ``seconds`` ago"""
+    store.sessions[str(key)].last_access = time.time() - seconds
+
+
+def test_idle_sessions_expire_on_access():
+    evicted = []
+    store = SessionStore(ttl=60, on_evict=lambda key, session: evicted.append(key))
+    store["a"] = {"user_id": 1}
+    age(store, "a", 61)
+
+    assert store.get("a") is None
+    assert "a" not in store
+    assert evicted == ["a"]
+
+
+def test_access_refreshes_ttl():
+    store = SessionStore(ttl=60)
+    store["a"] = {"user_id": 1}
+    age(store, "a", 50)
+
+    assert store["a"]["user_id"] == 1
+    assert store.sweep() == 0
+    assert "a" in store
+
+
+def test_sweep_releases_only_idle_sessions():
+    evicted = []
+    store = SessionStore(ttl=60, on_evict=lambda key, session: evicted.append(key))
+    for key in ("old", "new"):
+        store[key] = {"user_id": 1}
+    age(store, "old", 120)
+
+    assert store.sweep() == 1
+    assert evicted == ["old"]
+    assert list(store) == ["new"]
+
+
+def test_pinned_sessions_survive_ttl_and_limit():
+    evicted = []
+    store = SessionStore(ttl=60, max_entries=2, on_evict=lambda key, session: evicted.append(key))
+    store["job"] = {"user_id": 1}
+    store.pin("job")
+    age(store, "job", 3600)
+
+    assert store.sweep() == 0
+    for key in ("b", "c"):
+        store[key] = {"user_id": 2}
+    assert "job" in store.sessions
+    assert evicted == ["b"]
+
+
+def test_pins_are_counted_and_unpin_restarts_ttl():
+    store = SessionStore(ttl=60)
+    store["job"] = {"user_id": 1}
+    store.pin("job")
+    store.pin("job")
+    age(store, "job", 3600)
+
+    store.unpin("job")
+    assert store.sweep() == 0
+    store.unpin("job")
+    assert "job" not in store.pinned
+    # The idle time counts from the last unpin, not from before the jobs
+    assert store.sweep() == 0
+    assert store["job"]["user_id"] == 1
+
+
+def test_lru_eviction_without_backing():
+    evicted = []
+    store = SessionStore(max_entries=2, on_evict=lambda key, session: evicted.append(key))
+    store["a"] = {}
+    store["b"] = {}
+    store["a"]
+    store["c"] = {}
+
+    assert evicted == ["b"]
+    assert sorted(store) == ["a", "c"]
+
+
+def test_backed_store_spills_and_reloads(tmp_path):
+    evicted = []
+    store = SessionStore(
+        max_entries=1,
+        on_evict=lambda key, session: evicted.append(key),
+        db_path=tmp_path / "sessions.db"
+    )
+    store["a"] = {"user_id": 1, "graph": [{"type": "trim", "params": {"start": 5}}]}
+    store["b"] = {"user_id": 2}
+
+    assert list(store) == ["b"]
+    assert store["a"]["graph"][0]["params"]["start"] == 5
+    assert evicted == []
+    store.close()
+
+
+def test_backed_store_expires_on_disk(tmp_path):
+    path = tmp_path / "sessions.db"
+    store = SessionStore(ttl=60, db_path=path)
+    store["a"] = {"user_id": 1, "file_path": "/tmp/a.mp4"}
+    store.conn.execute("UPDATE sessions SET touched = ?", (time.time() - 120,))
+    store.sessions.clear()
+    store.close()
+
+    evicted = []
+    reopened = SessionStore(ttl=60, db_path=path, on_evict=lambda key, session: evicted.append(key))
+    assert reopened.active_paths() == ["/tmp/a.mp4"]
+    assert reopened.sweep() == 1
+    assert evicted == ["a"]
+    assert reopened.active_paths() == []
+    reopened.close()
+
+
+def test_session_keeps_rare_keys_aside():
+    session = Session({"user_id": 1, "audio_selected": [2]})
+    assert session.extra == {"audio_selected": [2]}
+    assert session.to_dict() == {"user_id": 1, "audio_selected": [2]}
+    del session["audio_selected"]
+    assert "audio_selected" not in session
+
+
+def test_limit_skips_pinned_sessions_at_the_lru_end():
+    evicted = []
+    store = SessionStore(max_entries=3, on_evict=lambda key, session: evicted.append(key))
+    for key in ("p1", "p2", "a", "b"):
+        store[key] = {}
+        if key.startswith("p"):
+            store.pin(key)
+    store["c"] = {}
+
+    assert evicted == ["a", "b"]
+    assert list(store) == ["p1", "p2", "c"]
@@ -0,0 +1,47 @@
+import os
+import asyncio
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("pyrogram")
+
+from config import Config
+from processors.uploader import Uploader
+
+
+class FakeClient:
+    def rnd_id(self):
+        return 1
+
+
+def test_failed_part_stops_the_other_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "UPLOAD_CONNECTIONS", 4)
+    path = str(tmp_path / "out.mp4")
+    with open(path, "wb") as f:
+        f.write(bytes(Uploader.PART_SIZE * 8))
+    uploader = Uploader(None, None)
+    reads = []
+
+    async def upload_part(client, file_id, index, total, data, big):
+        if index == 0:
+            raise ConnectionError("part failed for good")
+        await asyncio.sleep(0.05)
+
+    real_pread = os.pread
+
+    def pread(fd, size, offset):
+        reads.append(fd)
+        return real_pread(fd, size, offset)
+
+    monkeypatch.setattr(uploader, "upload_part", upload_part)
+    monkeypatch.setattr(os, "pread", pread)
+
+    async def run():
+        with pytest.raises(ConnectionError):
+            await uploader.upload_file(FakeClient(), path, "out.mp4")
+        read = len(reads)
+        # Nothing may read through the closed fd afterwards
+        await asyncio.sleep(0.3)
+        return read
+
+    assert asyncio.run(run()) == len(reads)
@@ -1,80 +1,159 @@
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
 class Keyboard:
+    # Separates the action from the session token in callback data
+    TOKEN_SEPARATOR = "|"
+
+    @staticmethod
+    def pack(action: str, token: Optional[str] = None) -> str:
+        """Attach a session token to callback data (64 bytes max)"""
+        if not token:
+            return action
+        return f"{action}{Keyboard.TOKEN_SEPARATOR}{token}"
+
+    @staticmethod
+    def unpack(data: str) -> Tuple[str, Optional[str]]:
+        """Split callback data into action and session token"""
+        action, _, token = data.partition(Keyboard.TOKEN_SEPARATOR)
+        return action, token or None
+
     @staticmethod
-    def get_main_keyboard() -> InlineKeyboardMarkup:
+    def get_main_keyboard(token: Optional[str] = None) -> InlineKeyboardMarkup:
         """Get main menu keyboard"""
         buttons = [
             [
-                InlineKeyboardButton("🔊 Audio", callback_data="audio_menu"),
-                InlineKeyboardButton("🔄 Convert", callback_data="convert_menu")
+                InlineKeyboardButton("🔊 Audio", callback_data=Keyboard.pack("audio_menu", token)),
+                InlineKeyboardButton("🔄 Convert", callback_data=Keyboard.pack("convert_menu", token))
             ],
             [
-                InlineKeyboardButton("🔗 Merge", callback_data="merge_menu"),
-                InlineKeyboardButton("✂️ Cut", callback_data="cut_menu")
+                InlineKeyboardButton("🔗 Merge", callback_data=Keyboard.pack("merge_menu", token)),
+                InlineKeyboardButton("✂️ Cut", callback_data=Keyboard.pack("cut_menu", token))
             ],
             [
-                InlineKeyboardButton("🎯 Compress", callback_data="compress_menu"),
-                InlineKeyboardButton("📝 Subtitle", callback_data="subtitle_menu")
+                InlineKeyboardButton("🎯 Compress", callback_data=Keyboard.pack("compress_menu", token)),
+                InlineKeyboardButton("📝 Subtitle", callback_data=Keyboard.pack("subtitle_menu", token))
             ],
             [
-                InlineKeyboardButton("ℹ️ MediaInfo", callback_data="mediainfo"),
-                InlineKeyboardButton("❌ Cancel", callback_data="cancel")
+                InlineKeyboardButton("ℹ️ MediaInfo", callback_data=Keyboard.pack("mediainfo", token)),
+                InlineKeyboardButton("❌ Cancel", callback_data=Keyboard.pack("cancel", token))
             ]
         ]
         return InlineKeyboardMarkup(buttons)
 
     @staticmethod
-    def get_compression_keyboard(settings: Dict) -> InlineKeyboardMarkup:
+    def get_compression_keyboard(settings: Dict, token: Optional[str] = None) -> InlineKeyboardMarkup:
         """Get compression settings keyboard"""
         buttons = [
             [
                 InlineKeyboardButton(
                     "2160p (4K) ✓" if settings.get('resolution') == '2160p' else "2160p (4K)",
-                    callback_data="res_2160"
+                    callback_data=Keyboard.pack("compress_res_2160p", token)
                 ),
                 InlineKeyboardButton(
                     "1080p (FHD) ✓" if settings.get('resolution') == '1080p' else "1080p (FHD)",
-                    callback_data="res_1080"
+                    callback_data=Keyboard.pack("compress_res_1080p", token)
                 )
             ],
             [
                 InlineKeyboardButton(
                     "720p (HD) ✓" if settings.get('resolution') == '720p' else "720p (HD)",
-                    callback_data="res_720"
+                    callback_data=Keyboard.pack("compress_res_720p", token)
                 ),
                 InlineKeyboardButton(
                     "480p (SD) ✓" if settings.get('resolution') == '480p' else "480p (SD)",
-                    callback_data="res_480"
+                    callback_data=Keyboard.pack("compress_res_480p", token)
                 )
             ],
             [
                 InlineKeyboardButton(
                     "High Quality ✓" if settings.get('quality') == 'high' else "High Quality",
-                    callback_data="quality_high"
+                    callback_data=Keyboard.pack("compress_quality_high", token)
                 ),
                 InlineKeyboardButton(
                     "Medium Quality ✓" if settings.get('quality') == 'medium' else "Medium Quality",
-                    callback_data="quality_medium"
+                    callback_data=Keyboard.pack("compress_quality_medium", token)
                 ),
                 InlineKeyboardButton(
                     "Low Quality ✓" if settings.get('quality') == 'low' else "Low Quality",
-                    callback_data="quality_low"
+                    callback_data=Keyboard.pack("compress_quality_low", token)
+                )
+            ],
+            [
+                InlineKeyboardButton(
+                    "✂️ Auto-crop ✓" if settings.get('autocrop') else "✂️ Auto-crop",
+                    callback_data=Keyboard.pack("compress_autocrop", token)
+                ),
+                InlineKeyboardButton("👁 Preview", callback_data=Keyboard.pack("compress_preview", token))
+            ],
+            [
+                InlineKeyboardButton("⚙️ Custom Settings", callback_data=Keyboard.pack("compress_custom", token)),
+                InlineKeyboardButton("📶 All Sizes", callback_data=Keyboard.pack("compress_ladder", token))
+            ],
+            [
+                InlineKeyboardButton("✅ Start Compression", callback_data=Keyboard.pack("compress_start", token)),
+                InlineKeyboardButton("⬅️ Back", callback_data=Keyboard.pack("main_menu", token))
+            ]
+        ]
+        return InlineKeyboardMarkup(buttons)
+
+    @staticmethod
+    def get_batch_keyboard(settings: Dict, token: Optional[str] = None) -> InlineKeyboardMarkup:
+        """Get batch (media group) settings keyboard"""
+        def mark(label: str, selected: bool) -> str:
+            return f"{label} ✓" if selected else label
+
+        buttons = [
+            [
+                InlineKeyboardButton(
+                    mark(res, settings.get('resolution') == res),
+                    callback_data=Keyboard.pack(f"batch_res_{res}", token)
+                )
+                for res in ("1080p", "720p", "480p")
+            ],
+            [
+                InlineKeyboardButton(
+                    mark(quality.capitalize(), settings.get('quality') == quality),
+                    callback_data=Keyboard.pack(f"batch_quality_{quality}", token)
                 )
+                for quality in ("high", "medium", "low")
+            ],
+            [
+                InlineKeyboardButton("✅ Start Batch", callback_data=Keyboard.pack("batch_start", token)),
+                InlineKeyboardButton("❌ Cancel", callback_data=Keyboard.pack("batch_cancel", token))
+            ]
+        ]
+        return InlineKeyboardMarkup(buttons)
+
+    @staticmethod
+    def get_cut_keyboard(token: Optional[str] = None) -> InlineKeyboardMarkup:
+        """Get cut (trim) keyboard"""
+        steps = (("-1m", -60), ("-10s", -10), ("+10s", 10), ("+1m", 60))
+        buttons = [
+            [
+                InlineKeyboardButton(f"⏮ {label}", callback_data=Keyboard.pack(f"cut_start_{delta}", token))
+                for label, delta in steps
+            ],
+            [
+                InlineKeyboardButton(f"⏭ {label}", callback_data=Keyboard.pack(f"cut_end_{delta}", token))
+                for label, delta in steps
             ],
             [
-                InlineKeyboardButton("⚙️ Custom Settings", callback_data="compress_custom")
+                InlineKeyboardButton("✂️ Apply Cut", callback_data=Keyboard.pack("cut_apply", token)),
+                InlineKeyboardButton("✅ Process", callback_data=Keyboard.pack("cut_process", token))
             ],
             [
-                InlineKeyboardButton("✅ Start Compression", callback_data="compress_start"),
-                InlineKeyboardButton("⬅️ Back", callback_data="main_menu")
+                InlineKeyboardButton("⬅️ Back", callback_data=Keyboard.pack("main_menu", token))
             ]
         ]
         return InlineKeyboardMarkup(buttons)
 
     @staticmethod
-    def get_audio_keyboard(tracks: List[Dict], selected: List[int]) -> InlineKeyboardMarkup:
+    def get_audio_keyboard(
+        tracks: List[Dict],
+        selected: List[int],
+        token: Optional[str] = None
+    ) -> InlineKeyboardMarkup:
         """Get audio tracks keyboard"""
         buttons = []
         
@@ -85,19 +164,22 @@ class Keyboard:
             buttons.append([
                 InlineKeyboardButton(
                     f"{'✅' if is_selected else '☐'} {track['title']} ({track['language']})",
-                    callback_data=f"audio_select_{track_index}"
+                    callback_data=Keyboard.pack(f"audio_select_{track_index}", token)
                 )
             ])
 
         # Add control buttons
         buttons.extend([
             [
-                InlineKeyboardButton("📤 Extract Selected", callback_data="audio_extract"),
-                InlineKeyboardButton("🗑 Remove Selected", callback_data="audio_remove")
+                InlineKeyboardButton("🔊 Normalize Loudness", callback_data=Keyboard.pack("audio_normalize", token))
+            ],
+            [
+                InlineKeyboardButton("📤 Extract Selected", callback_data=Keyboard.pack("audio_extract", token)),
+                InlineKeyboardButton("🗑 Remove Selected", callback_data=Keyboard.pack("audio_remove", token))
             ],
             [
-                InlineKeyboardButton("✅ Process", callback_data="audio_process"),
-                InlineKeyboardButton("⬅️ Back", callback_data="main_menu")
+                InlineKeyboardButton("✅ Process", callback_data=Keyboard.pack("audio_process", token)),
+                InlineKeyboardButton("⬅️ Back", callback_data=Keyboard.pack("main_menu", token))
             ]
         ])
 
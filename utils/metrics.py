@@ -0,0 +1,307 @@
+import os
+import time
+import shutil
+import asyncio
+import logging
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+from pyrogram import Client
+from pyrogram.errors import FloodWait
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+LabelValues = Tuple[str, ...]
+
+
+class Metric:
+    """A metric family with a fixed set of label names"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[LabelValues, float] = {}
+        REGISTRY.register(self)
+
+    def key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def format_labels(self, values: LabelValues, extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(zip(self.labelnames, values))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        escaped = (
+            (name, value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+            for name, value in pairs
+        )
+        return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{self.format_labels(values)} {value}"
+            for values, value in sorted(self.values.items())
+        ]
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+            *self.samples()
+        ]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Set directly, or computed at scrape time by a function"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.function: Optional[Callable[[], Dict[LabelValues, float]]] = None
+
+    def set(self, value: float, **labels):
+        self.values[self.key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def remove(self, **labels):
+        self.values.pop(self.key(labels), None)
+
+    def set_function(self, function: Callable[[], Dict[LabelValues, float]]):
+        """Compute the values on every scrape, keyed by label values"""
+        self.function = function
+
+    def samples(self) -> List[str]:
+        if self.function is not None:
+            try:
+                self.values = dict(self.function())
+            except Exception as e:
+                logger.error(f"Error collecting {self.name}: {e}")
+        return super().samples()
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = ()
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.counts: Dict[LabelValues, List[int]] = {}
+        self.sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self.key(labels)
+        counts = self.counts.setdefault(key, [0] * (len(self.buckets) + 1))
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+        counts[-1] += 1
+        self.sums[key] = self.sums.get(key, 0.0) + value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe how long the block took, whether or not it raised"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started, **labels)
+
+    def samples(self) -> List[str]:
+        lines = []
+        for values, counts in sorted(self.counts.items()):
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{self.format_labels(values, ('le', repr(float(bound))))} {count}")
+            lines.append(f"{self.name}_bucket{self.format_labels(values, ('le', '+Inf'))} {counts[-1]}")
+            lines.append(f"{self.name}_sum{self.format_labels(values)} {self.sums[values]}")
+            lines.append(f"{self.name}_count{self.format_labels(values)} {counts[-1]}")
+        return lines
+
+
+class Registry:
+    """Every metric of the process, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric):
+        self.metrics.append(metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+REQUEST_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+STAGE_SECONDS = Histogram(
+    "video_bot_stage_seconds",
+    "Time spent in each pipeline stage (download, probe, queue_wait, encode, upload, edit)",
+    ("stage",),
+    STAGE_BUCKETS
+)
+TELEGRAM_REQUEST_SECONDS = Histogram(
+    "video_bot_telegram_request_seconds",
+    "Latency of Telegram API calls by method, FloodWait sleeps included",
+    ("method",),
+    REQUEST_BUCKETS
+)
+FAILURES = Counter(
+    "video_bot_failures_total",
+    "Failures by stage and cause",
+    ("stage", "cause")
+)
+PROCESSES = Gauge(
+    "video_bot_processes",
+    "Running ffmpeg/ffprobe children",
+    ("command",)
+)
+QUEUE_DEPTH = Gauge(
+    "video_bot_scheduler_jobs",
+    "Scheduler jobs by state",
+    ("state",)
+)
+TEMP_DIR_BYTES = Gauge(
+    "video_bot_temp_dir_bytes",
+    "Bytes held by the bot's files in TEMP_DIR, and free on its filesystem",
+    ("state",)
+)
+JOB_FPS = Gauge(
+    "video_bot_job_fps",
+    "Frames per second of a running ffmpeg job",
+    ("job",)
+)
+JOB_SPEED = Gauge(
+    "video_bot_job_speed",
+    "Encoding speed of a running ffmpeg job, as a multiple of real time",
+    ("job",)
+)
+
+
+def failure_cause(error: BaseException) -> str:
+    """Short cause label for an exception"""
+    if isinstance(error, FloodWait):
+        return "flood_wait"
+    if isinstance(error, asyncio.TimeoutError):
+        return "timeout"
+    return type(error).__name__
+
+
+def temp_dir_usage() -> Dict[LabelValues, float]:
+    temp_dir = Config.TEMP_DIR
+    used = 0
+    for root, _, names in os.walk(temp_dir):
+        for name in names:
+            try:
+                used += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                continue
+    return {
+        ("used",): used,
+        ("free",): shutil.disk_usage(temp_dir).free
+    }
+
+
+TEMP_DIR_BYTES.set_function(temp_dir_usage)
+
+
+class MeteredClient(Client):
+    """Pyrogram Client that times every API call it makes
+
+    Message edits are also recorded as the ``edit`` stage, since they are
+    what progress reporting waits on.
+    """
+
+    async def invoke(self, query, *args, **kwargs):
+        method = type(query).__name__
+        started = time.monotonic()
+        try:
+            return await super().invoke(query, *args, **kwargs)
+        except Exception as e:
+            FAILURES.inc(stage="telegram", cause=failure_cause(e))
+            raise
+        finally:
+            elapsed = time.monotonic() - started
+            TELEGRAM_REQUEST_SECONDS.observe(elapsed, method=method)
+            if method == "EditMessage":
+                STAGE_SECONDS.observe(elapsed, stage="edit")
+
+
+class MetricsServer:
+    """Serve the registry on a local HTTP endpoint for Prometheus"""
+
+    def __init__(self, registry: Registry = REGISTRY):
+        self.config = Config()
+        self.registry = registry
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(
+            self.handle,
+            self.config.METRICS_HOST,
+            self.config.METRICS_PORT
+        )
+        logger.info(f"Metrics on http://{self.config.METRICS_HOST}:{self.config.METRICS_PORT}/metrics")
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await asyncio.wait_for(reader.readline(), timeout=5)
+            # Drain the headers, nothing in them matters here
+            while (await asyncio.wait_for(reader.readline(), timeout=5)).strip():
+                pass
+            parts = request.decode(errors='replace').split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status = "200 OK"
+                body = self.registry.render().encode()
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+            else:
+                status = "404 Not Found"
+                body = b"Not Found\n"
+                content_type = "text/plain"
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except Exception as e:
+            logger.error(f"Error serving metrics: {e}")
+        finally:
+            writer.close()
@@ -0,0 +1,373 @@
+import json
+import time
+import sqlite3
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class Session:
+    """Compact per-job session record with dict-style access"""
+
+    FIELDS = (
+        'user_id',
+        'chat_id',
+        'file_id',
+        'file_name',
+        'file_size',
+        'file_path',
+        'message_id',
+        'progress_msg_id',
+        'compress_settings',
+        'graph',
+        'probe_data'
+    )
+    __slots__ = FIELDS + ('extra', 'last_access')
+
+    def __init__(self, data: Optional[Dict] = None):
+        self.extra = None
+        self.last_access = time.time()
+        for key, value in (data or {}).items():
+            self[key] = value
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self.FIELDS:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any):
+        if key in self.FIELDS:
+            setattr(self, key, value)
+        else:
+            # Rarely used keys live in a lazily created dict
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __delitem__(self, key: str):
+        if key in self.FIELDS:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        elif self.extra and key in self.extra:
+            del self.extra[key]
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key: str) -> bool:
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Get a value or default"""
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_dict(self) -> Dict:
+        """Serialize the session (JSON compatible values only)"""
+        data = {key: getattr(self, key) for key in self.FIELDS if hasattr(self, key)}
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+
+class SessionStore:
+    """Bounded session store with idle TTL, LRU eviction and optional SQLite backing
+
+    Keys are stored as strings. Without backing, sessions evicted by TTL or
+    by the entry limit are passed to ``on_evict`` so their files can be
+    released. With backing, sessions pushed out of memory by the entry limit
+    are spilled to disk and loaded back on the next access; only TTL expiry
+    and the disk limit release them. Pinned sessions (a job is queued or
+    running on them) are never expired or evicted.
+    """
+
+    def __init__(
+        self,
+        ttl: int = 3600,
+        max_entries: int = 10000,
+        on_evict: Optional[Callable[[Any, Session], None]] = None,
+        db_path: Optional[str] = None,
+        max_disk_entries: int = 500000
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.on_evict = on_evict
+        self.sessions: 'OrderedDict[Any, Session]' = OrderedDict()
+        self.pinned: Dict[str, int] = {}
+        self.last_flush = time.time()
+        self.conn = None
+
+        if db_path:
+            self.conn = sqlite3.connect(str(db_path), isolation_level=None)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS sessions (
+                    key TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    file_path TEXT,
+                    touched REAL NOT NULL
+                )
+                """
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS sessions_touched ON sessions (touched)"
+            )
+
+    def __contains__(self, key: Any) -> bool:
+        return self._load(key) is not None
+
+    def __getitem__(self, key: Any) -> Session:
+        session = self._load(key)
+        if session is None:
+            raise KeyError(key)
+        return session
+
+    def __setitem__(self, key: Any, value: Any):
+        key = str(key)
+        session = value if isinstance(value, Session) else Session(value)
+        session.last_access = time.time()
+        self.sessions[key] = session
+        self.sessions.move_to_end(key)
+        self._save(key, session)
+        self._enforce_limit()
+
+    def __delitem__(self, key: Any):
+        if self.pop(key, None) is None:
+            raise KeyError(key)
+
+    def __iter__(self) -> Iterator:
+        return iter(list(self.sessions.keys()))
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        """Get a session or default"""
+        session = self._load(key)
+        return default if session is None else session
+
+    def pop(self, key: Any, default: Any = None) -> Any:
+        """Remove a session without running the eviction hook"""
+        key = str(key)
+        session = self._load(key)
+        self.sessions.pop(key, None)
+        if self.conn:
+            self.conn.execute("DELETE FROM sessions WHERE key = ?", (key,))
+        return default if session is None else session
+
+    def items(self) -> List:
+        """Get in-memory (key, session) pairs"""
+        return list(self.sessions.items())
+
+    def clear(self):
+        """Drop every session without running the eviction hook"""
+        self.sessions.clear()
+        if self.conn:
+            self.conn.execute("DELETE FROM sessions")
+
+    def pin(self, key: Any):
+        """Keep a session alive until a matching unpin, however long it idles"""
+        key = str(key)
+        self.pinned[key] = self.pinned.get(key, 0) + 1
+
+    def unpin(self, key: Any):
+        """Release a pin; the idle TTL starts over from now"""
+        key = str(key)
+        count = self.pinned.get(key, 0) - 1
+        if count > 0:
+            self.pinned[key] = count
+            return
+        self.pinned.pop(key, None)
+        session = self.sessions.get(key)
+        if session is not None:
+            session.last_access = time.time()
+            self.sessions.move_to_end(key)
+            self._save(key, session)
+
+    def is_pinned(self, key: Any) -> bool:
+        """Check whether a job is queued or running on a session"""
+        return str(key) in self.pinned
+
+    def sweep(self) -> int:
+        """Evict idle sessions from memory and disk, returns the number released"""
+        cutoff = time.time() - self.ttl
+        released = 0
+
+        # OrderedDict is kept in access order, so idle sessions come first
+        for key, session in list(self.sessions.items()):
+            if session.last_access >= cutoff:
+                break
+            if key in self.pinned:
+                continue
+            del self.sessions[key]
+            if self.conn:
+                self.conn.execute("DELETE FROM sessions WHERE key = ?", (key,))
+            self._evict(key, session)
+            released += 1
+
+        if self.conn:
+            self.flush()
+            rows = self.conn.execute(
+                "SELECT key, data FROM sessions WHERE touched < ?",
+                (cutoff,)
+            ).fetchall()
+            excess = self.conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            excess -= len(rows) + self.max_disk_entries
+            if excess > 0:
+                rows += self.conn.execute(
+                    "SELECT key, data FROM sessions WHERE touched >= ? "
+                    "ORDER BY touched LIMIT ?",
+                    (cutoff, excess)
+                ).fetchall()
+
+            for key, data in rows:
+                if key in self.pinned:
+                    continue
+                self.conn.execute("DELETE FROM sessions WHERE key = ?", (key,))
+                session = self.sessions.pop(key, None) or Session(json.loads(data))
+                self._evict(key, session)
+                released += 1
+
+        return released
+
+    def flush(self):
+        """Write sessions touched since the last flush to disk"""
+        if not self.conn:
+            return
+        since = self.last_flush
+        self.last_flush = time.time()
+        for key, session in self.sessions.items():
+            if session.last_access >= since:
+                self._save(key, session)
+
+    def active_paths(self) -> List[str]:
+        """Get every file path still owned by a session"""
+        paths = {
+            session.get('file_path') for session in self.sessions.values()
+            if session.get('file_path')
+        }
+        if self.conn:
+            paths.update(
+                row[0] for row in self.conn.execute(
+                    "SELECT file_path FROM sessions WHERE file_path IS NOT NULL"
+                )
+            )
+        return list(paths)
+
+    async def run_sweeper(self, interval: int = 60):
+        """Periodically expire idle sessions"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                released = self.sweep()
+                if released:
+                    logger.info(f"Expired {released} idle session(s)")
+            except Exception as e:
+                logger.error(f"Error sweeping sessions: {e}")
+
+    def close(self):
+        """Flush and close the backing database"""
+        if self.conn:
+            try:
+                self.flush()
+                self.conn.close()
+            except Exception as e:
+                logger.error(f"Error closing session store: {e}")
+            self.conn = None
+
+    def _load(self, key: Any) -> Optional[Session]:
+        """Get a live session from memory or disk and mark it as used"""
+        key = str(key)
+        session = self.sessions.get(key)
+        now = time.time()
+
+        if session is None and self.conn:
+            row = self.conn.execute(
+                "SELECT data, touched FROM sessions WHERE key = ?",
+                (key,)
+            ).fetchone()
+            if row:
+                session = Session(json.loads(row[0]))
+                session.last_access = row[1]
+                self.sessions[key] = session
+
+        if session is None:
+            return None
+
+        if now - session.last_access > self.ttl and key not in self.pinned:
+            self.sessions.pop(key, None)
+            if self.conn:
+                self.conn.execute("DELETE FROM sessions WHERE key = ?", (key,))
+            self._evict(key, session)
+            return None
+
+        session.last_access = now
+        self.sessions.move_to_end(key)
+        self._enforce_limit()
+        return session
+
+    def _save(self, key: Any, session: Session):
+        """Write one session to disk"""
+        if not self.conn:
+            return
+        try:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?)",
+                (
+                    key,
+                    json.dumps(session.to_dict()),
+                    session.get('file_path'),
+                    session.last_access
+                )
+            )
+        except Exception as e:
+            logger.error(f"Error saving session {key}: {e}")
+
+    def _enforce_limit(self):
+        """Keep memory bounded, spilling or releasing the least recently used"""
+        excess = len(self.sessions) - self.max_entries
+        if excess <= 0:
+            return
+
+        # Walk from the least recently used end and stop once enough are found,
+        # so only pinned sessions at the front are passed over
+        victims = []
+        for key in self.sessions:
+            if key in self.pinned:
+                continue
+            victims.append(key)
+            if len(victims) == excess:
+                break
+
+        for key in victims:
+            session = self.sessions.pop(key)
+            if self.conn:
+                self._save(key, session)
+            else:
+                self._evict(key, session)
+
+    def _evict(self, key: Any, session: Session):
+        """Run the eviction hook"""
+        if not self.on_evict:
+            return
+        try:
+            self.on_evict(key, session)
+        except Exception as e:
+            logger.error(f"Error in session eviction hook: {e}")
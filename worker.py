@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import os
+import socket
+from pathlib import Path
+from typing import Dict, Optional
+from processors.job_broker import JobBroker, create_broker
+from processors.job_scheduler import Job, current_job
+from processors.operation_graph import OperationGraph
+from processors.remote_processor import BrokerProgress
+from processors.video_processor import VideoProcessor
+from utils.metrics import MetricsServer
+from config import Config
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+class EncodeWorker:
+    """Pulls encode jobs from the broker and runs them locally
+
+    Start as many as the host has capacity for, on any number of hosts that
+    share TEMP_DIR and can reach the broker.
+    """
+
+    KINDS = ['compress_video', 'compress_ladder']
+
+    def __init__(self, broker: JobBroker, concurrency: Optional[int] = None):
+        self.config = Config()
+        self.broker = broker
+        self.concurrency = concurrency or self.config.WORKER_CONCURRENCY
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.video_processor = VideoProcessor()
+
+    async def run(self):
+        """Run job loops until cancelled"""
+        logger.info(f"Worker {self.worker_id} started with {self.concurrency} slot(s)")
+        await self.recover()
+        await asyncio.gather(*(self.run_slot() for _ in range(self.concurrency)))
+
+    async def recover(self):
+        """Drop checkpointed jobs left by a crash that nobody waits for any more
+
+        Jobs whose broker job is still queued or claimed are kept: the broker
+        requeues them and whichever worker claims one resumes it from its
+        segments. Segment directories of finished broker jobs are reclaimed.
+        """
+        try:
+            journal = self.video_processor.journal
+            for job in journal.get_interrupted_jobs():
+                if not await self.is_live(job['id']):
+                    logger.info(f"Dropping interrupted job {job['id']}")
+                    self.video_processor.segmented.fail(job)
+
+            # Only segment directories are the workers' alone, TEMP_DIR is
+            # shared with the frontend's downloads and outputs
+            keep = journal.get_active_paths()
+            for path in Path(self.config.TEMP_DIR).glob("segments_*"):
+                if await self.is_live(path.name[len("segments_"):]):
+                    keep.append(str(path))
+            await self.video_processor.file_manager.reclaim_orphans(keep, pattern="segments_*")
+            journal.prune()
+
+        except Exception as e:
+            logger.error(f"Error recovering interrupted jobs: {e}")
+
+    async def is_live(self, job_id: str) -> bool:
+        """Whether a broker job may still be (re)run"""
+        job = await asyncio.to_thread(self.broker.get_job, job_id)
+        return job is not None and job['state'] in ('queued', 'claimed')
+
+    async def run_slot(self):
+        """Claim and process jobs one at a time"""
+        while True:
+            try:
+                await asyncio.to_thread(
+                    self.broker.requeue_stale, self.config.WORKER_HEARTBEAT_TIMEOUT
+                )
+                job = await asyncio.to_thread(self.broker.claim, self.worker_id, self.KINDS)
+                if job is None:
+                    await asyncio.sleep(self.config.WORKER_POLL_INTERVAL)
+                    continue
+                await self.process(job)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in worker loop: {e}")
+                await asyncio.sleep(self.config.WORKER_POLL_INTERVAL)
+
+    async def process(self, job: Dict):
+        """Run one job while keeping its claim alive"""
+        task = asyncio.create_task(self.execute(job))
+        interval = self.config.WORKER_HEARTBEAT_TIMEOUT / 3
+
+        while not task.done():
+            await asyncio.wait([task], timeout=interval)
+            if task.done():
+                break
+            if not await asyncio.to_thread(self.broker.heartbeat, job['id'], self.worker_id):
+                # Cancelled by the frontend or handed to another worker
+                logger.info(f"Dropping job {job['id']}, claim is gone")
+                task.cancel()
+
+        try:
+            result = task.result()
+        except asyncio.CancelledError:
+            return
+        except Exception as e:
+            await asyncio.to_thread(self.broker.fail, job['id'], self.worker_id, str(e))
+            return
+
+        if result:
+            recorded = await asyncio.to_thread(
+                self.broker.complete, job['id'], self.worker_id, result
+            )
+        else:
+            recorded = await asyncio.to_thread(
+                self.broker.fail, job['id'], self.worker_id, "Processing failed"
+            )
+        if not recorded:
+            logger.info(f"Not recording outcome of job {job['id']}, claim is gone")
+
+    async def execute(self, job: Dict):
+        """Call the processor method named by the job"""
+        payload = job['payload']
+        # Stands in for the frontend's scheduler job: the journal records its
+        # user and process budgets scale with its cost
+        current_job.set(Job(
+            0,
+            None,
+            payload.get('user_id') or payload['chat_id'],
+            payload['chat_id'],
+            payload.get('cost') or 0,
+            'normal'
+        ))
+        message = BrokerProgress(
+            self.broker,
+            job['id'],
+            payload['chat_id'],
+            payload['message_id']
+        )
+
+        if job['kind'] == 'compress_video':
+            graph = payload.get('graph')
+            return await self.video_processor.compress_video(
+                payload['input_path'],
+                payload['settings'],
+                message,
+                graph=OperationGraph.from_list(graph) if graph else None,
+                # A requeued job resumes the checkpoints of the earlier attempt
+                job_id=job['id']
+            )
+        if job['kind'] == 'compress_ladder':
+            return await self.video_processor.compress_ladder(
+                payload['input_path'],
+                payload['settings'],
+                message,
+                resolutions=payload.get('resolutions'),
+                packaging=payload.get('packaging')
+            )
+        raise Exception(f"Unknown job kind {job['kind']}")
+
+
+async def main():
+    Path(Config.TEMP_DIR).mkdir(parents=True, exist_ok=True)
+    broker = create_broker()
+    if broker is None:
+        raise SystemExit("Set BROKER_BACKEND to 'sqlite' or 'socket' to run workers")
+    # Several workers on one host need a METRICS_PORT each
+    metrics_server = MetricsServer() if Config.METRICS_PORT else None
+    try:
+        if metrics_server:
+            await metrics_server.start()
+        await EncodeWorker(broker).run()
+    finally:
+        if metrics_server:
+            await metrics_server.stop()
+        broker.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())